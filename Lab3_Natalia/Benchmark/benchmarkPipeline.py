@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import argparse
+import contextlib
+import gc
+import io
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+"""
+Benchmark suite of the pipeline stages. For every case (number of points x number of RI columns)
+SyntheticSpectra generates SMS-like spectra, and the wall time (median and best of `repeat` runs) and the
+peak memory (tracemalloc, measured in a separate run so it does not distort the time) of each stage are
+recorded: Preprocessing.pre_Data_1104, AnalyzeSpectrum.landslide, Sensitivity.gradient, AnalyzeCovariance,
+FindPeaks (batch detection and analysis) and StaticalAnalysis. The covariance is skipped for more than
+MAX_COVARIANCE_SPECTRA spectra (10k RI would need a 20000 x 20000 matrix, about 3.2 GB).
+The results are saved as JSON; when a baseline JSON is given, every stage whose median time or peak memory
+exceeds the baseline by more than the tolerance (and, for the time, by more than min_seconds) is flagged as
+a regression (and the exit code is 1). Re-running the same code varies by up to about 40% on the short stages,
+hence the default tolerance of 50%.
+
+Run from Lab3_Natalia:
+    python Benchmark/benchmarkPipeline.py --preset quick
+    python Benchmark/benchmarkPipeline.py --cases 100000x6 1000x1000 --baseline Benchmark/results/baseline.json
+"""
+
+# Project root directory
+project_root = Path(__file__).resolve().parents[1]  # O(1)
+sys.path.append(str(project_root))  # O(1)
+
+from Source.preprocessing.preprocessing_Data import Preprocessing
+from Source.preprocessing.syntheticData import SyntheticSpectra
+from Source.analysis.spectrumAnalyze import SpectrumBatch, AnalyzeSpectrum, Sensitivity, AnalyzeCovariance
+from Source.analysis.featuresANDstaticalanalyze import BatchFindPeaks, StaticalAnalysis
+
+# (number of points, number of RI columns); each RI gives a 125 µm and a 25 µm spectrum
+PRESETS = {
+    'quick': [(1_000, 6), (10_000, 6), (1_000, 100)],
+    'full': [(1_000, 6), (100_000, 6), (1_000_000, 6), (10_000_000, 6),
+             (1_000, 100), (1_000, 1_000), (1_000, 10_000), (100_000, 100)],
+}
+
+# Largest number of spectra of the covariance stage (a 2000 x 2000 matrix is 32 MB)
+MAX_COVARIANCE_SPECTRA = 2_000
+
+
+def measure(func, repeat=1):
+    # Median and best wall time of `repeat` runs, then the peak memory of one more run
+    times = []  # O(1)
+    for _ in range(repeat):  # O(r)
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    gc.collect()  # O(1)
+    tracemalloc.start()  # O(1)
+    func()
+    peak = tracemalloc.get_traced_memory()[1]  # O(1)
+    tracemalloc.stop()  # O(1)
+    return float(np.median(times)), min(times), peak  # O(r)
+
+
+def run_case(n_points, n_RI, repeat, workdir):
+    generator = SyntheticSpectra(n_points=n_points, n_RI=n_RI)  # O(1)
+    unetching, etching = generator.columns()  # O(m)
+    RI = [f'{ri:.6f}' for ri in generator.RI_values()]  # O(m)
+    raw_path = generator.toCSV(Path(workdir) / f'raw_{n_points}x{n_RI}.csv')  # O(n·m)
+
+    preprocessor = Preprocessing()  # O(1)
+    preprocessor.unetching, preprocessor.etching = unetching, etching  # O(1)
+    processed_path = Path(workdir) / 'processed.csv'  # O(1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        Data = preprocessor.pre_Data_1104(raw_path, processed_path)  # O(n·m)
+    spectra = SpectrumBatch.fromDataFrame(Data, unetching, etching, RI)  # O(n·m)
+    result_landslide = AnalyzeSpectrum(spectra).landslide()  # O(n·m)
+    columns = [col for pair in zip(unetching, etching) for col in pair]  # O(m)
+    peaks = BatchFindPeaks.fromDataFrame(Data, columns, np.repeat(RI, 2), ["125 µm", "25 µm"] * n_RI)  # O(n·m)
+    features = peaks.detectPeaks().analyzePeaks()  # O(n·m)
+
+    def statistics():
+        stats = StaticalAnalysis(features, result_save=Path(workdir) / 'tables')
+        stats.summary_statistics()
+        stats.shapiro_test()
+        stats.ANOVA_Test()
+        stats.Wilcoxon_test()
+
+    def preprocessing():
+        with contextlib.redirect_stdout(io.StringIO()):
+            preprocessor.pre_Data_1104(raw_path, processed_path)
+
+    stages = {
+        'Preprocessing.pre_Data_1104': preprocessing,
+        'AnalyzeSpectrum.landslide': lambda: AnalyzeSpectrum(spectra).landslide(),
+        'Sensitivity.gradient': lambda: Sensitivity(spectra).gradient(result_landslide=result_landslide),
+        'AnalyzeCovariance': lambda: AnalyzeCovariance(Data, unetching, etching).fullCov(),
+        'FindPeaks': lambda: BatchFindPeaks.fromDataFrame(Data, columns, np.repeat(RI, 2), ["125 µm", "25 µm"] * n_RI).detectPeaks().analyzePeaks(),
+        'StaticalAnalysis': statistics,
+    }  # O(1)
+
+    if 2 * n_RI > MAX_COVARIANCE_SPECTRA:  # O(1)
+        del stages['AnalyzeCovariance']
+        print(f'{"AnalyzeCovariance":<30} {n_points:>10} points {2 * n_RI:>6} spectra  skipped (more than {MAX_COVARIANCE_SPECTRA} spectra)')
+
+    results = []  # O(1)
+    for stage, func in stages.items():  # O(s)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            seconds, best, peak = measure(func, repeat)
+        results.append({'stage': stage, 'n_points': n_points, 'n_spectra': 2 * n_RI,
+                        'seconds': seconds, 'best_seconds': best, 'peak_memory_bytes': peak})
+        print(f'{stage:<30} {n_points:>10} points {2 * n_RI:>6} spectra  {seconds:10.4f} s  {peak / 2**20:10.1f} MiB')
+    raw_path.unlink()  # O(1)
+    return results  # O(1)
+
+
+def compare(results, baseline, tolerance=0.5, min_seconds=0.02):
+    # Join with the baseline by stage and case and flag the slower or heavier stages (median times)
+    current = pd.DataFrame(results)  # O(k)
+    reference = pd.DataFrame(baseline['results'])  # O(k)
+    table = current.merge(reference, on=['stage', 'n_points', 'n_spectra'], suffixes=('', '_baseline'))  # O(k log k)
+    table['time ratio'] = table['seconds'] / table['seconds_baseline']  # O(k)
+    table['memory ratio'] = table['peak_memory_bytes'] / table['peak_memory_bytes_baseline'].replace(0, np.nan)  # O(k)
+    slower = (table['time ratio'] > 1 + tolerance) & (table['seconds'] - table['seconds_baseline'] > min_seconds)  # O(k)
+    heavier = table['memory ratio'] > 1 + tolerance  # O(k)
+    table['regression'] = np.where(slower & heavier, 'time+memory', np.where(slower, 'time', np.where(heavier, 'memory', '')))  # O(k)
+    return table  # O(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and peak memory of every pipeline stage on synthetic spectra")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--cases', nargs='+', help="Cases as POINTSxRI, e.g. 100000x6 (overrides --preset)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', type=Path, default=Path("Benchmark") / "results" / "pipeline.json")
+    parser.add_argument('--baseline', type=Path, help="Previous JSON output to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="Allowed relative increase before flagging a regression")
+    parser.add_argument('--min-seconds', type=float, default=0.02, help="Smallest time increase flagged as a regression")
+    args = parser.parse_args()
+
+    cases = [tuple(int(v) for v in case.lower().split('x')) for case in args.cases] if args.cases else PRESETS[args.preset]  # O(c)
+    results = []  # O(1)
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_points, n_RI in cases:  # O(c)
+            results.extend(run_case(n_points, n_RI, args.repeat, workdir))
+
+    report = {'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                              'machine': platform.machine(), 'system': platform.system()},
+              'results': results}  # O(k)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2), encoding='utf-8')  # O(k)
+    print(f'Results saved: {args.output}')  # O(1)
+
+    if args.baseline is not None:  # O(1)
+        table = compare(results, json.loads(args.baseline.read_text(encoding='utf-8')), args.tolerance, args.min_seconds)  # O(k)
+        print(table[['stage', 'n_points', 'n_spectra', 'seconds', 'seconds_baseline', 'time ratio', 'memory ratio', 'regression']].to_string(index=False))
+        if (table['regression'] != '').any():  # O(k)
+            print('Regressions found')
+            sys.exit(1)
+        print('No regressions')
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import argparse
+import json
+import platform
+import subprocess
+import sys
+
+"""
+Benchmark of the start-up latency of the package. Every module of Source (and the compute-only chain,
+which runs the analysis of a small synthetic sweep without figures) is imported in a fresh interpreter,
+`repeat` times, and the best time is kept together with the heavy libraries it loaded (scipy,
+matplotlib, seaborn). pandas is measured too, as the floor shared by every module.
+The results are saved as JSON; when a baseline JSON is given, every case slower than the baseline by
+more than the tolerance, or loading a heavy library the baseline did not load, is flagged as a
+regression (and the exit code is 1).
+
+Run from Lab3_Natalia:
+    python Benchmark/importTime.py
+    python Benchmark/importTime.py --baseline Benchmark/results/import_baseline.json
+"""
+
+# Project root directory
+project_root = Path(__file__).resolve().parents[1]  # O(1)
+
+HEAVY = ['scipy', 'matplotlib', 'seaborn']  # O(1)
+
+# Case -> code run in the fresh interpreter
+CASES = {
+    'pandas': 'import pandas',
+    'Source.preprocessing.preprocessing_Data': 'import Source.preprocessing.preprocessing_Data',
+    'Source.analysis.spectrumAnalyze': 'import Source.analysis.spectrumAnalyze',
+    'Source.analysis.featuresANDstaticalanalyze': 'import Source.analysis.featuresANDstaticalanalyze',
+    'Source.analysis.analysisSession': 'import Source.analysis.analysisSession',
+    'Source.pipeline.batchRunner': 'import Source.pipeline.batchRunner',
+    'Source.pipeline.parameterSweep': 'import Source.pipeline.parameterSweep',
+    'Source.pipeline.realTime': 'import Source.pipeline.realTime',
+    'Source.visualization.Visualization2': 'import Source.visualization.Visualization2',
+    'compute-only landslide': (
+        'from Source.preprocessing.syntheticData import SyntheticSpectra\n'
+        'from Source.analysis.analysisSession import AnalysisSession\n'
+        'from Source.visualization.Visualization2 import Visualizer\n'
+        'import tempfile\n'
+        'generator = SyntheticSpectra(n_points=1000)\n'
+        'unetching, etching = generator.columns()\n'
+        'session = AnalysisSession(generator.toDataFrame(), unetching, etching, generator.RI_values())\n'
+        'session.sensitivity\n'
+        'Visualizer(tempfile.mkdtemp(), tempfile.mkdtemp(), figures=False).plotLandslide(None, unetching, etching, [], result_landslide=session.landslide)'),
+}
+
+# Runs the case and prints the elapsed time and the heavy libraries loaded
+TEMPLATE = '''
+import sys, time, json
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+exec(compile({code!r}, '<case>', 'exec'))
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+
+def measure(code, repeat=5):
+    # Best time of `repeat` fresh interpreters
+    seconds, loaded = np.inf, []  # O(1)
+    script = TEMPLATE.format(root=str(project_root), code=code, heavy=HEAVY)  # O(1)
+    for _ in range(repeat):  # O(r)
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True, cwd=project_root)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        seconds, loaded = min(seconds, result['seconds']), result['loaded']
+    return seconds, loaded  # O(1)
+
+
+def compare(results, baseline, tolerance=0.2, min_seconds=0.1):
+    # Join with the baseline by case and flag the slower cases and the new heavy imports
+    current = pd.DataFrame(results)  # O(k)
+    reference = pd.DataFrame(baseline['results'])  # O(k)
+    table = current.merge(reference, on='case', suffixes=('', '_baseline'))  # O(k log k)
+    table['time ratio'] = table['seconds'] / table['seconds_baseline']  # O(k)
+    slower = (table['time ratio'] > 1 + tolerance) & (table['seconds'] - table['seconds_baseline'] > min_seconds)  # O(k)
+    heavier = np.array([bool(set(now) - set(before)) for now, before in zip(table['loaded'], table['loaded_baseline'])])  # O(k)
+    table['regression'] = np.where(slower & heavier, 'time+imports', np.where(slower, 'time', np.where(heavier, 'imports', '')))  # O(k)
+    return table  # O(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time of the modules of Source in fresh interpreters")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', type=Path, default=Path("Benchmark") / "results" / "import_time.json")
+    parser.add_argument('--baseline', type=Path, help="Previous JSON output to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative increase before flagging a regression")
+    args = parser.parse_args()
+
+    results = []  # O(1)
+    for case, code in CASES.items():  # O(c)
+        seconds, loaded = measure(code, args.repeat)
+        results.append({'case': case, 'seconds': seconds, 'loaded': loaded})
+        print(f'{case:<45} {seconds * 1000:10.1f} ms  {", ".join(loaded) or "-"}')
+
+    report = {'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                              'machine': platform.machine(), 'system': platform.system()},
+              'results': results}  # O(c)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2), encoding='utf-8')  # O(c)
+    print(f'Results saved: {args.output}')  # O(1)
+
+    if args.baseline is not None:  # O(1)
+        table = compare(results, json.loads(args.baseline.read_text(encoding='utf-8')), args.tolerance)  # O(c)
+        print(table[['case', 'seconds', 'seconds_baseline', 'time ratio', 'loaded', 'regression']].to_string(index=False))
+        if (table['regression'] != '').any():  # O(c)
+            print('Regressions found')
+            sys.exit(1)
+        print('No regressions')
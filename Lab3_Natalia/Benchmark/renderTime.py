@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import argparse
+import sys
+import tempfile
+import time
+
+"""
+Benchmark of the time spent drawing the spectra figures against the length of the spectra. Synthetic
+SMS-like sweeps (Source/preprocessing/syntheticData.py) of increasing length are drawn with
+plot_transmission_spectra and plot_relevant_peaks, once with every sample (max_points=None) and once
+with every decimation method of Source/visualization/decimation.py. With decimation the drawing time
+should stay roughly constant; the time of the decimation itself is included.
+
+Run from Lab3_Natalia:  python Benchmark/renderTime.py
+"""
+
+# Project root directory
+project_root = Path(__file__).resolve().parents[1]  # O(1)
+sys.path.append(str(project_root))  # O(1)
+
+import matplotlib
+matplotlib.use('Agg')  # O(1)
+
+from Source.preprocessing.syntheticData import SyntheticSpectra
+from Source.analysis.featuresANDstaticalanalyze import BatchFindPeaks
+from Source.visualization.Visualization2 import Visualizer
+
+COLORS = ['b', 'g', 'r', 'c', 'm', 'y', 'k', 'orange', 'gray', 'maroon']  # O(1)
+
+
+def run(points, max_points=4000, methods=('minmax', 'lttb'), full_limit=10**6):
+    rows = []  # O(1)
+    folder = tempfile.mkdtemp()  # O(1)
+    for n_points in points:  # O(s·n)
+        generator = SyntheticSpectra(n_points=n_points)
+        unetching, etching = generator.columns()
+        RI = [str(ri) for ri in generator.RI_values()]
+        Data = generator.toDataFrame()
+        columns = [col for pair in zip(unetching, etching) for col in pair]
+        # Peaks detected with a distance of about one resonance width, whatever the length
+        distance = max(1, int(generator.width / (generator.max_wavelength - generator.min_wavelength) * n_points))
+        peaks = BatchFindPeaks.fromDataFrame(Data, columns, np.repeat(RI, 2), ["125 µm", "25 µm"] * len(RI)).detectPeaks(None, distance).analyzePeaks()
+        settings = [('all samples', None)] if n_points <= full_limit else []
+        for label, method in settings + [(method, method) for method in methods]:
+            visualizer = Visualizer(folder, folder, max_points=None if method is None else max_points, decimation=method or 'minmax')
+            for name, plot in (('spectra', lambda: visualizer.plot_transmission_spectra(Data, unetching, etching, RI, COLORS)),
+                               ('relevant peaks', lambda: visualizer.plot_relevant_peaks(Data, RI, unetching, etching, COLORS, relevant_peak_data=peaks))):
+                start = time.perf_counter()
+                plot()
+                rows.append({'Points': n_points, 'Figure': name, 'Mode': label, 'Seconds': time.perf_counter() - start})
+    return pd.DataFrame(rows)  # O(s)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drawing time of the spectra figures with and without decimation")
+    parser.add_argument('--points', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--max-points', type=int, default=4000)
+    parser.add_argument('--full-limit', type=int, default=1_000_000, help="Longest spectra also drawn with every sample")
+    parser.add_argument('--output', type=Path, default=Path("Benchmark") / "results" / "render_time.csv")
+    args = parser.parse_args()
+
+    results = run(args.points, args.max_points, full_limit=args.full_limit)  # O(s·n)
+    print(results.pivot_table(index=['Figure', 'Points'], columns='Mode', values='Seconds'))  # O(s)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(args.output, index=False)  # O(s)
+    print(f'Results saved: {args.output}')  # O(1)
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import argparse
+import sys
+
+"""
+Benchmark of the accuracy of subsampleMinimum against the step of the wavelength grid. 
+Synthetic SMS-like resonances (Lorentzian dips in dB, with optional noise) are placed at random 
+positions between samples; the minimum is then located with every mode and the error against the 
+true resonance wavelength is measured. It shows which grid step each mode needs for a given accuracy, 
+i.e. how much coarser (and cheaper) a simulation can be when the minimum is refined.
+
+Run from Lab3_Natalia:  python Benchmark/subsampleAccuracy.py
+"""
+
+# Project root directory 
+project_root = Path(__file__).resolve().parents[1]  # O(1)
+sys.path.append(str(project_root))  # O(1)
+
+from Source.analysis.spectrumAnalyze import subsampleMinimum
+
+MODES = ['grid', 'parabolic', 'gaussian', 'centroid']  # O(1)
+
+
+def synthetic_dips(Wavelength, centres, width=0.004, depth=4.0, noise=0.0, rng=None):
+    # One Lorentzian dip in dB per row, centred at `centres`
+    rng = np.random.default_rng(0) if rng is None else rng  # O(1)
+    shape = 1 / (1 + ((Wavelength[None, :] - centres[:, None]) / (width / 2)) ** 2)  # O(n·m)
+    Transmission = -depth * shape  # O(n·m)
+    if noise > 0:  # O(1)
+        Transmission = Transmission + rng.normal(0, noise, Transmission.shape)  # O(n·m)
+    return Transmission  # O(1)
+
+
+def run(steps, n_spectra=2000, noise=0.0, seed=0):
+    rng = np.random.default_rng(seed)  # O(1)
+    rows = []  # O(1)
+    for step in steps:  # O(s)
+        Wavelength = np.arange(1.16, 1.23 + step / 2, step)  # O(n)
+        centres = rng.uniform(1.18, 1.21, n_spectra)  # O(m)
+        Transmission = synthetic_dips(Wavelength, centres, noise=noise, rng=rng)  # O(n·m)
+        index = np.argmin(Transmission, axis=1)  # O(n·m)
+        for mode in MODES:  # O(1)
+            error = np.abs(subsampleMinimum(Wavelength, Transmission, index, mode) - centres)  # O(m)
+            rows.append({'Grid step (µm)': step, 'Points': len(Wavelength), 'Noise (dB)': noise, 'Mode': mode,
+                         'Mean error (µm)': error.mean(), 'Max error (µm)': error.max(),
+                         'Error / step': error.mean() / step})  # O(1)
+    return pd.DataFrame(rows)  # O(s)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy of the sub-grid minimum estimators against the grid step")
+    parser.add_argument('--steps', type=float, nargs='+', default=[0.0001, 0.0003, 0.0006, 0.0012, 0.0024])
+    parser.add_argument('--spectra', type=int, default=2000)
+    parser.add_argument('--noise', type=float, default=0.0)
+    parser.add_argument('--output', type=Path, default=Path("Benchmark") / "results" / "subsample_accuracy.csv")
+    args = parser.parse_args()
+
+    results = run(args.steps, n_spectra=args.spectra, noise=args.noise)  # O(s·n·m)
+    print(results.pivot(index='Grid step (µm)', columns='Mode', values='Mean error (µm)'))  # O(1)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(args.output, index=False)  # O(s)
+    print(f'Results saved: {args.output}')  # O(1)
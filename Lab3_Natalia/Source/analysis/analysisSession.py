@@ -0,0 +1,69 @@
+import numpy as np
+from functools import cached_property
+
+from Source.analysis.spectrumAnalyze import SpectrumBatch, AnalyzeSpectrum, Sensitivity, AnalyzeCovariance
+from Source.analysis.featuresANDstaticalanalyze import BatchFindPeaks
+
+
+"""
+The AnalysisSession class groups the processed data of one sweep with the quantities derived from it:
+landslide of the first minimum, sensitivity, covariance matrices and relevant peaks. Each quantity is
+computed the first time it is requested and then shared, so the printed results, the tables and the
+figures of a report all use the same computation (the sensitivity reuses the landslide instead of
+searching the minima again). If a ResultCache is given, the stages are also looked up on disk. peak_parameters (e.g. the ones chosen
+by Preprocessing.denoise) are passed to the peak detection, feature_parameters (top, rel_height) to the selection of
+the relevant peaks, and interval is the wavelength range (µm) where the first minimum is searched.
+The number of times each stage was computed (not found in the cache) is kept in `computations`.
+"""
+
+class AnalysisSession:
+    def __init__(self, Data, unetching, etching, RI_values, cache=None, peak_parameters=None,
+                 feature_parameters=None, interval=(1.16, 1.23)):
+        self.Data = Data  # O(1)
+        self.unetching = list(unetching)  # O(1)
+        self.etching = list(etching)  # O(1)
+        self.RI_values = list(RI_values)  # O(1)
+        self.cache = cache  # O(1)
+        self.peak_parameters = dict(peak_parameters or {})  # threshold, distance and prominence of find_peaks  # O(1)
+        self.feature_parameters = dict(feature_parameters or {})  # top and rel_height of analyzePeaks  # O(1)
+        self.interval = tuple(interval)  # O(1)
+        self.computations = {}  # Stage -> number of computations  # O(1)
+
+    def _run(self, name, func, *args, **kwargs):
+        # Only the misses of the cache are counted as computations
+        if self.cache is None:  # O(1)
+            self.computations[name] = self.computations.get(name, 0) + 1
+            return func(*args, **kwargs)
+        misses = self.cache.stats.get(func.__qualname__, [0, 0])[1]  # O(1)
+        result = self.cache.call(func, *args, **kwargs)  # O(n)
+        computed = self.cache.stats[func.__qualname__][1] - misses  # O(1)
+        self.computations[name] = self.computations.get(name, 0) + computed  # O(1)
+        return result  # O(1)
+
+    @cached_property
+    def spectra(self):
+        return SpectrumBatch.fromDataFrame(self.Data, self.unetching, self.etching, self.RI_values)  # O(n)
+
+    @cached_property
+    def landslide(self):
+        return self._run('landslide', AnalyzeSpectrum(self.spectra).landslide, interval=self.interval)  # O(n)
+
+    @cached_property
+    def sensitivity(self):
+        return self._run('sensitivity', Sensitivity(self.spectra).gradient, result_landslide=self.landslide)  # O(m)
+
+    @cached_property
+    def covariance(self):
+        analyzerCovariance = AnalyzeCovariance(self.Data, self.unetching, self.etching)  # O(1)
+        return {'unetching': self._run('unetchingCov', analyzerCovariance.unetchingCov),
+                'etching': self._run('etchingCov', analyzerCovariance.etchingCov),
+                'RI': self._run('RICov', analyzerCovariance.RICov)}  # O(n²)
+
+    @cached_property
+    def relevant_peaks(self):
+        # 125 µm and 25 µm columns alternated for each RI, the same order used in the report
+        columns = [col for pair in zip(self.unetching, self.etching) for col in pair]  # O(m)
+        analyzer = BatchFindPeaks.fromDataFrame(self.Data, columns, np.repeat(self.RI_values, 2), ["125 µm", "25 µm"] * len(self.RI_values))  # O(n)
+        return self._run('relevant_peaks', analyzer.relevantPeaks, self.peak_parameters, **self.feature_parameters)  # O(n)
+
+    # This code has a computational time complexity of O(n²)
@@ -1,9 +1,15 @@
 import numpy as np
 import pandas as pd
-from scipy.signal import find_peaks, peak_prominences, peak_widths
-from scipy.stats import f_oneway, shapiro, wilcoxon, pearsonr
 from pathlib import Path
 
+from Source.analysis.spectrumAnalyze import subsampleMinimum
+from Source.analysis.resampling import Resampling
+from Source.analysis.peakFeatureStore import PeakFeatureStore
+from Source.utils.stageProfiler import PROFILER
+
+
+# scipy is imported by the methods that use it, so importing this module (e.g. only for the
+# preprocessing or the landslide) does not pay the start-up time of scipy.signal and scipy.stats
 
 """
 The FindPeaks class allows detecting and analysing relevant peaks in transmission spectra. 
@@ -30,24 +36,30 @@ class FindPeaks:
         self.peak_prominences = []  # Store most prominent peaks   # O(1)
         self.Peak_Data = []  # Save the most relevant peaks  # O(1)
 
-    def detectPeaks(self):
-        # Find peaks
-        peaks, _ = find_peaks(-self.Transmission, threshold=0.0001, distance=50)  # O(n)
+    @PROFILER.stage()
+    def detectPeaks(self, threshold=0.0001, distance=50, prominence=None):
+        from scipy.signal import find_peaks
+        # Find peaks; the parameters can be chosen from the noise by Preprocessing.denoise
+        peaks, _ = find_peaks(-self.Transmission, threshold=threshold, distance=distance, prominence=prominence)  # O(n)
         self.peaks = peaks  # O(1)
         self.Peak_Wavelengths = self.Wavelength[self.peaks]  # O(n)
         self.Peak_Transmissions = self.Transmission[self.peaks]  # O(n)
 
         return self  # O(1)
 
-    def analyzePeaks(self):
+    @PROFILER.stage()
+    def analyzePeaks(self, store=None, top=3, rel_height=0.5):
+        from scipy.signal import peak_prominences, peak_widths
+        # store: PeakFeatureStore that also receives the relevant peaks as one block
+        # top: number of relevant peaks kept; rel_height: height (relative to the prominence) where the width is measured
 
         wavelength_step = np.mean(np.diff(self.Wavelength))  # O(n)
         # Calculate prominences and spectral widths for the peaks
         prominences = peak_prominences(-self.Transmission, self.peaks)[0]  # O(n)
-        spectral_widths = peak_widths(-self.Transmission, self.peaks, rel_height=0.5)[0] * wavelength_step  # O(n)
+        spectral_widths = peak_widths(-self.Transmission, self.peaks, rel_height=rel_height)[0] * wavelength_step  # O(n)
 
         # Calculate a score based on prominence to spectral width ratio
-        relevant_peak = np.argsort(prominences / spectral_widths)[-min(3, len(prominences)):][::-1]  # O(n)
+        relevant_peak = np.argsort(prominences / spectral_widths)[::-1][:top]  # O(n)
 
         # Save the most relevant peaks
         for i in relevant_peak:  # O(1)
@@ -58,18 +70,104 @@ class FindPeaks:
                 'Transmission': float(self.Peak_Transmissions[i]),
                 'Spectral width': float(spectral_widths[i]),
                 'Prominence': float(prominences[i])})  # O(1)
-            
-        Features_Data = pd.DataFrame(self.Peak_Data)  ## O(n)
-        
+
+        if store is not None:  # O(1)
+            store.append(self.MMFDiameter, self.RI, self.Peak_Wavelengths[relevant_peak], self.Peak_Transmissions[relevant_peak],
+                         spectral_widths[relevant_peak], prominences[relevant_peak])  # O(1)
+
         return self.Peak_Data  # O(1)
 
 
+"""
+The BatchFindPeaks class applies the FindPeaks analysis to many spectra that share a wavelength axis. 
+The transmissions are stored as one (n_spectra x n_points) matrix. Minima are detected in every spectrum, 
+then the prominences and spectral widths of all the peaks are computed in a single call over the spectra 
+joined end to end (separated by an infinite wall, so no search crosses from one spectrum to the next). 
+The most relevant peaks of every spectrum are selected at once and appended as one block to a 
+PeakFeatureStore (a new one, or one shared by several batches), which is returned as a DataFrame with 
+the same fields as FindPeaks.Peak_Data.
+"""
+
+class BatchFindPeaks:
+    def __init__(self, Wavelength, Transmission, RI, MMFDiameter):
+        self.Wavelength = np.asarray(Wavelength, dtype=float)  # O(n)
+        self.Transmission = np.ascontiguousarray(np.atleast_2d(Transmission), dtype=float)  # O(n·m)
+        n_spectra = self.Transmission.shape[0]  # O(1)
+        if self.Transmission.shape[1] != len(self.Wavelength):  # O(1)
+            raise ValueError("Transmission must have shape (number of spectra, number of wavelengths)")
+        # One RI and one diameter per spectrum, a single value is shared by all of them
+        self.RI = np.broadcast_to(np.asarray(RI, dtype=object), (n_spectra,))  # O(m)
+        self.MMFDiameter = np.broadcast_to(np.asarray(MMFDiameter, dtype=object), (n_spectra,))  # O(m)
+        # Peaks of all the spectra: index of the spectrum and position in the spectrum
+        self.spectrum_index = np.empty(0, dtype=np.intp)  # O(1)
+        self.peaks = np.empty(0, dtype=np.intp)  # O(1)
+
+    @classmethod
+    def fromDataFrame(cls, Data, columns, RI, MMFDiameter, col='Wavelength'):
+        Transmission = Data[list(columns)].to_numpy(dtype=float).T  # O(n·m)
+        return cls(Data[col], Transmission, RI, MMFDiameter)  # O(n·m)
+
+    @PROFILER.stage()
+    def detectPeaks(self, threshold=0.0001, distance=50, prominence=None):
+        from scipy.signal import find_peaks
+        # The parameters can be chosen from the noise by Preprocessing.denoise (peak_parameters)
+        peaks = [find_peaks(-Transmission, threshold=threshold, distance=distance, prominence=prominence)[0]
+                 for Transmission in self.Transmission]  # O(n·m)
+        self.spectrum_index = np.repeat(np.arange(len(peaks)), [len(p) for p in peaks])  # O(m)
+        self.peaks = np.concatenate(peaks) if peaks else np.empty(0, dtype=np.intp)  # O(m)
+
+        return self  # O(1)
+
+    @PROFILER.stage()
+    def analyzePeaks(self, top=3, mode='grid', store=None, rel_height=0.5):
+        from scipy.signal import peak_prominences, peak_widths
+        # mode: 'grid' keeps the wavelength of the sample, the other modes refine it (see subsampleMinimum)
+        # store: PeakFeatureStore receiving the peaks, e.g. to gather several batches; a new one by default
+        # rel_height: height, relative to the prominence, where the spectral width is measured
+        n_spectra, n_points = self.Transmission.shape  # O(1)
+        wavelength_step = np.mean(np.diff(self.Wavelength))  # O(n)
+
+        # Join the spectra end to end with an infinite wall between them
+        signal = np.full((n_spectra, n_points + 1), np.inf)  # O(n·m)
+        signal[:, :n_points] = -self.Transmission  # O(n·m)
+        signal = signal.ravel()  # O(1)
+        positions = self.spectrum_index * (n_points + 1) + self.peaks  # O(p)
+
+        # Prominences and spectral widths of every peak in one pass
+        prominences = peak_prominences(signal, positions)[0]  # O(n·m)
+        spectral_widths = peak_widths(signal, positions, rel_height=rel_height)[0] * wavelength_step  # O(n·m)
+        score = prominences / spectral_widths  # O(p)
+
+        # Sort by spectrum, then by descending score, and keep the first `top` peaks of each spectrum
+        order = np.lexsort((-score, self.spectrum_index))  # O(p log p)
+        spectrum_sorted = self.spectrum_index[order]  # O(p)
+        first = np.searchsorted(spectrum_sorted, spectrum_sorted, side='left')  # O(p log p)
+        relevant_peak = order[np.arange(len(order)) - first < top]  # O(p)
+
+        self.relevant_spectrum = self.spectrum_index[relevant_peak]  # O(p)
+        relevant_position = self.peaks[relevant_peak]  # O(p)
+        self.store = store if store is not None else PeakFeatureStore(len(relevant_peak))  # O(p)
+        self.store.append(self.MMFDiameter[self.relevant_spectrum], self.RI[self.relevant_spectrum],
+                          subsampleMinimum(self.Wavelength, self.Transmission, relevant_position, mode, rows=self.relevant_spectrum),
+                          self.Transmission[self.relevant_spectrum, relevant_position],
+                          spectral_widths[relevant_peak], prominences[relevant_peak])  # O(p log p)
+        self.Peak_Data = self.store.to_frame()  # O(p)
+
+        return self.Peak_Data  # O(1)
+
+    def relevantPeaks(self, peak_parameters=None, **feature_parameters):
+        # Detection and selection in one call, so a cached result (ResultCache) also skips the detection
+        return self.detectPeaks(**(peak_parameters or {})).analyzePeaks(**feature_parameters)  # O(n·m)
+
+
 """
 The StaticalAnalysis class performs statistical analysis on the features extracted from the peaks. 
 It includes summary statistics (mean, median, variance, extreme values) using summary_statistics. 
 It also allows to assess the normality of the data with Shapiro, and to compare groups using ANOVA and Wilcoxon. 
 The get_paired_data method matches data by refractive index environment, allowing Wilcoxon 
 to be applied comparing specific conditions (e.g. different fibre diameters).
+As there are only a few peaks per diameter, bootstrap_CI and permutation_test give resampling-based
+confidence intervals and p-values (see Resampling) that do not rely on normality.
 """
 
 class StaticalAnalysis:
@@ -79,11 +177,13 @@ class StaticalAnalysis:
         self.result_save.mkdir(parents=True, exist_ok=True)  # O(1)
        
 
+    @PROFILER.stage()
     def summary_statistics(self):
         sumary = self.Data.describe(include='all')  # O(n)
         sumary.to_csv(self.result_save / "summary_statistics.csv")  # O(n)
         return sumary  # O(n)
     
+    @PROFILER.stage()
     def get_paired_data(self, column='Wavelength', diameter1='125 µm', diameter2='25 µm'):
         MMF_125_Wavelength = self.Data[self.Data['MMF Diameter'] == diameter1][['surrounding environment', column]]  # O(n)
         MMF_25_Wavelength = self.Data[self.Data['MMF Diameter'] == diameter2][['surrounding environment', column]]  # O(n)
@@ -95,7 +195,9 @@ class StaticalAnalysis:
         return paired  # O(1)
 
 
+    @PROFILER.stage()
     def shapiro_test(self, column='Wavelength', group_by='MMF Diameter', alpha=0.05):
+        from scipy.stats import shapiro
         results = []  # O(1)
         for Diameter, Shapiro_Data in self.Data.groupby(group_by):  # O(n)
             if len(Shapiro_Data[column]) < 3:  # O(1)
@@ -109,7 +211,9 @@ class StaticalAnalysis:
         Shapiro_results.to_csv(self.result_save / 'Shapiro_results.csv', index=False)  # O(n)
         return Shapiro_results  # O(1)
     
+    @PROFILER.stage()
     def ANOVA_Test(self, column='Wavelength', group_by='MMF Diameter', alpha=0.05): 
+        from scipy.stats import f_oneway
         groups = [group[column].values for _, group in self.Data.groupby(group_by)]  # O(n)
         h_stat, p_value  = f_oneway(*groups)  # O(n)
         ANOVA_results = 'Significant difference' if p_value < alpha else 'No significant difference'  # O(1)
@@ -117,7 +221,9 @@ class StaticalAnalysis:
         ANOVA_Data.to_csv(self.result_save / 'anova_results.csv', index=False)  # O(1)
         return ANOVA_Data  # O(1)
     
+    @PROFILER.stage()
     def Wilcoxon_test(self, Diameter1='125 µm', Diameter2='25 µm', column='Wavelength', alpha=0.05):
+        from scipy.stats import wilcoxon
         paired_data = self.get_paired_data(column=column, diameter1=Diameter1, diameter2=Diameter2)  # O(n)
         if len(paired_data) < 3:  # O(1)
             return pd.DataFrame([{'Error': 'Insufficient paired samples'}])  # O(1)
@@ -131,5 +237,148 @@ class StaticalAnalysis:
             'W': stat, 'p-value': p_value, 'Result': result}])
         Wilcoxon_Data.to_csv(self.result_save / 'Wilcoxon_results.csv', index=False)  # O(1)
         return Wilcoxon_Data  # O(1)
+
+    @PROFILER.stage()
+    def bootstrap_CI(self, columns=('Wavelength', 'Prominence'), group_by='MMF Diameter', statistic='mean',
+                     n_resamples=10_000, confidence=0.95, seed=None, workers=None):
+        # Bootstrap confidence interval of the mean (or median) of the features of every group
+        resampling = Resampling(n_resamples, confidence, seed, workers)  # O(1)
+        Bootstrap_Data = resampling.bootstrap(self.Data, columns, statistic, group_by)  # O(B·n)
+        Bootstrap_Data.to_csv(self.result_save / 'bootstrap_CI.csv', index=False)  # O(k)
+        return Bootstrap_Data  # O(1)
+
+    @PROFILER.stage()
+    def permutation_test(self, columns=('Wavelength', 'Prominence'), Diameter1='125 µm', Diameter2='25 µm',
+                         statistic='mean', alternative='two-sided', n_resamples=10_000, seed=None, workers=None):
+        # Permutation p-value of the difference between the two diameters, without assuming normality
+        resampling = Resampling(n_resamples, seed=seed, workers=workers)  # O(1)
+        Permutation_Data = resampling.permutation_test(self.Data, columns, 'MMF Diameter', (Diameter1, Diameter2),
+                                                       statistic, alternative)  # O(B·n)
+        Permutation_Data.to_csv(self.result_save / 'permutation_results.csv', index=False)  # O(k)
+        return Permutation_Data  # O(1)
     
-        # This code has a computational time complexity of O(n Log n)
\ No newline at end of file
+        # This code has a computational time complexity of O(n Log n)
+
+def adjust_pvalues(p_values, method='holm'):
+    # Multiple-comparison correction of a vector of p-values; NaN values are left out of the family
+    # method: 'holm' (family-wise error), 'fdr_bh' (Benjamini-Hochberg false discovery rate) or 'bonferroni'
+    p_values = np.asarray(p_values, dtype=float)  # O(m)
+    adjusted = np.full(p_values.shape, np.nan)  # O(m)
+    valid = np.flatnonzero(~np.isnan(p_values))  # O(m)
+    m = len(valid)  # O(1)
+    if m == 0:  # O(1)
+        return adjusted
+    order = valid[np.argsort(p_values[valid], kind='stable')]  # O(m log m)
+    ranked = p_values[order]  # O(m)
+    if method == 'holm':  # O(m)
+        ranked = np.maximum.accumulate((m - np.arange(m)) * ranked)
+    elif method == 'fdr_bh':  # O(m)
+        ranked = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+    elif method == 'bonferroni':  # O(m)
+        ranked = ranked * m
+    else:
+        raise ValueError(f"Unknown correction method: {method}")
+    adjusted[order] = np.minimum(ranked, 1)  # O(m)
+    return adjusted  # O(1)
+
+
+"""
+The GroupedStatistics class evaluates several tests for all the features and all the groups of the
+feature table in one pass. The table is sorted once by group and pairing column (surrounding
+environment) and kept as one (n_peaks x n_features) matrix, so every group is a slice of it and every
+test is a single vectorized scipy call over all the features. The groups can be the MMF diameters or
+any combination of columns (e.g. diameter and RI). Tests:
+- 'shapiro': normality of every group.
+- 'anova' and 'kruskal': comparison of all the groups.
+- 'wilcoxon': paired comparison of every pair of groups, pairing the peaks of the same surrounding
+  environment (as get_paired_data).
+- 'mannwhitney': unpaired comparison of every pair of groups.
+The p-values of each test are corrected for multiple comparisons (Holm by default) and everything is
+returned, and written, as one table.
+"""
+
+class GroupedStatistics:
+    def __init__(self, Peak_Features_Data, features=('Wavelength', 'Transmission', 'Spectral width', 'Prominence'),
+                 group_by='MMF Diameter', pair_on='surrounding environment', result_save=None):
+        self.features = list(features)  # O(1)
+        keys = [group_by] if isinstance(group_by, str) else list(group_by)  # O(1)
+        labels = Peak_Features_Data[keys].astype(str).agg(' | '.join, axis=1)  # O(n), one label per group
+        group_codes, groups = pd.factorize(labels, sort=True)  # O(n log n)
+        self.groups = groups.tolist()  # Group labels, sorted  # O(g)
+        pair_codes, _ = pd.factorize(Peak_Features_Data[pair_on].astype(str), sort=True)  # O(n log n)
+
+        # Sort once by group and pairing value; every group is then a contiguous slice
+        order = np.lexsort((pair_codes, group_codes))  # O(n log n)
+        self.values = Peak_Features_Data[self.features].to_numpy(dtype=float)[order]  # O(n·k)
+        self.pair_codes = pair_codes[order]  # O(n)
+        self.bounds = np.searchsorted(group_codes[order], np.arange(len(self.groups) + 1))  # O(g log n)
+        self.result_save = Path(result_save) if result_save is not None else None  # O(1)
+
+    def group(self, i):
+        return self.values[self.bounds[i]:self.bounds[i + 1]]  # O(1), view of the sorted matrix
+
+    def paired(self, i, j):
+        # Rows of groups i and j with the same pairing value (every combination, like the merge of get_paired_data)
+        pair_i = self.pair_codes[self.bounds[i]:self.bounds[i + 1]]  # O(1)
+        pair_j = self.pair_codes[self.bounds[j]:self.bounds[j + 1]]  # O(1)
+        common = np.intersect1d(pair_i, pair_j)  # O(n log n)
+        start_i, end_i = np.searchsorted(pair_i, common), np.searchsorted(pair_i, common, side='right')  # O(c log n)
+        start_j, end_j = np.searchsorted(pair_j, common), np.searchsorted(pair_j, common, side='right')  # O(c log n)
+        rows_i = [np.repeat(np.arange(a, b), d - c) for a, b, c, d in zip(start_i, end_i, start_j, end_j)]  # O(p)
+        rows_j = [np.tile(np.arange(c, d), b - a) for a, b, c, d in zip(start_i, end_i, start_j, end_j)]  # O(p)
+        if not rows_i:  # O(1)
+            return np.empty((0, len(self.features))), np.empty((0, len(self.features)))
+        return self.group(i)[np.concatenate(rows_i)], self.group(j)[np.concatenate(rows_j)]  # O(p·k)
+
+    def _rows(self, test, group1, group2, n, result):
+        # One row per feature of a test result
+        return [{'Test': test, 'Feature': feature, 'Group1': group1, 'Group2': group2, 'n samples': n,
+                 'Statistic': float(statistic), 'p-value': float(p)}
+                for feature, statistic, p in zip(self.features, np.atleast_1d(result[0]), np.atleast_1d(result[1]))]  # O(k)
+
+    @PROFILER.stage()
+    def run(self, tests=('shapiro', 'anova', 'kruskal', 'wilcoxon', 'mannwhitney'), alternative='two-sided',
+            alpha=0.05, correction='holm'):
+        from scipy.stats import shapiro, f_oneway, kruskal, wilcoxon, mannwhitneyu
+        # alternative: 'two-sided', 'greater' or 'less' (Group1 against Group2) for the pairwise tests
+        groups = range(len(self.groups))  # O(1)
+        pairs = [(i, j) for i in groups for j in groups if i < j]  # O(g²)
+        nan = (np.full(len(self.features), np.nan), np.full(len(self.features), np.nan))  # O(k)
+        results = []  # O(1)
+        for test in tests:  # O(t·g²·n·k)
+            if test == 'shapiro':
+                for i in groups:
+                    values = self.group(i)
+                    results += self._rows(test, self.groups[i], '', len(values), shapiro(values, axis=0) if len(values) >= 3 else nan)
+            elif test in ('anova', 'kruskal'):
+                samples = [self.group(i) for i in groups]
+                enough = len(samples) > 1 and all(len(values) > 1 for values in samples)
+                result = (f_oneway if test == 'anova' else kruskal)(*samples, axis=0) if enough else nan
+                results += self._rows(test, 'all', '', len(self.values), result)
+            elif test == 'wilcoxon':
+                for i, j in pairs:
+                    first, second = self.paired(i, j)
+                    result = wilcoxon(first, second, alternative=alternative, axis=0) if len(first) >= 3 else nan
+                    results += self._rows(test, self.groups[i], self.groups[j], len(first), result)
+            elif test == 'mannwhitney':
+                for i, j in pairs:
+                    first, second = self.group(i), self.group(j)
+                    result = mannwhitneyu(first, second, alternative=alternative, axis=0) if len(first) and len(second) else nan
+                    results += self._rows(test, self.groups[i], self.groups[j], len(first) + len(second), result)
+            else:
+                raise ValueError(f"Unknown test: {test}")
+
+        Grouped_Data = pd.DataFrame(results, columns=['Test', 'Feature', 'Group1', 'Group2', 'n samples', 'Statistic', 'p-value'])  # O(r)
+        # Each test is one family of comparisons
+        Grouped_Data['p-adjusted'] = Grouped_Data.groupby('Test', sort=False)['p-value'].transform(lambda p: adjust_pvalues(p, correction))  # O(r log r)
+        Grouped_Data['Correction'] = correction  # O(r)
+        significant = np.where(Grouped_Data['Test'] == 'shapiro', 'Not normal', 'Significant')  # O(r)
+        not_significant = np.where(Grouped_Data['Test'] == 'shapiro', 'Normal', 'Not significant')  # O(r)
+        Grouped_Data['Result'] = np.where(Grouped_Data['p-adjusted'].isna(), 'few samples',
+                                          np.where(Grouped_Data['p-adjusted'] < alpha, significant, not_significant))  # O(r)
+        if self.result_save is not None:  # O(r)
+            self.result_save.mkdir(parents=True, exist_ok=True)
+            Grouped_Data.to_csv(self.result_save / 'grouped_statistics.csv', index=False)
+        return Grouped_Data  # O(1)
+
+    # This code has a computational time complexity of O(t·g²·n·k), t tests, g groups and k features
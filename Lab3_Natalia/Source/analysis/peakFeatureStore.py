@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+
+"""
+The PeakFeatureStore class keeps the features of the relevant peaks as columns instead of one dict per
+peak. The numeric features are float arrays and the MMF diameter and the RI are categorical: every row
+stores a small integer code and the labels are kept once. The arrays are preallocated (reserve, or the
+capacity given) and grow by doubling, so batch detection appends whole arrays of peaks without creating
+Python objects per peak. Filtering by diameter and RI compares the integer codes. The store is written
+to disk in a single binary file (.npz) and exported to CSV or to a DataFrame (with categorical columns)
+only when it is needed.
+"""
+
+class PeakFeatureStore:
+    FEATURES = ['Wavelength', 'Transmission', 'Spectral width', 'Prominence']
+    CATEGORIES = {'MMF Diameter': np.int8, 'surrounding environment': np.int16}  # Column -> dtype of its codes
+
+    def __init__(self, capacity=0):
+        self.size = 0  # O(1)
+        self.columns = {col: np.empty(capacity, dtype=float) for col in self.FEATURES}  # O(c)
+        self.codes = {col: np.empty(capacity, dtype=dtype) for col, dtype in self.CATEGORIES.items()}  # O(c)
+        self.categories = {col: [] for col in self.CATEGORIES}  # Labels of every categorical column  # O(1)
+        self._lookup = {col: {} for col in self.CATEGORIES}  # Label -> code  # O(1)
+
+    def __len__(self):
+        return self.size  # O(1)
+
+    @property
+    def capacity(self):
+        return len(self.columns[self.FEATURES[0]])  # O(1)
+
+    def reserve(self, capacity):
+        # Grow the arrays to hold at least `capacity` peaks, keeping the rows already stored
+        if capacity <= self.capacity:  # O(1)
+            return self
+        for arrays in (self.columns, self.codes):  # O(n)
+            for col, values in arrays.items():
+                grown = np.empty(capacity, dtype=values.dtype)
+                grown[:self.size] = values[:self.size]
+                arrays[col] = grown
+        return self  # O(1)
+
+    def _encode(self, col, labels, n):
+        # Codes of the labels of one categorical column; new labels are added to its categories
+        labels = np.broadcast_to(np.asarray(labels, dtype=object), (n,))  # O(n)
+        unique, inverse = np.unique(labels.astype(str), return_inverse=True)  # O(n log n)
+        lookup = self._lookup[col]  # O(1)
+        for label in unique:  # O(u)
+            if label not in lookup:
+                lookup[label] = len(self.categories[col])
+                self.categories[col].append(label)
+        return np.array([lookup[label] for label in unique], dtype=self.CATEGORIES[col])[inverse]  # O(n)
+
+    def append(self, MMFDiameter, RI, Wavelength, Transmission, SpectralWidth, Prominence):
+        # Append a block of peaks; MMFDiameter and RI can be one label for the whole block
+        Wavelength = np.asarray(Wavelength, dtype=float).ravel()  # O(n)
+        n = len(Wavelength)  # O(1)
+        if self.size + n > self.capacity:  # O(n)
+            self.reserve(max(self.size + n, 2 * self.capacity))
+        rows = slice(self.size, self.size + n)  # O(1)
+        for col, values in zip(self.FEATURES, (Wavelength, Transmission, SpectralWidth, Prominence)):  # O(n)
+            self.columns[col][rows] = values
+        for col, labels in zip(self.CATEGORIES, (MMFDiameter, RI)):  # O(n log n)
+            self.codes[col][rows] = self._encode(col, labels, n)
+        self.size += n  # O(1)
+        return self  # O(1)
+
+    def mask(self, MMFDiameter=None, RI=None):
+        # Rows of the given diameter and/or RI (a label or a list of labels), compared by their codes
+        selected = np.ones(self.size, dtype=bool)  # O(n)
+        for col, labels in zip(self.CATEGORIES, (MMFDiameter, RI)):  # O(n)
+            if labels is None:
+                continue
+            labels = [labels] if np.isscalar(labels) else labels
+            wanted = [self._lookup[col][str(label)] for label in labels if str(label) in self._lookup[col]]
+            selected &= np.isin(self.codes[col][:self.size], wanted)
+        return selected  # O(1)
+
+    def filter(self, MMFDiameter=None, RI=None):
+        # New store with the selected rows; it shares the categories of this one
+        selected = np.flatnonzero(self.mask(MMFDiameter, RI))  # O(n)
+        store = PeakFeatureStore()  # O(1)
+        store.size = len(selected)  # O(1)
+        store.columns = {col: values[selected] for col, values in self.columns.items()}  # O(k)
+        store.codes = {col: codes[selected] for col, codes in self.codes.items()}  # O(k)
+        store.categories = {col: list(labels) for col, labels in self.categories.items()}  # O(u)
+        store._lookup = {col: dict(lookup) for col, lookup in self._lookup.items()}  # O(u)
+        return store  # O(1)
+
+    def column(self, col):
+        # Values of a numeric column (view), or labels of a categorical column
+        if col in self.columns:  # O(1)
+            return self.columns[col][:self.size]
+        return np.asarray(self.categories[col], dtype=object)[self.codes[col][:self.size]]  # O(n)
+
+    def to_frame(self):
+        # Same columns as FindPeaks.Peak_Data, the diameter and the RI as categorical columns
+        Data = {col: pd.Categorical.from_codes(self.codes[col][:self.size], categories=self.categories[col])
+                for col in self.CATEGORIES}  # O(n)
+        Data.update({col: self.columns[col][:self.size] for col in self.FEATURES})  # O(1)
+        return pd.DataFrame(Data)  # O(n)
+
+    @classmethod
+    def fromFrame(cls, Data):
+        store = cls(len(Data))  # O(n)
+        return store.append(*(Data[col].to_numpy() for col in list(cls.CATEGORIES) + cls.FEATURES))  # O(n log n)
+
+    def save(self, path):
+        # Single binary write of every column, the codes and the categories
+        path = Path(path).with_suffix('.npz')  # O(1)
+        path.parent.mkdir(parents=True, exist_ok=True)  # O(1)
+        arrays = {f'feature:{col}': self.columns[col][:self.size] for col in self.FEATURES}  # O(1)
+        arrays.update({f'codes:{col}': self.codes[col][:self.size] for col in self.CATEGORIES})  # O(1)
+        arrays.update({f'categories:{col}': np.asarray(self.categories[col], dtype=str) for col in self.CATEGORIES})  # O(u)
+        np.savez(path, **arrays)  # O(n)
+        return path  # O(1)
+
+    @classmethod
+    def load(cls, path):
+        store = cls()  # O(1)
+        with np.load(Path(path).with_suffix('.npz')) as arrays:  # O(n)
+            store.columns = {col: arrays[f'feature:{col}'] for col in cls.FEATURES}
+            store.codes = {col: arrays[f'codes:{col}'] for col in cls.CATEGORIES}
+            store.categories = {col: arrays[f'categories:{col}'].tolist() for col in cls.CATEGORIES}
+        store._lookup = {col: {label: code for code, label in enumerate(labels)} for col, labels in store.categories.items()}  # O(u)
+        store.size = len(store.columns[cls.FEATURES[0]])  # O(1)
+        return store  # O(1)
+
+    def to_csv(self, path):
+        path = Path(path)  # O(1)
+        path.parent.mkdir(parents=True, exist_ok=True)  # O(1)
+        self.to_frame().to_csv(path, index=False)  # O(n)
+        return path  # O(1)
+
+    # This code has a computational time complexity of O(n log n), n being the number of peaks
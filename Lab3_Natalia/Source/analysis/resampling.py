@@ -0,0 +1,148 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+
+"""
+Resampling statistics. The resamples are drawn as a NumPy index matrix (one row per resample), so
+thousands of resamples of every feature are evaluated with a few array operations instead of a Python
+loop. For the mean, the index matrix is reduced to the number of times each value is drawn (bootstrap)
+or to the membership of the first group (permutation), and all the resampled means are one matrix
+product. The n_resamples are split in chunks of at most max_elements gathered values, which bounds the
+memory; every chunk has its own random stream derived from the seed (SeedSequence.spawn), so the result
+depends only on the seed and not on the number of workers. With workers=k the chunks are computed by a
+pool of k processes (fork; on platforms without fork they are computed in the main process).
+- bootstrap: percentile confidence interval of the mean or the median of every column.
+- permutation_test: p-value of the difference of the mean or the median between two groups, obtained
+  by shuffling the group labels.
+"""
+
+STATISTICS = {'mean': np.mean, 'median': np.median}
+
+
+def _statistic(values, statistic, axis):
+    # statistic: 'mean', 'median' or a function f(values, axis)
+    func = STATISTICS[statistic] if isinstance(statistic, str) else statistic  # O(1)
+    return func(values, axis=axis)  # O(n)
+
+
+def _counts(index, n_values):
+    # Times each value appears in every resample (one row per resample), by a single bincount
+    size = len(index)  # O(1)
+    offsets = (np.arange(size) * n_values)[:, None]  # O(s)
+    return np.bincount((index + offsets).ravel(), minlength=size * n_values).reshape(size, n_values).astype(float)  # O(s·n)
+
+
+def _bootstrap_chunk(values, statistic, size, seed):
+    # values: (n_samples x n_columns); returns the statistic of `size` resamples (size x n_columns)
+    rng = np.random.default_rng(seed)  # O(1)
+    index = rng.integers(0, len(values), size=(size, len(values)))  # O(s·n), one resample per row
+    if statistic == 'mean':  # O(s·n·k)
+        # The means of all the resamples are one matrix product of the counts with the values
+        return _counts(index, len(values)) @ values / len(values)
+    return _statistic(values[index], statistic, axis=1)  # O(s·n·k)
+
+
+def _permutation_chunk(values, n_first, statistic, size, seed):
+    # Difference of the statistic between the first n_first values and the rest, after shuffling the labels
+    rng = np.random.default_rng(seed)  # O(1)
+    if statistic == 'mean':  # O(s·n·k)
+        # The n_first values with the smallest random keys form the first group of every permutation
+        keys = rng.random((size, len(values)))
+        first = (keys < np.partition(keys, n_first, axis=1)[:, n_first, None]).astype(float) @ values  # Sum of the first group
+        return first / n_first - (values.sum(axis=0) - first) / (len(values) - n_first)
+    index = rng.permuted(np.broadcast_to(np.arange(len(values)), (size, len(values))), axis=1)  # O(s·n)
+    resampled = values[index]  # O(s·n·k)
+    return _statistic(resampled[:, :n_first], statistic, axis=1) - _statistic(resampled[:, n_first:], statistic, axis=1)  # O(s·n·k)
+
+
+class Resampling:
+    def __init__(self, n_resamples=10_000, confidence=0.95, seed=None, workers=None, max_elements=2**24):
+        self.n_resamples = n_resamples  # O(1)
+        self.confidence = confidence  # O(1)
+        self.seed = seed  # O(1)
+        if workers is not None and 'fork' not in multiprocessing.get_all_start_methods():  # O(1)
+            workers = None  # O(1)
+        self.workers = workers  # O(1)
+        self.max_elements = max_elements  # Values gathered by one chunk  # O(1)
+
+    def _run(self, func, values, *args):
+        # Split the resamples in chunks, each one with its own random stream, and stack their results
+        values = np.asarray(values, dtype=float)  # O(n·k)
+        chunk = max(1, min(self.n_resamples, self.max_elements // max(1, values.size)))  # O(1)
+        sizes = [min(chunk, self.n_resamples - start) for start in range(0, self.n_resamples, chunk)]  # O(c)
+        seeds = np.random.SeedSequence(self.seed).spawn(len(sizes))  # O(c)
+        if self.workers is None or len(sizes) == 1:  # O(B·n·k)
+            results = [func(values, *args, size, seed) for size, seed in zip(sizes, seeds)]
+        else:  # O(B·n·k / workers)
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                results = list(pool.map(func, *zip(*[(values, *args, size, seed) for size, seed in zip(sizes, seeds)])))
+        return np.concatenate(results)  # O(B·k)
+
+    def bootstrap_distribution(self, values, statistic='mean'):
+        # Statistic of every bootstrap resample of the columns of values (n_resamples x n_columns)
+        values = np.asarray(values, dtype=float)  # O(n·k)
+        values = values.reshape(len(values), -1)  # O(1)
+        return self._run(_bootstrap_chunk, values, statistic)  # O(B·n·k)
+
+    def permutation_distribution(self, first, second, statistic='mean'):
+        # Difference of the statistic between the two groups for every permutation of the labels
+        first = np.asarray(first, dtype=float)  # O(n)
+        second = np.asarray(second, dtype=float)  # O(n)
+        pooled = np.concatenate([first.reshape(len(first), -1), second.reshape(len(second), -1)])  # O(n·k)
+        return self._run(_permutation_chunk, pooled, len(first), statistic)  # O(B·n·k)
+
+    def bootstrap(self, Data, columns, statistic='mean', group_by=None):
+        # Confidence interval of the statistic of every column (of every group); the columns of a
+        # group share the same resamples of its rows
+        columns = list(columns)  # O(k)
+        alpha = (1 - self.confidence) / 2  # O(1)
+        name = statistic if isinstance(statistic, str) else statistic.__name__  # O(1)
+        groups = Data.groupby(group_by, observed=True, sort=True) if group_by is not None else [(None, Data)]  # O(n)
+        results = []  # O(1)
+        for group, group_Data in groups:  # O(g·B·n·k)
+            values = group_Data[columns].dropna().to_numpy(dtype=float)
+            estimate = low = high = np.full(len(columns), np.nan)
+            if len(values) > 1:
+                distribution = self.bootstrap_distribution(values, statistic)
+                estimate = _statistic(values, statistic, axis=0)
+                low, high = np.quantile(distribution, [alpha, 1 - alpha], axis=0)
+            for i, col in enumerate(columns):
+                row = {} if group_by is None else {group_by: group}
+                row.update({'Feature': col, 'Statistic': name, 'n samples': len(values),
+                            'Estimate': estimate[i], 'CI low': low[i], 'CI high': high[i]})
+                results.append(row)
+        Bootstrap_Data = pd.DataFrame(results)  # O(g·k)
+        Bootstrap_Data['Confidence'] = self.confidence  # O(g·k)
+        Bootstrap_Data['Resamples'] = self.n_resamples  # O(g·k)
+        return Bootstrap_Data  # O(1)
+
+    def permutation_test(self, Data, columns, group_by='MMF Diameter', groups=('125 µm', '25 µm'),
+                         statistic='mean', alternative='two-sided'):
+        # p-value of the difference groups[0] - groups[1] of every column, all the columns share the permutations
+        # alternative: 'two-sided', 'greater' (groups[0] larger) or 'less'
+        columns = list(columns)  # O(k)
+        labels = Data[group_by].astype(str)  # O(n)
+        first = Data.loc[labels == str(groups[0]), columns].dropna().to_numpy(dtype=float)  # O(n·k)
+        second = Data.loc[labels == str(groups[1]), columns].dropna().to_numpy(dtype=float)  # O(n·k)
+        observed = p_value = np.full(len(columns), np.nan)  # O(k)
+        if len(first) and len(second):  # O(B·n·k)
+            observed = _statistic(first, statistic, axis=0) - _statistic(second, statistic, axis=0)
+            distribution = self.permutation_distribution(first, second, statistic)
+            if alternative == 'greater':
+                extreme = np.count_nonzero(distribution >= observed, axis=0)
+            elif alternative == 'less':
+                extreme = np.count_nonzero(distribution <= observed, axis=0)
+            else:
+                extreme = np.count_nonzero(np.abs(distribution) >= np.abs(observed), axis=0)
+            # The observed labelling counts as one of the permutations, so p is never 0
+            p_value = (extreme + 1) / (self.n_resamples + 1)
+        Permutation_Data = pd.DataFrame({'Feature': columns, 'Group1': groups[0], 'Group2': groups[1],
+                                         'n1': len(first), 'n2': len(second), 'Difference': observed,
+                                         'p-value': p_value})  # O(k)
+        Permutation_Data['Alternative'] = alternative  # O(k)
+        Permutation_Data['Resamples'] = self.n_resamples  # O(k)
+        return Permutation_Data  # O(1)
+
+    # This code has a computational time complexity of O(B·n·k), B being the number of resamples
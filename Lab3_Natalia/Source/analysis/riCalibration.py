@@ -0,0 +1,249 @@
+import bisect
+import numpy as np
+from pathlib import Path
+
+from Source.analysis.spectrumAnalyze import subsampleMinimum
+
+
+"""
+The RICalibration class inverts the landslide of a calibration sweep: AnalyzeSpectrum.landslide maps the
+RI to the wavelength of the first minimum, and RICalibration maps a measured wavelength (or a measured
+spectrum) back to the RI, for every fibre diameter ('125' and '25').
+- The minima are fitted by a monotone function of the RI (pool adjacent violators, in the direction of
+  the sensitivity), so the inverse is a single valued interpolant; np.interp then converts any number of
+  wavelengths in one vectorized binary search. Outside the calibrated range the RI is clipped (bounds='clip'),
+  extrapolated with the slope of the last segment ('linear') or NaN ('nan'). A single wavelength (e.g. one
+  frame of the real-time mode) is interpolated on Python floats (bisect on a list of the knots), so no
+  array is created per call.
+- estimate_RI(spectra) finds the first minimum of every spectrum (argmin in the interval 1.16 to 1.23 µm
+  and subsampleMinimum, as SpectrumBatch.firstMinimumPeak) and interpolates it, or, with method='nearest',
+  looks up the k nearest reference spectra of the sweep (Euclidean distance in the interval, computed as a
+  matrix product) and averages their RI weighted by the inverse distance.
+The spectra are processed in chunks of at most max_elements values, so millions of spectra use a bounded
+amount of memory. The calibration is saved and loaded as a single .npz file.
+"""
+
+def monotoneFit(values, increasing=True):
+    # Least squares fit of values (in order) by a non decreasing (or non increasing) sequence
+    values = np.asarray(values, dtype=float)  # O(m)
+    sign = 1.0 if increasing else -1.0  # O(1)
+    means, sizes = [], []  # Blocks of pooled values  # O(1)
+    for value in sign * values:  # O(m)
+        means.append(value)
+        sizes.append(1)
+        # Pool the last blocks while they violate the order
+        while len(means) > 1 and means[-2] > means[-1]:
+            size = sizes[-2] + sizes[-1]
+            means[-2:] = [(means[-2] * sizes[-2] + means[-1] * sizes[-1]) / size]
+            sizes[-2:] = [size]
+    return sign * np.repeat(means, sizes)  # O(m)
+
+
+class RICalibration:
+    DIAMETERS = ['125', '25']
+
+    def __init__(self, RI, minima, sensitivity=None, Wavelength=None, references=None,
+                 interval=(1.16, 1.23), bounds='clip', max_elements=2**22):
+        # minima: diameter -> wavelength of the first minimum at every RI
+        # sensitivity: diameter -> gradient of the minimum (its sign gives the direction of the fit)
+        # references: diameter -> (number of RI x number of wavelengths) spectra of the sweep, on Wavelength
+        if bounds not in ('clip', 'linear', 'nan'):  # O(1)
+            raise ValueError(f"Unknown bounds '{bounds}', use 'clip', 'linear' or 'nan'")
+        self.RI = np.asarray(RI, dtype=float)  # O(m)
+        self.minima = {diameter: np.asarray(values, dtype=float) for diameter, values in minima.items()}  # O(m)
+        self.sensitivity = {diameter: np.asarray(values, dtype=float) for diameter, values in (sensitivity or {}).items()}  # O(m)
+        self.interval = tuple(interval)  # O(1)
+        self.bounds = bounds  # O(1)
+        self.max_elements = max_elements  # Values of one chunk of spectra  # O(1)
+        self.knots = {diameter: self._knots(diameter) for diameter in self.minima}  # (wavelengths, RI) of the interpolant  # O(m log m)
+        self._knot_lists = {diameter: (Wavelength.tolist(), RI.tolist()) for diameter, (Wavelength, RI) in self.knots.items()}  # O(m)
+        self.Wavelength = None if Wavelength is None else np.asarray(Wavelength, dtype=float)  # O(n)
+        self.references = {}  # O(1)
+        self._norms = {}  # O(1)
+        if references is not None:  # O(n·m)
+            self.setReferences(Wavelength, references)
+
+    def _knots(self, diameter):
+        order = np.argsort(self.RI, kind='stable')  # O(m log m)
+        RI, minima = self.RI[order], self.minima[diameter][order]  # O(m)
+        if diameter in self.sensitivity and len(self.sensitivity[diameter]):  # O(m)
+            increasing = np.mean(self.sensitivity[diameter]) >= 0
+        else:
+            increasing = np.polyfit(RI, minima, 1)[0] >= 0 if len(RI) > 1 else True
+        fitted = monotoneFit(minima, increasing)  # O(m)
+        # RI sharing the same fitted wavelength are averaged, so the wavelengths of the knots are unique
+        Wavelength, inverse = np.unique(fitted, return_inverse=True)  # O(m log m)
+        RI = np.bincount(inverse, weights=RI) / np.bincount(inverse)  # O(m)
+        if len(Wavelength) < 2:  # O(1)
+            raise ValueError(f"The minimum of the {diameter} µm fibre does not move with the RI, it can not be inverted")
+        return Wavelength, RI  # O(1)
+
+    def setReferences(self, Wavelength, references):
+        self.Wavelength = np.asarray(Wavelength, dtype=float)  # O(n)
+        columns = self._columns(self.Wavelength)  # O(n)
+        for diameter, spectra in references.items():  # O(n·m)
+            spectra = np.ascontiguousarray(np.atleast_2d(spectra)[:, columns], dtype=float)
+            if len(spectra) != len(self.RI):
+                raise ValueError("There must be one reference spectrum per RI")
+            self.references[diameter] = spectra
+            self._norms[diameter] = np.einsum('ij,ij->i', spectra, spectra)
+        return self  # O(1)
+
+    def _columns(self, Wavelength):
+        # Slice of the interval on the wavelength axis (indices if the axis is not sorted)
+        index = np.flatnonzero((Wavelength >= self.interval[0]) & (Wavelength <= self.interval[1]))  # O(n)
+        if len(index) == 0:  # O(1)
+            raise ValueError(f"No wavelengths in the interval {self.interval[0]} to {self.interval[1]} µm")
+        if index[-1] - index[0] + 1 == len(index):  # O(1)
+            return slice(index[0], index[-1] + 1)
+        return index  # O(1)
+
+    def _chunk(self, n_values):
+        return max(1, self.max_elements // max(1, n_values))  # Spectra per chunk  # O(1)
+
+    def scalar_to_RI(self, wavelength, diameter='25'):
+        # Same result as wavelength_to_RI for one wavelength, computed on floats without creating arrays
+        Wavelength, RI = self._knot_lists[str(diameter)]  # O(1)
+        wavelength, last = float(wavelength), len(Wavelength) - 1  # O(1)
+        if wavelength != wavelength:  # O(1), NaN
+            return wavelength
+        if wavelength < Wavelength[0] or wavelength > Wavelength[last]:  # O(1)
+            if self.bounds == 'nan':
+                return float('nan')
+            below = wavelength < Wavelength[0]
+            if self.bounds == 'clip':
+                return RI[0] if below else RI[last]
+            start, end = (0, 1) if below else (last - 1, last)
+            slope = (RI[end] - RI[start]) / (Wavelength[end] - Wavelength[start])
+            return RI[start] + (wavelength - Wavelength[start]) * slope if below else RI[end] + (wavelength - Wavelength[end]) * slope
+        if wavelength == Wavelength[last]:  # O(1)
+            return RI[last]
+        j = bisect.bisect_right(Wavelength, wavelength) - 1  # O(log m)
+        slope = (RI[j + 1] - RI[j]) / (Wavelength[j + 1] - Wavelength[j])  # O(1)
+        return slope * (wavelength - Wavelength[j]) + RI[j]  # O(1), the formula of np.interp
+
+    def wavelength_to_RI(self, wavelength, diameter='25'):
+        if isinstance(wavelength, (float, int, np.floating, np.integer)):  # O(log m), one wavelength
+            return self.scalar_to_RI(wavelength, diameter)
+        Wavelength, RI = self.knots[str(diameter)]  # O(1)
+        wavelength = np.asarray(wavelength, dtype=float)  # O(q)
+        estimate = np.interp(wavelength, Wavelength, RI)  # O(q log m)
+        if self.bounds == 'nan':  # O(q)
+            estimate = np.where((wavelength < Wavelength[0]) | (wavelength > Wavelength[-1]), np.nan, estimate)
+        elif self.bounds == 'linear':  # O(q)
+            slopes = np.diff(RI[[0, 1, -2, -1]])[[0, 2]] / np.diff(Wavelength[[0, 1, -2, -1]])[[0, 2]]
+            estimate = np.where(wavelength < Wavelength[0], RI[0] + (wavelength - Wavelength[0]) * slopes[0], estimate)
+            estimate = np.where(wavelength > Wavelength[-1], RI[-1] + (wavelength - Wavelength[-1]) * slopes[1], estimate)
+        return estimate  # O(1)
+
+    def __call__(self, wavelength, diameter='25'):
+        return self.wavelength_to_RI(wavelength, diameter)  # O(q log m)
+
+    def firstMinimum(self, spectra, Wavelength=None, mode='grid'):
+        # Wavelength of the first minimum of every row of spectra, chunk by chunk
+        Wavelength = self.Wavelength if Wavelength is None else np.asarray(Wavelength, dtype=float)  # O(n)
+        if Wavelength is None:  # O(1)
+            raise ValueError("The wavelength axis of the spectra is needed")
+        spectra = np.atleast_2d(spectra)  # O(1)
+        columns = self._columns(Wavelength)  # O(n)
+        Wavelength_interval = Wavelength[columns]  # O(n)
+        minima = np.empty(len(spectra))  # O(q)
+        chunk = self._chunk(len(Wavelength_interval))  # O(1)
+        for start in range(0, len(spectra), chunk):  # O(q·n)
+            block = spectra[start:start + chunk, columns]
+            minima[start:start + chunk] = subsampleMinimum(Wavelength_interval, block, np.argmin(block, axis=1), mode)
+        return minima  # O(1)
+
+    def nearest(self, spectra, diameter='25', k=1):
+        # RI of the k nearest reference spectra (inverse distance weighted), and the distance to the nearest
+        diameter = str(diameter)  # O(1)
+        if diameter not in self.references:  # O(1)
+            raise ValueError("No reference spectra, build the calibration with references (e.g. fromSession)")
+        references, norms = self.references[diameter], self._norms[diameter]  # O(1)
+        k = min(k, len(references))  # O(1)
+        spectra = np.atleast_2d(spectra)  # O(1)
+        columns = self._columns(self.Wavelength)  # O(n)
+        estimate, distance = np.empty(len(spectra)), np.empty(len(spectra))  # O(q)
+        chunk = self._chunk(len(references) + references.shape[1])  # O(1)
+        for start in range(0, len(spectra), chunk):  # O(q·n·m)
+            block = np.asarray(spectra[start:start + chunk, columns], dtype=float)
+            # |x - r|² = |x|² - 2 x·r + |r|² for every pair, as one matrix product
+            squared = np.einsum('ij,ij->i', block, block)[:, None] - 2 * block @ references.T + norms[None, :]
+            np.maximum(squared, 0, out=squared)
+            rows = np.arange(len(block))[:, None]
+            closest = np.argpartition(squared, k - 1, axis=1)[:, :k] if k < len(references) else np.broadcast_to(np.arange(k), (len(block), k))
+            closest = closest[rows, np.argsort(squared[rows, closest], axis=1)]
+            dist = np.sqrt(squared[rows, closest])
+            weights = 1 / np.maximum(dist, np.finfo(float).tiny)
+            estimate[start:start + chunk] = (weights * self.RI[closest]).sum(axis=1) / weights.sum(axis=1)
+            distance[start:start + chunk] = dist[:, 0]
+        return estimate, distance  # O(1)
+
+    def estimate_RI(self, spectra, diameter='25', method='minimum', mode='grid', Wavelength=None, k=1):
+        # spectra: (number of spectra x number of wavelengths) matrix, or a SpectrumBatch (its transmission
+        # of the given diameter is used)
+        # method: 'minimum' (interpolation of the first minimum) or 'nearest' (nearest reference spectra)
+        diameter = str(diameter)  # O(1)
+        if hasattr(spectra, 'TransmissionEtching'):  # O(1), SpectrumBatch
+            Wavelength = spectra.Wavelength
+            spectra = spectra.TransmissionEtching if diameter == '25' else spectra.Transmission
+        if method == 'minimum':  # O(q·n)
+            return self.wavelength_to_RI(self.firstMinimum(spectra, Wavelength, mode), diameter)
+        if method == 'nearest':  # O(q·n·m)
+            if Wavelength is not None and not np.array_equal(Wavelength, self.Wavelength):
+                raise ValueError("The spectra must share the wavelength axis of the reference spectra")
+            return self.nearest(spectra, diameter, k)[0]
+        raise ValueError(f"Unknown method '{method}', use 'minimum' or 'nearest'")
+
+    @classmethod
+    def fromLandslide(cls, result_landslide, result_sensitivity=None, **kwargs):
+        minima = {diameter: result_landslide[f'min_{diameter}'] for diameter in cls.DIAMETERS}  # O(m)
+        sensitivity = None  # O(1)
+        if result_sensitivity is not None:  # O(m)
+            sensitivity = {diameter: result_sensitivity[f'sensitivity {diameter}'] for diameter in cls.DIAMETERS}
+        return cls(result_landslide['RI'], minima, sensitivity, **kwargs)  # O(m log m)
+
+    @classmethod
+    def fromSession(cls, session, references=True, **kwargs):
+        # Landslide and sensitivity of an AnalysisSession, and its spectra as the reference spectra
+        calibration = cls.fromLandslide(session.landslide, session.sensitivity, **kwargs)  # O(n·m)
+        if references:  # O(n·m)
+            spectra = session.spectra
+            calibration.setReferences(spectra.Wavelength, {'125': spectra.Transmission, '25': spectra.TransmissionEtching})
+        return calibration  # O(1)
+
+    @classmethod
+    def fromTables(cls, folder, **kwargs):
+        # landslide.csv and sensitivity.csv written by the batch runner
+        import pandas as pd
+        folder = Path(folder)  # O(1)
+        return cls.fromLandslide(pd.read_csv(folder / 'landslide.csv'), pd.read_csv(folder / 'sensitivity.csv'), **kwargs)  # O(m)
+
+    def save(self, path):
+        path = Path(path).with_suffix('.npz')  # O(1)
+        path.parent.mkdir(parents=True, exist_ok=True)  # O(1)
+        arrays = {'RI': self.RI, 'interval': np.asarray(self.interval), 'bounds': np.asarray(self.bounds)}  # O(1)
+        arrays.update({f'minima:{diameter}': values for diameter, values in self.minima.items()})  # O(m)
+        arrays.update({f'sensitivity:{diameter}': values for diameter, values in self.sensitivity.items()})  # O(m)
+        if self.references:  # O(n·m)
+            arrays['Wavelength'] = self.Wavelength
+            arrays.update({f'references:{diameter}': values for diameter, values in self.references.items()})
+        np.savez(path, **arrays)  # O(n·m)
+        return path  # O(1)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(Path(path).with_suffix('.npz')) as arrays:  # O(n·m)
+            def group(prefix):
+                return {name.split(':', 1)[1]: arrays[name] for name in arrays.files if name.startswith(prefix + ':')}
+            calibration = cls(arrays['RI'], group('minima'), group('sensitivity') or None,
+                              interval=arrays['interval'], bounds=str(arrays['bounds']))
+            references = group('references')
+            if references:
+                # The references are stored already cut to the interval
+                calibration.Wavelength = arrays['Wavelength']
+                calibration.references = {diameter: np.ascontiguousarray(values) for diameter, values in references.items()}
+                calibration._norms = {diameter: np.einsum('ij,ij->i', values, values) for diameter, values in calibration.references.items()}
+        return calibration  # O(1)
+
+    # This code has a computational time complexity of O(q·n·m), q being the number of spectra to estimate
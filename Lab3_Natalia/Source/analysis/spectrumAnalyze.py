@@ -1,11 +1,61 @@
 import numpy as np
 import pandas as pd
 
+from Source.utils.stageProfiler import PROFILER
+
+
+"""
+subsampleMinimum refines the position of minima found with argmin below the step of the wavelength grid. 
+Transmission is a (n_spectra x n_points) matrix and index holds the argmin of every row, so all the spectra 
+are refined at once (several minima of the same row can be given with rows). Modes:
+- 'grid': the sample itself (no refinement).
+- 'parabolic': vertex of the parabola through the minimum and its two neighbours.
+- 'gaussian': vertex of a Gaussian through the same three samples, fitted to the depth of the dip below 
+  the highest sample of the window.
+- 'centroid': centroid of the dip depth over the window of ±window samples.
+The fractional position is converted to wavelength by interpolating the (possibly non uniform) axis.
+"""
+
+def subsampleMinimum(Wavelength, Transmission, index, mode='grid', window=3, rows=None):
+  # rows: row of Transmission of every index (by default one index per row)
+  Wavelength = np.asarray(Wavelength, dtype=float)  # O(n)
+  Transmission = np.atleast_2d(Transmission)  # O(1)
+  index = np.asarray(index)  # O(m)
+  if mode == 'grid':  # O(1)
+    return Wavelength[index]  # O(m)
+  if mode not in ('parabolic', 'gaussian', 'centroid'):  # O(1)
+    raise ValueError(f"Unknown mode '{mode}', use 'grid', 'parabolic', 'gaussian' or 'centroid'")
+
+  n_points = Transmission.shape[1]  # O(1)
+  rows = np.arange(len(index)) if rows is None else np.asarray(rows)  # O(m)
+  # Window of samples around every minimum, clipped to the edges of the spectrum
+  offsets = np.arange(-window, window + 1)  # O(w)
+  columns = np.clip(index[:, None] + offsets, 0, n_points - 1)  # O(m·w)
+  values = Transmission[rows[:, None], columns]  # O(m·w)
+  depth = values.max(axis=1, keepdims=True) - values  # Depth of the dip below the highest sample  # O(m·w)
+
+  if mode == 'centroid':  # O(1)
+    weight = depth.sum(axis=1)  # O(m·w)
+    position = np.where(weight > 0, (depth * columns).sum(axis=1) / np.where(weight > 0, weight, 1), index)  # O(m·w)
+  else:
+    left, centre, right = values[:, window - 1], values[:, window], values[:, window + 1]  # O(m)
+    if mode == 'gaussian':  # O(1)
+      tiny = np.finfo(float).tiny  # O(1)
+      left, centre, right = (-np.log(np.maximum(depth[:, k], tiny)) for k in (window - 1, window, window + 1))  # O(m)
+    curvature = left - 2 * centre + right  # O(m)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      delta = np.where(curvature > 0, 0.5 * (left - right) / curvature, 0.0)  # O(m)
+    # The samples at the edges of the spectrum have no neighbour on one side
+    inside = (index > 0) & (index < n_points - 1)  # O(m)
+    position = index + np.where(inside, np.clip(delta, -0.5, 0.5), 0.0)  # O(m)
+
+  return np.interp(position, np.arange(n_points), Wavelength)  # O(m log n)
 
 """
 The Spectrum class allows storing a spectrum with and without etching together with its 
 wavelength and refractive index. It contains a method to identify the first minimum 
-in the range 1.16 to 1.23 µm in both spectra.
+in the range 1.16 to 1.23 µm (by default, see interval) in both spectra, on the wavelength grid or 
+refined below the grid step (see subsampleMinimum).
 """
 
 class Spectrum:
@@ -15,9 +65,9 @@ class Spectrum:
     self.TransmissionEtching = np.array(TransmissionEtching)  # O(n) 
     self.RI = RI  # O(1) 
 
-  def firstMinimumPeak (self):
-    interval = (self.Wavelength >= 1.16) & (self.Wavelength <= 1.23)  # O(n) 
-    # Filter values in the interval 1.16 and 1.23
+  def firstMinimumPeak (self, mode='grid', interval=(1.16, 1.23)):
+    interval = (self.Wavelength >= interval[0]) & (self.Wavelength <= interval[1])  # O(n) 
+    # Filter values in the interval (1.16 and 1.23 by default)
     Wavelength_interval = self.Wavelength[interval]  # O(n) 
     Transmission_interval  = self.Transmission[interval]  # O(n) 
     TransmissionEtching_interval = self.TransmissionEtching[interval]  # O(n) 
@@ -25,8 +75,74 @@ class Spectrum:
     minTransmission = Wavelength_interval[np.argmin(Transmission_interval)]  # O(n) 
     minTransmissionEtching = Wavelength_interval[np.argmin(TransmissionEtching_interval)]  # O(n) 
 
+    if mode != 'grid':  # O(1)
+      # Refine both minima below the grid step
+      Transmissions = np.vstack([Transmission_interval, TransmissionEtching_interval])  # O(n)
+      minTransmission, minTransmissionEtching = subsampleMinimum(Wavelength_interval, Transmissions, np.argmin(Transmissions, axis=1), mode)  # O(n)
+
     return minTransmission, minTransmissionEtching  # O(1) 
 
+"""
+The SpectrumBatch class stores many spectra that share the same wavelength axis. The transmissions 
+with and without etching are kept as two contiguous (n_spectra x n_points) matrices, so the first 
+minimum of every spectrum is found in a single vectorized pass: the interval 1.16 to 1.23 µm is 
+masked once and argmin runs along the wavelength axis.
+"""
+
+class SpectrumBatch:
+  def __init__(self, Wavelength, Transmission, TransmissionEtching, RI):
+    self.Wavelength = np.asarray(Wavelength, dtype=float)  # O(n)
+    self.Transmission = np.ascontiguousarray(np.atleast_2d(Transmission), dtype=float)  # O(n·m)
+    self.TransmissionEtching = np.ascontiguousarray(np.atleast_2d(TransmissionEtching), dtype=float)  # O(n·m)
+    self.RI = np.asarray(RI, dtype=float).ravel()  # O(m)
+
+    if self.Transmission.shape != self.TransmissionEtching.shape:  # O(1)
+      raise ValueError("Transmission and TransmissionEtching must have the same shape")
+    if self.Transmission.shape != (len(self.RI), len(self.Wavelength)):  # O(1)
+      raise ValueError("Transmission must have shape (number of RI, number of wavelengths)")
+
+  @classmethod
+  def fromDataFrame(cls, Data, unetching, etching, RI, col='Wavelength'):
+    # Every column becomes one row of the matrix
+    Transmission = Data[list(unetching)].to_numpy(dtype=float).T  # O(n·m)
+    TransmissionEtching = Data[list(etching)].to_numpy(dtype=float).T  # O(n·m)
+    return cls(Data[col], Transmission, TransmissionEtching, RI)  # O(n·m)
+
+  @classmethod
+  def fromSpectra(cls, spectra):
+    Wavelength = spectra[0].Wavelength  # O(1)
+    for spectrum in spectra:  # O(n·m)
+      if not np.array_equal(spectrum.Wavelength, Wavelength):
+        raise ValueError("All spectra must share the same wavelength axis")
+    Transmission = np.vstack([spectrum.Transmission for spectrum in spectra])  # O(n·m)
+    TransmissionEtching = np.vstack([spectrum.TransmissionEtching for spectrum in spectra])  # O(n·m)
+    return cls(Wavelength, Transmission, TransmissionEtching, [spectrum.RI for spectrum in spectra])  # O(n·m)
+
+  def __len__(self):
+    return len(self.RI)  # O(1)
+
+  def interval(self, min_wavelength=1.16, max_wavelength=1.23):
+    mask = (self.Wavelength >= min_wavelength) & (self.Wavelength <= max_wavelength)  # O(n)
+    index = np.flatnonzero(mask)  # O(n)
+    if len(index) == 0:  # O(1)
+      raise ValueError(f"No wavelengths in the interval {min_wavelength} to {max_wavelength} µm")
+    # A sorted wavelength axis gives a contiguous interval, which is sliced as a view instead of copied
+    if index[-1] - index[0] + 1 == len(index):  # O(1)
+      return slice(index[0], index[-1] + 1)  # O(1)
+    return index  # O(1)
+
+  @PROFILER.stage()
+  def firstMinimumPeak(self, mode='grid', interval=(1.16, 1.23)):
+    interval = self.interval(*interval)  # O(n)
+    Wavelength_interval = self.Wavelength[interval]  # O(n)
+    Transmission_interval = self.Transmission[:, interval]  # O(1) view for a contiguous interval
+    TransmissionEtching_interval = self.TransmissionEtching[:, interval]  # O(1) view for a contiguous interval
+    # Position of the minimum of every spectrum in one pass along the wavelength axis
+    minTransmission = subsampleMinimum(Wavelength_interval, Transmission_interval, np.argmin(Transmission_interval, axis=1), mode)  # O(n·m)
+    minTransmissionEtching = subsampleMinimum(Wavelength_interval, TransmissionEtching_interval, np.argmin(TransmissionEtching_interval, axis=1), mode)  # O(n·m)
+
+    return minTransmission, minTransmissionEtching  # O(1)
+
 """
 AnalyzeSpectrum groups several spectra (Spectrum) to analyse the behaviour of the first minimum 
 as a function of refractive index. It extracts the minimum transmission values for fibres of different 
@@ -35,15 +151,25 @@ diameters and associates them with their corresponding RI.
 
 class AnalyzeSpectrum:
   def __init__(self, spectra):
-      self.spectra = spectra # Different spectrum   # O(1) 
+      self.spectra = spectra # Different spectrum (list of Spectrum or SpectrumBatch)   # O(1) 
+
+  @PROFILER.stage()
+  def landslide(self, mode='grid', interval=(1.16, 1.23)):
+    # mode: how the minimum is located, see subsampleMinimum; interval: wavelengths (µm) searched
+    if isinstance(self.spectra, SpectrumBatch):  # O(1)
+      # All the minima are found in a single vectorized pass
+      min_125, min_25 = self.spectra.firstMinimumPeak(mode, interval)  # O(n·m)
+      self.minPeak125 = min_125.tolist()  # O(m)
+      self.minPeak25 = min_25.tolist()  # O(m)
+      self.RI_values = self.spectra.RI.tolist()  # O(m)
+      return {'RI': self.RI_values, 'min_125': self.minPeak125, 'min_25': self.minPeak25}  # O(1)
 
-  def landslide(self):
     self.minPeak125 = []  # O(1) 
     self.minPeak25 = []  # O(1) 
     self.RI_values = []  # O(1) 
 
     for spectrum in self.spectra:
-      min_125, min_25 = spectrum.firstMinimumPeak()  # O(n) 
+      min_125, min_25 = spectrum.firstMinimumPeak(mode, interval)  # O(n) 
       if min_125 is not None and min_25 is not None:  # O(1) 
         self.minPeak125.append(min_125)  # O(1) 
         self.minPeak25.append(min_25)  # O(1) 
@@ -61,39 +187,128 @@ class Sensitivity(AnalyzeSpectrum):
   def __init__(self, spectra):
       super().__init__(spectra) # To load Landslide method   # O(1) 
 
-  def gradient(self):
-    self.landslide()  # O(n) 
+  @PROFILER.stage()
+  def gradient(self, result_landslide=None, mode='grid', interval=(1.16, 1.23)):
+    # A landslide computed before can be reused instead of searching the minima again
+    if result_landslide is None:  # O(1)
+      self.landslide(mode, interval)  # O(n) 
+    else:
+      self.RI_values = list(result_landslide['RI'])  # O(m)
+      self.minPeak125 = list(result_landslide['min_125'])  # O(m)
+      self.minPeak25 = list(result_landslide['min_25'])  # O(m)
 
-    self.sensitivity125 = np.gradient(self.minPeak125, self.RI_values)  # O(n) 
-    self.sensitivity25 = np.gradient(self.minPeak25, self.RI_values)  # O(n) 
+    # Both diameters are derived together along the RI axis
+    self.sensitivity125, self.sensitivity25 = np.gradient(np.vstack([self.minPeak125, self.minPeak25]), self.RI_values, axis=1)  # O(n) 
 
     return {'RI': self.RI_values, 'sensitivity 125': self.sensitivity125, 'sensitivity 25': self.sensitivity25}  # O(1) 
   
 
+"""
+The OnlineCovariance class accumulates the covariance matrix of several columns without keeping the data. 
+Each block of new wavelength rows is reduced to its count, mean and co-moment matrix and merged with the 
+totals (Welford/Chan update), so chunks read one after another, or processed by different workers, give the 
+same matrix as a single computation. New spectra (columns) can also be added from the rows already absorbed 
+without recomputing the existing part of the matrix.
+"""
+
+class OnlineCovariance:
+  def __init__(self, columns):
+    self.columns = list(columns)  # O(1)
+    self.count = 0  # O(1)
+    self.mean = np.zeros(len(self.columns))  # O(m)
+    self.comoment = np.zeros((len(self.columns), len(self.columns)))  # Sum of products of deviations  # O(m²)
+
+  def update(self, values):
+    # values: new rows with one column per spectrum
+    values = np.asarray(values, dtype=float)  # O(n·m)
+    if len(values) == 0:  # O(1)
+      return self
+    mean = values.mean(axis=0)  # O(n·m)
+    deviation = values - mean  # O(n·m)
+    return self._combine(len(values), mean, deviation.T @ deviation)  # O(n·m²)
+
+  def merge(self, other):
+    if other.columns != self.columns:  # O(m)
+      raise ValueError("Only accumulators with the same columns can be merged")
+    return self._combine(other.count, other.mean, other.comoment)  # O(m²)
+
+  def _combine(self, count, mean, comoment):
+    if count == 0:  # O(1)
+      return self
+    total = self.count + count  # O(1)
+    delta = mean - self.mean  # O(m)
+    self.comoment = self.comoment + comoment + np.outer(delta, delta) * self.count * count / total  # O(m²)
+    self.mean = self.mean + delta * count / total  # O(m)
+    self.count = total  # O(1)
+    return self  # O(1)
+
+  def addSpectra(self, columns, new_values, values):
+    # new_values: the new spectra over the rows already absorbed; values: those same rows of the existing columns
+    new_values = np.asarray(new_values, dtype=float)  # O(n·q)
+    values = np.asarray(values, dtype=float)  # O(n·m)
+    if len(new_values) != self.count or len(values) != self.count:  # O(1)
+      raise ValueError("The new spectra must cover the same rows already absorbed")
+    mean = new_values.mean(axis=0)  # O(n·q)
+    deviation = new_values - mean  # O(n·q)
+    cross = (values - self.mean).T @ deviation  # Only the new blocks of the matrix are computed  # O(n·m·q)
+    self.comoment = np.block([[self.comoment, cross], [cross.T, deviation.T @ deviation]])  # O((m+q)²)
+    self.mean = np.concatenate([self.mean, mean])  # O(m+q)
+    self.columns = self.columns + list(columns)  # O(q)
+    return self  # O(1)
+
+  def cov(self, columns=None):
+    # Sample covariance (ddof=1), the same used by DataFrame.cov
+    matrix = pd.DataFrame(self.comoment / (self.count - 1), index=self.columns, columns=self.columns)  # O(m²)
+    return matrix if columns is None else matrix.loc[list(columns), list(columns)]  # O(m²)
+
 """
 Class designed to calculate covariance matrices between columns of optical data with and without treatment 
 (etching and unetching). It allows to analyse the relationship and variability between diameters and RI, being useful 
-to identify patterns through representations such as heat maps.
+to identify patterns through representations such as heat maps. The full matrix of all the columns is computed 
+once with OnlineCovariance, and the unetching, etching and per-RI matrices are slices of it. New wavelength 
+rows can be absorbed with update() without recomputing the matrix.
 """
 
 class AnalyzeCovariance:
+  derived_attributes = ('accumulator',)  # Computed from the data, not part of the ResultCache key
    
   def __init__(self, Data, unetching, etching):
    self.Data = Data  # O(1) 
    self.unetching = unetching  # O(1) 
    self.etching = etching  # O(1) 
+   self.accumulator = None  # O(1)
+
+  @PROFILER.stage()
+  def fullCov(self):
+   if self.accumulator is None:  # O(1)
+     self.accumulator = OnlineCovariance(list(self.unetching) + list(self.etching))  # O(1)
+     self.accumulator.update(self.Data[self.accumulator.columns].to_numpy(dtype=float))  # O(n·m²)
+   return self.accumulator.cov()  # O(m²)
+
+  @PROFILER.stage()
+  def update(self, NewData):
+   # Absorb new wavelength rows into the matrix already computed; the rows are also appended to Data,
+   # so Data always holds every row behind the matrices (and the ResultCache key changes with them)
+   self.fullCov()  # O(1) once computed
+   self.accumulator.update(NewData[self.accumulator.columns].to_numpy(dtype=float))  # O(k·m²)
+   self.Data = pd.concat([self.Data, NewData])  # O(n+k)
+   return self  # O(1)
 
+  @PROFILER.stage()
   def unetchingCov(self):
-   return self.Data[self.unetching].cov()  # O(n²)
+   return self.fullCov().loc[list(self.unetching), list(self.unetching)]  # O(m²)
   
+  @PROFILER.stage()
   def etchingCov(self):
-   return self.Data[self.etching].cov()  # O(n²)
+   return self.fullCov().loc[list(self.etching), list(self.etching)]  # O(m²)
 
+  @PROFILER.stage()
   def RICov(self):
    Covariance = []  # O(1)
-   for unetchingCov, etchingCov in zip (self.unetching, self.etching):  # O(n)
-     MMFdiameter = self.Data[[unetchingCov, etchingCov]].cov()  # O(n²)
+   full = self.fullCov()  # O(m²)
+   for unetchingCov, etchingCov in zip (self.unetching, self.etching):  # O(m)
+     MMFdiameter = full.loc[[unetchingCov, etchingCov], [unetchingCov, etchingCov]]  # O(1)
      Covariance.append(MMFdiameter)  # O(1)
    return Covariance  # O(1)
 
-    # This code has a computational time complexity of O(n²)
\ No newline at end of file
+    # This code has a computational time complexity of O(n·m²), m being the number of columns
\ No newline at end of file
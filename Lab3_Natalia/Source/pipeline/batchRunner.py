@@ -0,0 +1,241 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import multiprocessing
+import re
+import time
+import warnings
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from Source.preprocessing.preprocessing_Data import Preprocessing, ZScoreNormalizer
+from Source.analysis.analysisSession import AnalysisSession
+from Source.analysis.featuresANDstaticalanalyze import StaticalAnalysis, GroupedStatistics
+
+
+"""
+The BatchRunner class processes many sweep files (FIMMWAVE CSV exports) with the same chain as
+Test/test.py: preprocessing, landslide of the first minimum, sensitivity, relevant peaks and statistical
+tests. Every file is handled by a worker of a process pool and its tables are written to its own folder
+(output/<file name>/), together with a manifest.json describing the raw file and the parameters used.
+A file whose manifest matches the current raw file and parameters is skipped, so re-running the batch
+after adding sweeps only processes the new ones. At the end the tables of all the files are concatenated
+into output/<table>_all.csv with a 'File' column, and the status of every file is written to runs.csv.
+
+The column to RI and MMF diameter mapping is read from a JSON file ({column: {"RI": ..., "MMF Diameter":
+"125 µm" | "25 µm"}}, the format of Preprocessing.columns_metadata) or inferred from the headers: every
+RI_X column paired with an RI_X_etching column is a 125 µm / 25 µm spectrum, and the RI is X when X is a
+refractive index (e.g. RI_1.33), or the RI list given with --RI (by default the RI of the FIMMWAVE exports,
+matched by column name: RI_Water = 1.33, RI_B = 1.35, ..., so Data_SP.csv, without RI_F, also works).
+
+Measured (noisy) spectra can be denoised first with --smoothing savgol|moving|fft (and --baseline); the
+peak detection then uses the distance and prominence chosen from the noise (Preprocessing.denoise). With
+--baseline alone the spectra are not smoothed and the default distance and threshold are kept.
+New measurements can be normalised with the z-score statistics of a calibration set instead of their own
+with --normalizer (e.g. Data/processed/Data_processed_normalization.json).
+
+Run from Lab3_Natalia:
+    python -m Source.pipeline.batchRunner "Data/raw/*.csv" --output Results/batch --workers 4
+"""
+
+# Per-file tables; the aggregated tables are named <table>_all.csv
+TABLES = ['landslide', 'sensitivity', 'features_detected', 'summary_statistics', 'grouped_statistics']
+
+MANIFEST = 'manifest.json'
+
+
+def default_RI(unetching):
+    # RI of the FIMMWAVE exports (RI_Water = 1.33, RI_B = 1.35, ...), matched by column name
+    preprocessor = Preprocessing()  # O(1)
+    known = dict(zip(preprocessor.unetching, preprocessor.RI_values))  # O(m)
+    if all(col in known for col in unetching):  # O(m)
+        return [known[col] for col in unetching]
+    if len(unetching) > len(preprocessor.RI_values):  # O(1)
+        raise ValueError(f"{len(unetching)} RI columns found but only {len(preprocessor.RI_values)} default RI values, "
+                         "pass the RI of every column with --RI")
+    warnings.warn(f"Unknown RI columns {unetching}, the first {len(unetching)} default RI values "
+                  f"{preprocessor.RI_values[:len(unetching)]} are used; pass --RI to set them")  # O(1)
+    return preprocessor.RI_values[:len(unetching)]  # O(m)
+
+
+def infer_columns(header, RI_values=None):
+    # Pairs RI_X / RI_X_etching of the header, in the order of the file
+    columns = set(header)  # O(m)
+    unetching = [col for col in header if re.fullmatch(r'RI_.+', col) and not col.endswith('_etching')
+                 and f'{col}_etching' in columns]  # O(m)
+    if not unetching:  # O(1)
+        raise ValueError("No RI_X / RI_X_etching column pairs found in the header")
+    etching = [f'{col}_etching' for col in unetching]  # O(m)
+
+    if RI_values is None:  # O(m)
+        labels = [col[3:] for col in unetching]
+        if all(re.fullmatch(r'[1-9]\d*(\.\d+)?', label) and float(label) >= 1 for label in labels):
+            RI_values = labels  # The RI is written in the header
+        else:
+            RI_values = default_RI(unetching)  # RI of the FIMMWAVE exports
+    RI_values = [str(ri) for ri in RI_values]  # O(m)
+    if len(RI_values) != len(unetching):  # O(1)
+        raise ValueError(f"{len(unetching)} RI columns found but {len(RI_values)} RI values given")
+    return unetching, etching, RI_values  # O(1)
+
+
+def columns_from_mapping(mapping):
+    # Mapping {column: {'RI': ..., 'MMF Diameter': ...}} to the 125 µm and 25 µm columns sorted by RI
+    by_diameter = {'125 µm': {}, '25 µm': {}}  # O(1)
+    for col, info in mapping.items():  # O(m)
+        if info['MMF Diameter'] not in by_diameter:
+            raise ValueError(f"Unknown MMF Diameter for {col}: {info['MMF Diameter']}")
+        by_diameter[info['MMF Diameter']][str(info['RI'])] = col
+    RI_values = sorted(by_diameter['125 µm'], key=float)  # O(m log m)
+    if RI_values != sorted(by_diameter['25 µm'], key=float):  # O(m log m)
+        raise ValueError("The 125 µm and 25 µm columns of the mapping must have the same RI values")
+    return [by_diameter['125 µm'][ri] for ri in RI_values], [by_diameter['25 µm'][ri] for ri in RI_values], RI_values  # O(m)
+
+
+def process_file(path, output_dir, mapping=None, RI_values=None, min_range=1.04, max_range=1.43, force=False,
+                 smoothing=None, baseline=False, normalizer=None):
+    # Whole chain for one file; runs in a worker process
+    path, output_dir = Path(path), Path(output_dir)  # O(1)
+    start = time.perf_counter()  # O(1)
+    if mapping is not None:  # O(m)
+        unetching, etching, RI = columns_from_mapping(mapping)
+    else:  # O(m)
+        unetching, etching, RI = infer_columns(pd.read_csv(path, nrows=0).columns.tolist(), RI_values)
+    parameters = {'min_range': min_range, 'max_range': max_range, 'unetching': unetching, 'etching': etching, 'RI': RI,
+                  'smoothing': smoothing, 'baseline': baseline}  # O(m)
+    if normalizer is not None:  # O(m), the statistics themselves, so a changed file is not taken as up to date
+        if not isinstance(normalizer, ZScoreNormalizer):
+            normalizer = ZScoreNormalizer.load(normalizer)
+        parameters['normalization'] = normalizer.to_dict()
+
+    preprocessor = Preprocessing(min_range, max_range)  # O(1)
+    preprocessor.unetching, preprocessor.etching, preprocessor.RI_values = unetching, etching, RI  # O(1)
+    raw = preprocessor.raw_stat(path)  # O(1)
+    manifest_path = output_dir / MANIFEST  # O(1)
+    if not force and manifest_path.exists() and all((output_dir / f'{table}.csv').exists() for table in TABLES):  # O(1)
+        manifest = json.loads(manifest_path.read_text(encoding='utf-8'))  # O(m)
+        if manifest.get('parameters') == parameters:  # O(1)
+            # Same criterion as the binary cache: size, modification and change time, then the content hash
+            same_file = all(manifest.get(name) == value for name, value in raw.items())  # O(1)
+            if same_file or manifest.get('raw_hash') == preprocessor.file_hash(path):  # O(n)
+                if not same_file:  # O(m), same content: its new times avoid hashing it again
+                    manifest_path.write_text(json.dumps(dict(manifest, **raw), indent=2, ensure_ascii=False), encoding='utf-8')
+                return {'File': path.stem, 'Path': str(path), 'Status': 'skipped', 'Seconds': time.perf_counter() - start, 'Error': ''}
+
+    output_dir.mkdir(parents=True, exist_ok=True)  # O(1)
+    manifest_path.unlink(missing_ok=True)  # O(1), the tables are not valid until the manifest is written again
+    with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        Data = preprocessor.pre_Data_1104(path, output_dir / 'Data_processed.csv', normalizer)  # O(n)
+        if smoothing is not None or baseline:  # O(n), measured spectra: denoise and choose the peak parameters from the noise
+            Data = preprocessor.denoise(Data, unetching + etching, smoothing=smoothing, baseline=baseline)
+        session = AnalysisSession(Data, unetching, etching, RI, peak_parameters=preprocessor.peak_parameters)  # O(1)
+        features_Data = session.relevant_peaks  # O(n)
+        StaticalAnalysis(features_Data, result_save=output_dir).summary_statistics()  # O(n)
+        # Shapiro, ANOVA, Kruskal, Wilcoxon and Mann-Whitney of every feature, Holm-corrected, in one table
+        GroupedStatistics(features_Data, result_save=output_dir).run()  # O(n log n)
+
+    pd.DataFrame(session.landslide).to_csv(output_dir / 'landslide.csv', index=False)  # O(m)
+    pd.DataFrame(session.sensitivity).to_csv(output_dir / 'sensitivity.csv', index=False)  # O(m)
+    features_Data.to_csv(output_dir / 'features_detected.csv', index=False)  # O(n)
+
+    manifest = {'raw_file': str(path), 'raw_hash': preprocessor.file_hash(path), **raw, 'parameters': parameters,
+                'RI_mapping': preprocessor.columns_metadata()}  # O(m)
+    manifest_path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding='utf-8')  # O(m)
+    return {'File': path.stem, 'Path': str(path), 'Status': 'processed', 'Seconds': time.perf_counter() - start, 'Error': ''}
+
+
+class BatchRunner:
+    def __init__(self, inputs, output_dir, mapping=None, RI_values=None, workers=None,
+                 min_range=1.04, max_range=1.43, force=False, smoothing=None, baseline=False, normalizer=None):
+        # inputs: glob patterns or paths of the raw CSV files
+        self.paths = sorted({Path(file) for pattern in inputs for file in (glob.glob(str(pattern)) or [pattern])})  # O(f log f)
+        stems = [path.stem for path in self.paths]  # O(f)
+        duplicated = sorted({stem for stem in stems if stems.count(stem) > 1})  # O(f²)
+        if duplicated:  # O(1)
+            raise ValueError(f"Files with the same name would share an output folder: {duplicated}")
+        self.output_dir = Path(output_dir)  # O(1)
+        self.mapping = mapping  # O(1)
+        self.RI_values = RI_values  # O(1)
+        self.workers = workers  # O(1)
+        self.min_range = min_range  # O(1)
+        self.max_range = max_range  # O(1)
+        self.force = force  # O(1)
+        self.smoothing = smoothing  # Smoothing method of Preprocessing.denoise, None for simulated spectra  # O(1)
+        self.baseline = baseline  # O(1)
+        self.normalizer = normalizer  # ZScoreNormalizer or its .json file, None to use the statistics of every file  # O(1)
+
+    def _arguments(self, path):
+        return (path, self.output_dir / path.stem, self.mapping, self.RI_values, self.min_range, self.max_range, self.force,
+                self.smoothing, self.baseline, self.normalizer)  # O(1)
+
+    def run(self):
+        runs = []  # O(1)
+        if self.workers == 1 or len(self.paths) <= 1:  # O(f·n)
+            for path in self.paths:
+                runs.append(self._result(path, lambda path=path: process_file(*self._arguments(path))))
+        else:  # O(f·n / workers)
+            # fork shares the imported modules with the workers; spawn is used where fork is not available
+            method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method)) as pool:
+                futures = {pool.submit(process_file, *self._arguments(path)): path for path in self.paths}
+                for future in as_completed(futures):
+                    runs.append(self._result(futures[future], future.result))
+        runs = pd.DataFrame(runs, columns=['File', 'Path', 'Status', 'Seconds', 'Error']).sort_values('File', ignore_index=True)  # O(f log f)
+        self.output_dir.mkdir(parents=True, exist_ok=True)  # O(1)
+        runs.to_csv(self.output_dir / 'runs.csv', index=False)  # O(f)
+        self.aggregate()  # O(f·k)
+        return runs  # O(1)
+
+    def _result(self, path, call):
+        # A failed file is reported in runs.csv and does not stop the batch
+        try:
+            result = call()  # O(n)
+        except Exception as error:
+            result = {'File': path.stem, 'Path': str(path), 'Status': 'failed', 'Seconds': float('nan'), 'Error': repr(error)}
+        print(f"{result['Status']:<10} {path}")  # O(1)
+        return result  # O(1)
+
+    def aggregate(self):
+        # Concatenate the tables of every file with an up-to-date manifest
+        folders = [self.output_dir / path.stem for path in self.paths if (self.output_dir / path.stem / MANIFEST).exists()]  # O(f)
+        aggregated = {}  # O(1)
+        for table in TABLES:  # O(f·k)
+            frames = [pd.read_csv(folder / f'{table}.csv').assign(File=folder.name) for folder in folders
+                      if (folder / f'{table}.csv').exists()]
+            if not frames:
+                continue
+            Data = pd.concat(frames, ignore_index=True)
+            Data = Data[['File'] + [col for col in Data.columns if col != 'File']]
+            Data.to_csv(self.output_dir / f'{table}_all.csv', index=False)
+            aggregated[table] = Data
+        return aggregated  # O(1)
+
+    # This code has a computational time complexity of O(f·n), f being the number of files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the spectral analysis of many sweep files in parallel")
+    parser.add_argument('inputs', nargs='+', help="Raw CSV files or glob patterns, e.g. 'Data/raw/*.csv'")
+    parser.add_argument('--output', type=Path, default=Path("Results") / "batch")
+    parser.add_argument('--mapping', type=Path, help="JSON file {column: {'RI': ..., 'MMF Diameter': '125 µm' | '25 µm'}}")
+    parser.add_argument('--RI', nargs='+', help="RI of the RI_X columns, in the order of the header")
+    parser.add_argument('--workers', type=int, default=None, help="Number of processes (default: number of CPUs)")
+    parser.add_argument('--min-range', type=float, default=1.04)
+    parser.add_argument('--max-range', type=float, default=1.43)
+    parser.add_argument('--force', action='store_true', help="Process the files even when their outputs are up to date")
+    parser.add_argument('--smoothing', choices=['savgol', 'moving', 'fft'], help="Denoise measured spectra before the peak detection")
+    parser.add_argument('--baseline', action='store_true', help="Remove a polynomial baseline before the peak detection")
+    parser.add_argument('--normalizer', type=Path, help="z-score statistics (.json) of a calibration set, applied to every file")
+    args = parser.parse_args()
+
+    mapping = json.loads(args.mapping.read_text(encoding='utf-8')) if args.mapping else None  # O(m)
+    runner = BatchRunner(args.inputs, args.output, mapping=mapping, RI_values=args.RI, workers=args.workers,
+                         min_range=args.min_range, max_range=args.max_range, force=args.force,
+                         smoothing=args.smoothing, baseline=args.baseline, normalizer=args.normalizer)  # O(f)
+    runs = runner.run()  # O(f·n)
+    print(runs.to_string(index=False))  # O(f)
+    print(f'Results saved: {args.output}')  # O(1)
@@ -0,0 +1,196 @@
+import argparse
+import itertools
+import multiprocessing
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from Source.preprocessing.preprocessing_Data import Preprocessing
+from Source.pipeline.batchRunner import infer_columns
+
+
+"""
+The ParameterSweep class runs the analysis of one sweep file for every point of a grid of analysis
+parameters and collects the outcomes in one comparison table (one row per grid point). The parameters
+belong to the stages of the chain, each stage depending on the ones above it:
+- preprocessing: min_range, max_range (wavelength range kept, µm)
+- landslide: interval (wavelengths where the first minimum is searched), followed by the sensitivity
+- detection: threshold, distance, prominence (find_peaks)
+- features: top, rel_height (selection and spectral width of the relevant peaks), followed by the tests
+The raw file is read once and preprocessed once per range in the main process, before the workers are
+forked, so every worker shares the same data. In every process the result of a stage is memoized by its
+parameters and the parameters of the stages it depends on. The grid points are ordered by the
+preprocessing and detection parameters first (ORDER), then the interval, then top and rel_height, and are
+handed to the workers in chunks that share the preprocessing and detection parameters, so the peaks are
+detected once per chunk; only the cheap landslide may be repeated by several workers. The number of times
+each stage was computed is kept in `computations`. On platforms without fork the points run in the main
+process.
+
+Run from Lab3_Natalia:
+    python -m Source.pipeline.parameterSweep Data/raw/Data_1104.csv --distance 30 50 --top 2 3 4 --rel-height 0.5 0.75
+"""
+
+# Parameters of every stage and their default values (the values used by Test/test.py)
+STAGES = {'preprocessing': ['min_range', 'max_range'], 'landslide': ['interval'],
+          'detection': ['threshold', 'distance', 'prominence'], 'features': ['top', 'rel_height']}
+DEFAULTS = {'min_range': 1.04, 'max_range': 1.43, 'interval': (1.16, 1.23), 'threshold': 0.0001, 'distance': 50,
+            'prominence': None, 'top': 3, 'rel_height': 0.5}
+# Order of the grid loops, outermost first: the detection (the costly stage) is shared by consecutive points
+ORDER = STAGES['preprocessing'] + STAGES['detection'] + STAGES['landslide'] + STAGES['features']
+
+# Sweep used by the forked workers, set while ParameterSweep.run is running
+_ACTIVE = None
+
+
+def _evaluate(point):
+    return _ACTIVE.evaluate(point)  # O(n·m)
+
+
+class ParameterSweep:
+    def __init__(self, path, grid, unetching=None, etching=None, RI_values=None, workers=None,
+                 tests=('kruskal', 'mannwhitney'), correction='holm'):
+        # grid: parameter -> list of values; the parameters not given keep their default value
+        unknown = set(grid) - set(DEFAULTS)  # O(k)
+        if unknown:  # O(1)
+            raise ValueError(f"Unknown parameters: {sorted(unknown)}, use {list(DEFAULTS)}")
+        self.path = Path(path)  # O(1)
+        self.grid = {name: list(grid.get(name, [DEFAULTS[name]])) for name in DEFAULTS}  # O(k)
+        self.grid['interval'] = [tuple(interval) for interval in self.grid['interval']]  # O(k)
+        if unetching is None:  # O(m), RI_X / RI_X_etching pairs of the header
+            unetching, etching, RI_values = infer_columns(pd.read_csv(self.path, nrows=0).columns.tolist(), RI_values)
+        self.unetching, self.etching, self.RI_values = list(unetching), list(etching), [str(ri) for ri in RI_values]  # O(m)
+        if 'fork' not in multiprocessing.get_all_start_methods():  # O(1)
+            workers = None
+        self.workers = workers  # O(1)
+        self.tests = tuple(tests)  # O(1)
+        self.correction = correction  # O(1)
+        self.memo = {}  # (stage, parameters) -> result  # O(1)
+        self.computations = {}  # Stage -> number of computations over all the processes  # O(1)
+
+    def points(self):
+        # Every combination of the grid, in ORDER (the parameters of the last names change fastest)
+        points = [dict(zip(ORDER, values)) for values in itertools.product(*(self.grid[name] for name in ORDER))]  # O(p)
+        return [{name: point[name] for name in DEFAULTS} for point in points]  # O(p·k), columns in the DEFAULTS order
+
+    def key(self, point, *stages):
+        return tuple(point[name] for stage in stages for name in STAGES[stage])  # O(k)
+
+    def _stage(self, name, key, func, computed):
+        # Result of a stage, computed once per key in this process
+        if (name, key) not in self.memo:  # O(1)
+            self.memo[(name, key)] = func()
+            computed.append(name)
+        return self.memo[(name, key)]  # O(1)
+
+    def preprocess(self):
+        # The raw file is read once; every range is cut and normalised from it, as pre_Data_1104 does
+        preprocessor = Preprocessing()  # O(1)
+        raw = preprocessor.read_data(self.path)  # O(n)
+        computed = []  # O(1)
+        for min_range, max_range in itertools.product(self.grid['min_range'], self.grid['max_range']):  # O(r·n)
+            preprocessor = Preprocessing(min_range, max_range)
+            self._stage('preprocessing', (min_range, max_range),
+                        lambda: preprocessor.normalize_RI(preprocessor.wavelength_range_Data(raw, col='Wavelength'), self.unetching + self.etching),
+                        computed)
+        return computed  # O(1)
+
+    def evaluate(self, point):
+        from Source.analysis.spectrumAnalyze import SpectrumBatch, AnalyzeSpectrum, Sensitivity
+        from Source.analysis.featuresANDstaticalanalyze import BatchFindPeaks, GroupedStatistics
+        start = time.perf_counter()  # O(1)
+        computed = []  # Stages computed for this point, the others were reused  # O(1)
+        preprocessing = self.key(point, 'preprocessing')  # O(1)
+        landslide_key = self.key(point, 'preprocessing', 'landslide')  # O(1)
+        detection_key = self.key(point, 'preprocessing', 'detection')  # O(1)
+        features_key = self.key(point, 'preprocessing', 'detection', 'features')  # O(1)
+        Data = self.memo[('preprocessing', preprocessing)]  # O(1)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            spectra = self._stage('spectra', preprocessing,
+                                  lambda: SpectrumBatch.fromDataFrame(Data, self.unetching, self.etching, self.RI_values), computed)  # O(n·m)
+            landslide = self._stage('landslide', landslide_key,
+                                    lambda: AnalyzeSpectrum(spectra).landslide(interval=point['interval']), computed)  # O(n·m)
+            sensitivity = self._stage('sensitivity', landslide_key,
+                                      lambda: Sensitivity(spectra).gradient(result_landslide=landslide), computed)  # O(m)
+            # 125 µm and 25 µm columns alternated for each RI, as AnalysisSession.relevant_peaks
+            columns = [col for pair in zip(self.unetching, self.etching) for col in pair]  # O(m)
+            detector = self._stage('detection', detection_key,
+                                   lambda: BatchFindPeaks.fromDataFrame(Data, columns, np.repeat(self.RI_values, 2), ["125 µm", "25 µm"] * len(self.RI_values))
+                                   .detectPeaks(point['threshold'], point['distance'], point['prominence']), computed)  # O(n·m)
+            features = self._stage('features', features_key,
+                                   lambda: detector.analyzePeaks(top=point['top'], rel_height=point['rel_height']), computed)  # O(n·m)
+            statistics = self._stage('statistics', features_key,
+                                     lambda: GroupedStatistics(features).run(self.tests, correction=self.correction), computed)  # O(t·p·k)
+
+        row = {name: (f'{value[0]}-{value[1]}' if name == 'interval' else value) for name, value in point.items()}  # O(k)
+        row.update({'sensitivity 125 mean': float(np.mean(sensitivity['sensitivity 125'])),
+                    'sensitivity 25 mean': float(np.mean(sensitivity['sensitivity 25'])),
+                    'n peaks': len(features),
+                    'Prominence mean': float(features['Prominence'].mean()) if len(features) else np.nan,
+                    'Spectral width mean': float(features['Spectral width'].mean()) if len(features) else np.nan})  # O(p)
+        # Smallest adjusted p-value of every test and feature (one per pair of groups for the pairwise tests)
+        p_values = statistics.groupby(['Test', 'Feature'], sort=False)['p-adjusted'].min()  # O(r)
+        row.update({f'{test} p {feature}': float(p) for (test, feature), p in p_values.items()})  # O(r)
+        row['Seconds'] = time.perf_counter() - start  # O(1)
+        row['Computed'] = ' '.join(computed)  # O(1)
+        return row  # O(1)
+
+    def run(self):
+        global _ACTIVE
+        points = self.points()  # O(p)
+        computed = self.preprocess()  # O(r·n)
+        # Points sharing the preprocessing and detection parameters go to the same worker
+        chunk = len(self.grid['interval']) * len(self.grid['top']) * len(self.grid['rel_height'])  # O(1)
+        if self.workers is None or self.workers == 1 or len(points) <= chunk:  # O(p·n·m)
+            rows = [self.evaluate(point) for point in points]
+        else:  # O(p·n·m / workers)
+            _ACTIVE = self
+            try:
+                with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                    rows = list(pool.map(_evaluate, points, chunksize=chunk))
+            finally:
+                _ACTIVE = None
+        for stage in computed + [stage for row in rows for stage in row['Computed'].split()]:  # O(p)
+            self.computations[stage] = self.computations.get(stage, 0) + 1
+        return pd.DataFrame(rows)  # O(p)
+
+    # This code has a computational time complexity of O(p·n·m), p being the number of grid points
+
+
+def _optional_float(value):
+    return None if value.lower() == 'none' else float(value)  # O(1)
+
+
+def _interval(value):
+    low, high = (float(bound) for bound in value.split(','))  # O(1)
+    return (low, high)  # O(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the analysis of a sweep file for a grid of parameters and compare the outcomes")
+    parser.add_argument('path', type=Path, nargs='?', default=Path("Data") / "raw" / "Data_1104.csv")
+    parser.add_argument('--output', type=Path, default=Path("Results") / "tables" / "parameter_sweep.csv")
+    parser.add_argument('--RI', nargs='+', help="RI of the RI_X columns, in the order of the header")
+    parser.add_argument('--workers', type=int, default=None, help="Number of processes (default: main process only)")
+    parser.add_argument('--min-range', type=float, nargs='+')
+    parser.add_argument('--max-range', type=float, nargs='+')
+    parser.add_argument('--interval', type=_interval, nargs='+', help="Windows of the first minimum, e.g. 1.16,1.23 1.15,1.25")
+    parser.add_argument('--threshold', type=_optional_float, nargs='+', help="find_peaks threshold values ('none' to disable)")
+    parser.add_argument('--distance', type=int, nargs='+')
+    parser.add_argument('--prominence', type=_optional_float, nargs='+', help="find_peaks prominence values ('none' to disable)")
+    parser.add_argument('--top', type=int, nargs='+', help="Number of relevant peaks kept per spectrum")
+    parser.add_argument('--rel-height', type=float, nargs='+', help="Relative height of the spectral width")
+    args = parser.parse_args()
+
+    grid = {name: getattr(args, name) for name in DEFAULTS if getattr(args, name) is not None}  # O(k)
+    sweep = ParameterSweep(args.path, grid, RI_values=args.RI, workers=args.workers)  # O(m)
+    Sweep_Data = sweep.run()  # O(p·n·m)
+    print(Sweep_Data.drop(columns=['Computed']).to_string(index=False))  # O(p)
+    print("Computations per stage:", sweep.computations)  # O(1)
+    args.output.parent.mkdir(parents=True, exist_ok=True)  # O(1)
+    Sweep_Data.to_csv(args.output, index=False)  # O(p)
+    print(f'Results saved: {args.output}')  # O(1)
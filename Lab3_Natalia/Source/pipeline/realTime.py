@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import functools
+import socket
+import time
+import numpy as np
+from pathlib import Path
+
+
+"""
+Real-time acquisition mode. Frames (one transmission spectrum each, on a fixed wavelength axis) are read
+from a source by an asyncio task and written in place into a preallocated ring buffer; a second task
+tracks the first minimum of every frame and turns its wavelength into an RI estimate. The frames are
+binary float64 spectra of n_points values, so the file and socket sources read them straight into the
+slot of the ring buffer (readinto / sock_recv_into). The tracker and the calibration work on scalars
+(LinearCalibration, or RICalibration, which interpolates a single wavelength on floats), so no array is
+allocated per frame.
+- SyntheticSource: SMS-like spectra (SyntheticSpectra) whose RI follows a given trajectory.
+- FileTailSource: frames appended to a binary file (e.g. `frame.tofile(file)` by the interrogator).
+- SocketSource: frames sent over a local TCP socket.
+Every source has a `Wavelength` axis and `async readinto(frame)`, which fills the frame and returns
+False when the stream ends.
+
+Run from Lab3_Natalia:
+    python -m Source.pipeline.realTime --source synthetic --frames 5000 --rate 1000
+    python -m Source.pipeline.realTime --source file --path stream.bin --calibration Results/batch/Data_1104
+"""
+
+class RingBuffer:
+    def __init__(self, capacity, n_points):
+        self.frames = np.zeros((capacity, n_points))  # O(c·n)
+        self.arrival = np.zeros(capacity)  # perf_counter when every frame was written  # O(c)
+        self._slots = list(self.frames)  # Row views, created once  # O(c)
+        self.written = 0  # Frames written since the start  # O(1)
+
+    @property
+    def capacity(self):
+        return len(self._slots)  # O(1)
+
+    def slot(self):
+        # Row where the next frame is written; it replaces the oldest frame
+        return self._slots[self.written % self.capacity]  # O(1)
+
+    def commit(self, arrival):
+        self.arrival[self.written % self.capacity] = arrival  # O(1)
+        self.written += 1  # O(1)
+
+    def frame(self, count):
+        # Frame number `count`, valid while count > written - capacity
+        return self._slots[count % self.capacity]  # O(1)
+
+    def latest(self, k=None):
+        # Copy of the last k frames, oldest first (for inspection, not used by the tracking)
+        k = min(k or self.capacity, self.written, self.capacity)  # O(1)
+        return self.frames[np.arange(self.written - k, self.written) % self.capacity]  # O(k·n)
+
+    # This code has a computational time complexity of O(1) per frame
+
+
+"""
+The ResonanceTracker class follows the first minimum of consecutive frames. The first frame is scanned
+in the interval 1.16 to 1.23 µm, as Spectrum.firstMinimumPeak does; the next ones are only searched within
+`window` µm of the previous minimum. If the minimum falls on the edge of the window (the resonance moved
+further than the window between two frames), the whole interval is scanned again. With mode='parabolic'
+the minimum is refined below the grid step with the same parabola as subsampleMinimum, computed on three
+scalars.
+"""
+
+class ResonanceTracker:
+    def __init__(self, Wavelength, window=0.005, interval=(1.16, 1.23), mode='parabolic'):
+        if mode not in ('grid', 'parabolic'):  # O(1)
+            raise ValueError(f"Unknown mode '{mode}', use 'grid' or 'parabolic'")
+        self.Wavelength = np.asarray(Wavelength, dtype=float)  # O(n)
+        inside = np.flatnonzero((self.Wavelength >= interval[0]) & (self.Wavelength <= interval[1]))  # Samples of the interval  # O(n)
+        self.first, self.last = int(inside[0]), int(inside[-1]) + 1  # O(1)
+        step = (self.Wavelength[-1] - self.Wavelength[0]) / max(1, len(self.Wavelength) - 1)  # O(1)
+        self.half = max(2, int(round(window / step)))  # Samples searched on each side  # O(1)
+        self.mode = mode  # O(1)
+        self.reset()  # O(1)
+
+    def reset(self):
+        self.index = -1  # Sample of the last minimum, -1 before the first frame  # O(1)
+        self.scans = 0  # Number of scans of the whole interval  # O(1)
+
+    def scan(self, frame):
+        self.scans += 1  # O(1)
+        return self.first + int(frame[self.first:self.last].argmin())  # O(n)
+
+    def refine(self, frame, index):
+        if self.mode == 'grid' or index <= self.first or index >= self.last - 1:  # O(1)
+            return float(self.Wavelength[index])
+        left, centre, right = float(frame[index - 1]), float(frame[index]), float(frame[index + 1])  # O(1)
+        curvature = left - 2 * centre + right  # O(1)
+        delta = min(0.5, max(-0.5, 0.5 * (left - right) / curvature)) if curvature > 0 else 0.0  # O(1)
+        neighbour = index + 1 if delta >= 0 else index - 1  # O(1)
+        return float(self.Wavelength[index] + abs(delta) * (self.Wavelength[neighbour] - self.Wavelength[index]))  # O(1)
+
+    def update(self, frame):
+        # Wavelength of the minimum of the frame
+        if self.index < 0:  # O(n), first frame
+            index = self.scan(frame)
+        else:  # O(w)
+            low, high = max(self.first, self.index - self.half), min(self.last, self.index + self.half + 1)
+            index = low + int(frame[low:high].argmin())
+            if (index == low and low > self.first) or (index == high - 1 and high < self.last):
+                index = self.scan(frame)
+        self.index = index  # O(1)
+        return self.refine(frame, index)  # O(1)
+
+    # This code has a computational time complexity of O(w) per frame, w being the samples of the window
+
+
+"""
+The LinearCalibration class turns the wavelength of the first minimum into an RI, linearised around a
+reference point: RI = RI_ref + (wavelength - wavelength_ref) / sensitivity. fromSensitivity takes the
+results of AnalyzeSpectrum.landslide and Sensitivity.gradient of a calibration sweep (or their CSV
+tables written by the batch runner): the reference is the centre of the sweep and the sensitivity is
+the mean of the gradient of the chosen diameter. Any callable wavelength -> RI can be used instead, e.g.
+RICalibration, which interpolates the whole landslide (the default of the command line).
+"""
+
+class LinearCalibration:
+    def __init__(self, RI_reference, wavelength_reference, sensitivity):
+        self.RI_reference = float(RI_reference)  # O(1)
+        self.wavelength_reference = float(wavelength_reference)  # O(1)
+        self.sensitivity = float(sensitivity)  # µm/RIU  # O(1)
+
+    def __call__(self, wavelength):
+        return self.RI_reference + (wavelength - self.wavelength_reference) / self.sensitivity  # O(1)
+
+    @classmethod
+    def fromSensitivity(cls, result_landslide, result_sensitivity, diameter='25'):
+        minima = np.asarray(result_landslide[f'min_{diameter}'], dtype=float)  # O(m)
+        RI = np.asarray(result_landslide['RI'], dtype=float)  # O(m)
+        return cls(RI.mean(), minima.mean(), np.mean(result_sensitivity[f'sensitivity {diameter}']))  # O(m)
+
+    @classmethod
+    def fromTables(cls, folder, diameter='25'):
+        import pandas as pd
+        folder = Path(folder)  # O(1)
+        return cls.fromSensitivity(pd.read_csv(folder / 'landslide.csv'), pd.read_csv(folder / 'sensitivity.csv'), diameter)  # O(m)
+
+    # This code has a computational time complexity of O(m), m being the number of RI of the sweep
+
+
+"""
+Sources of frames. readinto fills the given frame in place and returns False at the end of the stream.
+"""
+
+class SyntheticSource:
+    def __init__(self, generator=None, RI=None, n_frames=1000, rate=None, etching=True, seed=0):
+        from Source.preprocessing.syntheticData import SyntheticSpectra
+        self.generator = generator or SyntheticSpectra()  # O(1)
+        self.Wavelength = self.generator.wavelength()  # O(n)
+        # RI of every frame, a ramp over the RI of the generator by default
+        self.RI = np.linspace(1.33, 1.41, n_frames) if RI is None else np.asarray(RI, dtype=float)  # O(f)
+        self.shift = self.generator.shift_25 if etching else self.generator.shift_125  # O(1)
+        self.resonances = [float(resonance) for resonance in self.generator.resonances]  # O(r)
+        self.rate = rate  # Frames per second, None to produce them as fast as possible  # O(1)
+        self.rng = np.random.default_rng(seed)  # O(1)
+        self._dip = np.empty(len(self.Wavelength))  # Scratch array of one Lorentzian  # O(n)
+        self.count = 0  # O(1)
+        self._next = None  # O(1)
+
+    async def readinto(self, frame):
+        if self.count >= len(self.RI):  # O(1)
+            return False
+        if self.rate is None:  # O(1)
+            await asyncio.sleep(0)
+        else:  # O(1), keep the acquisition rate; frames that are late are produced at once, like a backlog
+            self._next = time.perf_counter() if self._next is None else self._next + 1 / self.rate
+            if self._next > time.perf_counter():
+                await asyncio.sleep(self._next - time.perf_counter())
+        offset = self.shift * (self.RI[self.count] - 1.33)  # O(1)
+        frame.fill(self.generator.baseline)  # O(n)
+        for resonance in self.resonances:  # O(r·n), depth / (1 + ((λ - c) / (width / 2))²) without temporaries
+            np.subtract(self.Wavelength, resonance + offset, out=self._dip)
+            self._dip *= 2 / self.generator.width
+            np.square(self._dip, out=self._dip)
+            self._dip += 1
+            np.divide(self.generator.depth, self._dip, out=self._dip)
+            frame -= self._dip
+        if self.generator.noise > 0:  # O(n)
+            self.rng.standard_normal(out=self._dip)
+            self._dip *= self.generator.noise
+            frame += self._dip
+        self.count += 1  # O(1)
+        return True  # O(1)
+
+
+class FileTailSource:
+    def __init__(self, path, Wavelength, poll=0.01, timeout=1.0):
+        self.path = Path(path)  # O(1)
+        self.Wavelength = np.asarray(Wavelength, dtype=float)  # O(n)
+        self.poll = poll  # Seconds between two checks for new data  # O(1)
+        self.timeout = timeout  # Seconds without new data before the stream ends (None: wait forever)  # O(1)
+        self.file = None  # O(1)
+
+    async def readinto(self, frame):
+        if self.file is None:  # O(1)
+            self.file = open(self.path, 'rb', buffering=0)
+        view = memoryview(frame).cast('B')  # O(1)
+        filled, waited = 0, 0.0  # O(1)
+        while filled < len(view):  # O(n)
+            read = self.file.readinto(view[filled:]) or 0
+            filled += read
+            if read:
+                waited = 0.0
+            elif self.timeout is not None and waited >= self.timeout:
+                self.file.close()
+                return False
+            else:  # End of the file for now, wait for the writer
+                await asyncio.sleep(self.poll)
+                waited += self.poll
+        return True  # O(1)
+
+
+class SocketSource:
+    def __init__(self, host, port, Wavelength):
+        self.address = (host, port)  # O(1)
+        self.Wavelength = np.asarray(Wavelength, dtype=float)  # O(n)
+        self.socket = None  # O(1)
+
+    async def readinto(self, frame):
+        loop = asyncio.get_running_loop()  # O(1)
+        if self.socket is None:  # O(1)
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setblocking(False)
+            await loop.sock_connect(self.socket, self.address)
+        view = memoryview(frame).cast('B')  # O(1)
+        filled = 0  # O(1)
+        while filled < len(view):  # O(n)
+            read = await loop.sock_recv_into(self.socket, view[filled:])
+            if not read:  # The sender closed the connection
+                self.socket.close()
+                return False
+            filled += read
+        return True  # O(1)
+
+
+"""
+The RealTimeStream class connects a source, the ring buffer and the tracker. The acquisition task
+writes every frame into the next slot of the ring buffer; the tracking task estimates the RI of the
+frames in order. Frames that are already available (a backlog in the socket or the file, or a late
+synthetic frame) are read in a burst. When the tracking falls max_lag frames behind the acquisition
+(max_lag is smaller than the capacity, so a frame is never overwritten while it waits), it skips to the
+newest frame and counts the skipped ones as dropped: the latency stays bounded instead of growing with
+the backlog. With drop=False (e.g. to replay a recorded file) the acquisition waits for the tracking after
+every frame and no frame is dropped.
+The estimates are written into preallocated arrays that keep the last `history` frames, and can be
+passed to a callback on_estimate(frame, wavelength, RI, latency).
+"""
+
+class RealTimeStream:
+    COLUMNS = ['Frame', 'Arrival', 'Wavelength', 'RI', 'Latency']
+
+    def __init__(self, source, tracker=None, calibration=None, capacity=64, max_lag=None, drop=True, history=10_000, on_estimate=None):
+        self.source = source  # O(1)
+        self.tracker = tracker or ResonanceTracker(source.Wavelength)  # O(n)
+        self.calibration = calibration  # Wavelength -> RI, None to only track the wavelength  # O(1)
+        self.buffer = RingBuffer(capacity, len(source.Wavelength))  # O(c·n)
+        self.max_lag = max(1, min(max_lag or capacity // 2, capacity - 1))  # O(1)
+        self.drop = drop  # O(1)
+        self.on_estimate = on_estimate  # O(1)
+        self.log = np.full((history, len(self.COLUMNS)), np.nan)  # One row per estimate, used as a ring  # O(h)
+        self.processed = 0  # O(1)
+        self.dropped = 0  # O(1)
+
+    async def acquire(self, ready):
+        while await self.source.readinto(self.buffer.slot()):  # O(f·n)
+            self.buffer.commit(time.perf_counter())
+            ready.set()
+            if not self.drop or self.buffer.written - self.processed >= self.max_lag:
+                await asyncio.sleep(0)  # Let the tracking run
+        self._finished = True  # O(1)
+        ready.set()  # O(1)
+
+    async def track(self, ready):
+        while True:  # O(f·w)
+            if self.processed == self.buffer.written:
+                if self._finished:
+                    break
+                ready.clear()
+                await ready.wait()
+                continue
+            lag = self.buffer.written - self.processed
+            if self.drop and lag >= self.max_lag:  # Skip to the newest frame
+                self.dropped += lag - 1
+                self.processed = self.buffer.written - 1
+            self.estimate(self.processed)
+            self.processed += 1
+
+    def estimate(self, count):
+        wavelength = self.tracker.update(self.buffer.frame(count))  # O(w)
+        RI = self.calibration(wavelength) if self.calibration is not None else np.nan  # O(1)
+        arrival = self.buffer.arrival[count % self.buffer.capacity]  # O(1)
+        latency = time.perf_counter() - arrival  # O(1)
+        row = self.log[count % len(self.log)]  # O(1)
+        row[0], row[1], row[2], row[3], row[4] = count, arrival, wavelength, RI, latency  # O(1)
+        if self.on_estimate is not None:  # O(1)
+            self.on_estimate(count, wavelength, RI, latency)
+
+    async def stream(self):
+        ready = asyncio.Event()  # O(1)
+        self._finished = False  # O(1)
+        await asyncio.gather(self.acquire(ready), self.track(ready))  # O(f·n)
+        return self  # O(1)
+
+    def run(self):
+        return asyncio.run(self.stream())  # O(f·n)
+
+    def estimates(self):
+        # Estimates kept in the history, in frame order
+        import pandas as pd
+        Estimates = pd.DataFrame(self.log, columns=self.COLUMNS).dropna(subset=['Frame'])  # O(h)
+        Estimates['Frame'] = Estimates['Frame'].astype(int)  # O(h)
+        return Estimates.sort_values('Frame', ignore_index=True)  # O(h log h)
+
+    def summary(self):
+        latency = self.log[:, 4][~np.isnan(self.log[:, 4])]  # O(h)
+        last = self.log[(self.processed - 1) % len(self.log)] if self.processed else np.full(len(self.COLUMNS), np.nan)  # O(1)
+        return {'frames': self.buffer.written, 'estimates': self.buffer.written - self.dropped, 'dropped': self.dropped,
+                'scans': self.tracker.scans, 'latency mean (ms)': latency.mean() * 1e3 if len(latency) else np.nan,
+                'latency p99 (ms)': np.quantile(latency, 0.99) * 1e3 if len(latency) else np.nan,
+                'latency max (ms)': latency.max() * 1e3 if len(latency) else np.nan,
+                'last wavelength': last[2], 'last RI': last[3]}  # O(h)
+
+    # This code has a computational time complexity of O(f·(n + w)), f being the number of frames
+
+
+def syntheticCalibration(generator=None):
+    # Calibration from the landslide and the sensitivity of the RI sweep of the generator
+    from Source.preprocessing.syntheticData import SyntheticSpectra
+    from Source.analysis.analysisSession import AnalysisSession
+    from Source.analysis.riCalibration import RICalibration
+    generator = generator or SyntheticSpectra()  # O(1)
+    unetching, etching = generator.columns()  # O(m)
+    session = AnalysisSession(generator.toDataFrame(), unetching, etching, generator.RI_values())  # O(n·m)
+    return RICalibration.fromSession(session, references=False)  # O(n·m)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Track the first minimum of a live stream of spectra and estimate the RI")
+    parser.add_argument('--source', choices=['synthetic', 'file', 'socket'], default='synthetic')
+    parser.add_argument('--path', type=Path, help="Binary file of float64 frames (file source)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--wavelength', type=float, nargs=3, default=[1.0, 1.6, 1000], metavar=('MIN', 'MAX', 'N'),
+                        help="Wavelength axis of the frames (µm) of the file and socket sources")
+    parser.add_argument('--frames', type=int, default=5000, help="Frames of the synthetic source")
+    parser.add_argument('--rate', type=float, help="Frames per second of the synthetic source (default: as fast as possible)")
+    parser.add_argument('--calibration', type=Path, help="Folder with landslide.csv and sensitivity.csv (default: synthetic sweep)")
+    parser.add_argument('--diameter', choices=['25', '125'], default='25')
+    parser.add_argument('--window', type=float, default=0.005, help="Half width of the search window (µm)")
+    parser.add_argument('--mode', choices=['grid', 'parabolic'], default='parabolic')
+    parser.add_argument('--capacity', type=int, default=64, help="Frames of the ring buffer")
+    parser.add_argument('--replay', action='store_true', help="Track every frame instead of skipping a backlog")
+    parser.add_argument('--output', type=Path, help="CSV file for the estimates")
+    args = parser.parse_args()
+
+    Wavelength = np.linspace(args.wavelength[0], args.wavelength[1], int(args.wavelength[2]))  # O(n)
+    if args.source == 'synthetic':  # O(1)
+        source = SyntheticSource(n_frames=args.frames, rate=args.rate, etching=args.diameter == '25')
+    elif args.source == 'file':
+        source = FileTailSource(args.path, Wavelength)
+    else:
+        source = SocketSource(args.host, args.port, Wavelength)
+    from Source.analysis.riCalibration import RICalibration
+    if args.calibration is not None:  # O(m)
+        calibration = RICalibration.fromTables(args.calibration)
+    else:
+        calibration = syntheticCalibration()
+    calibration = functools.partial(calibration, diameter=args.diameter)  # O(1)
+
+    stream = RealTimeStream(source, ResonanceTracker(source.Wavelength, args.window, mode=args.mode), calibration, args.capacity,
+                            drop=not args.replay)  # O(c·n)
+    stream.run()  # O(f·n)
+    for key, value in stream.summary().items():  # O(1)
+        print(f'{key:<20} {value}')
+    if args.output is not None:  # O(h)
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        stream.estimates().to_csv(args.output, index=False)
+        print(f'Estimates saved: {args.output}')
@@ -0,0 +1,187 @@
+import ast
+import hashlib
+import importlib.util
+import inspect
+import os
+import pickle
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+
+"""
+The ResultCache class memoizes the stages of the analysis pipeline on disk. Every call is identified
+by a content hash of the stage name, its arguments and, for methods, the state of the object
+(DataFrames, arrays, spectra, files given as paths). When nothing upstream changed, the stored result is
+returned instead of recomputing the stage, so re-running after a small change only recomputes the stages
+whose inputs are different. The least recently used results are evicted when the cache exceeds max_size,
+and the hits and misses of every stage are counted. Side effects of a stage (e.g. CSV files written by
+the method) are not repeated on a hit. The key also holds the version of the code: a hash of the source of
+the module defining the stage and of every module of the same package it imports (also inside functions,
+followed transitively), so editing a function the stage calls (e.g. detectPeaks behind relevantPeaks, or
+OnlineCovariance behind AnalyzeCovariance) invalidates its results. Attributes that an object fills lazily from its own inputs (e.g. the
+accumulator of AnalyzeCovariance) are declared in its class attribute derived_attributes and left out of
+the key, so a stage gets the same key before and after another stage of the same object ran.
+"""
+
+class ResultCache:
+    def __init__(self, cache_dir, max_size=512 * 2**20):
+        self.cache_dir = Path(cache_dir)  # O(1)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)  # O(1)
+        self.max_size = max_size  # Bytes  # O(1)
+        self.stats = {}  # Stage -> [hits, misses]  # O(1)
+        self.sources = {}  # Module -> hash of its source and of the modules it imports  # O(1)
+
+    def fingerprint(self, obj, digest):
+        # Feed a content description of obj into the hash
+        if isinstance(obj, (pd.DataFrame, pd.Series)):  # O(n)
+            digest.update(type(obj).__name__.encode())
+            digest.update(repr(list(obj.columns) if isinstance(obj, pd.DataFrame) else obj.name).encode())
+            digest.update(repr(obj.dtypes.astype(str).tolist() if isinstance(obj, pd.DataFrame) else str(obj.dtype)).encode())
+            digest.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+        elif isinstance(obj, np.ndarray):  # O(n)
+            digest.update(f'ndarray{obj.dtype.str}{obj.shape}'.encode())
+            digest.update(np.ascontiguousarray(obj).tobytes() if obj.dtype != object else pickle.dumps(obj.tolist()))
+        elif isinstance(obj, Path):  # O(n)
+            # A path to a file is identified by its content
+            digest.update(f'Path:{obj}'.encode())
+            if obj.is_file():
+                with open(obj, 'rb') as file:
+                    for block in iter(lambda: file.read(1 << 20), b''):
+                        digest.update(block)
+        elif isinstance(obj, (list, tuple)):  # O(n)
+            digest.update(f'{type(obj).__name__}[{len(obj)}]'.encode())
+            for item in obj:
+                self.fingerprint(item, digest)
+        elif isinstance(obj, dict):  # O(n)
+            digest.update(f'dict[{len(obj)}]'.encode())
+            for name in sorted(obj, key=repr):
+                self.fingerprint(name, digest)
+                self.fingerprint(obj[name], digest)
+        elif obj is None or isinstance(obj, (str, bytes, int, float, complex, bool, np.generic)):  # O(1)
+            digest.update(f'{type(obj).__name__}:{obj!r}'.encode())
+        elif hasattr(obj, '__dict__'):  # O(n)
+            # Objects such as Spectrum or FindPeaks are identified by their class and attributes, except the
+            # ones listed in derived_attributes, which only hold results computed from the others
+            digest.update(f'{type(obj).__module__}.{type(obj).__qualname__}'.encode())
+            derived = getattr(type(obj), 'derived_attributes', ())
+            self.fingerprint({name: value for name, value in vars(obj).items() if name not in derived}, digest)
+        else:  # O(n)
+            digest.update(pickle.dumps(obj))
+
+    def key(self, stage, args=(), kwargs=None, instance=None):
+        digest = hashlib.sha256(stage.encode())  # O(1)
+        self.fingerprint(instance, digest)  # O(n)
+        self.fingerprint(list(args), digest)  # O(n)
+        self.fingerprint(kwargs or {}, digest)  # O(n)
+        return digest.hexdigest()  # O(1)
+
+    def code_version(self, code):
+        # Bytecode and constants; nested code objects (comprehensions) are expanded instead of using their repr, which holds a memory address
+        consts = tuple(self.code_version(const) if hasattr(const, 'co_code') else repr(const) for const in code.co_consts)  # O(c)
+        return (code.co_code, consts)  # O(1)
+
+    def module_file(self, name):
+        # Source file of a module, None for built-in or missing modules
+        module = sys.modules.get(name)  # O(1)
+        if module is not None:  # O(1)
+            return getattr(module, '__file__', None)
+        try:
+            spec = importlib.util.find_spec(name)  # O(1)
+        except (ImportError, ValueError):
+            return None
+        return spec.origin if spec is not None and spec.has_location else None  # O(1)
+
+    def imported_modules(self, name, tree):
+        # Modules of the same package imported by the module `name` (at the top or inside functions)
+        package = name.split('.')[0]  # O(1)
+        imported = set()  # O(1)
+        for node in ast.walk(tree):  # O(s)
+            if isinstance(node, ast.Import):
+                imported.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                imported.add(node.module)
+                # The names may be modules too (from package import module); the others have no file
+                imported.update(f'{node.module}.{alias.name}' for alias in node.names)
+        return sorted(module for module in imported if module.split('.')[0] == package and self.module_file(module))  # O(k log k)
+
+    def source_version(self, name):
+        # Hash of the source of a module and of the modules of its package it imports, transitively
+        if name in self.sources:  # O(1)
+            return self.sources[name]
+        digest = hashlib.sha256(name.encode())  # O(1)
+        self.sources[name] = None  # Guard against import cycles  # O(1)
+        path = self.module_file(name)  # O(1)
+        if path is not None and path.endswith('.py') and os.path.exists(path):  # O(s)
+            source = Path(path).read_bytes()
+            digest.update(source)
+            for module in self.imported_modules(name, ast.parse(source)):
+                version = self.source_version(module)
+                digest.update(f'{module}:{version}'.encode())
+        self.sources[name] = digest.hexdigest()  # O(1)
+        return self.sources[name]  # O(1)
+
+    def call(self, func, *args, **kwargs):
+        # Bound methods (e.g. analyzer.landslide) include the state of their object in the key
+        instance = getattr(func, '__self__', None)  # O(1)
+        stage = func.__qualname__  # O(1)
+        # A change in the code of the stage, or of the modules of the package it uses, also invalidates its results
+        function = inspect.unwrap(getattr(func, '__func__', func))  # Decorated stages are unwrapped  # O(1)
+        code = getattr(function, '__code__', None)  # O(1)
+        version = (self.code_version(code) if code is not None else (),
+                   self.source_version(getattr(function, '__module__', None) or ''))  # O(s), once per module
+        key = self.key(stage, (version,) + args, kwargs, instance)  # O(n)
+        path = self.cache_dir / f'{key}.pkl'  # O(1)
+        counts = self.stats.setdefault(stage, [0, 0])  # O(1)
+
+        if path.exists():  # O(1)
+            try:
+                with open(path, 'rb') as file:
+                    result = pickle.load(file)  # O(n)
+                os.utime(path)  # Mark as recently used  # O(1)
+                counts[0] += 1  # O(1)
+                return result  # O(1)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                path.unlink(missing_ok=True)  # Damaged entry, compute it again  # O(1)
+
+        result = func(*args, **kwargs)  # Stage
+        counts[1] += 1  # O(1)
+        temporary = path.with_suffix('.tmp')  # O(1)
+        with open(temporary, 'wb') as file:
+            pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)  # O(n)
+        os.replace(temporary, path)  # O(1)
+        self.evict()  # O(k log k)
+        return result  # O(1)
+
+    def memoize(self, func):
+        # Decorator version of call
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        wrapper.__name__ = func.__name__  # O(1)
+        wrapper.__qualname__ = func.__qualname__  # O(1)
+        wrapper.__doc__ = func.__doc__  # O(1)
+        return wrapper  # O(1)
+
+    def size(self):
+        return sum(path.stat().st_size for path in self.cache_dir.glob('*.pkl'))  # O(k)
+
+    def evict(self):
+        entries = sorted(((path.stat().st_mtime, path.stat().st_size, path) for path in self.cache_dir.glob('*.pkl')))  # O(k log k)
+        total = sum(size for _, size, _ in entries)  # O(k)
+        for _, size, path in entries:  # O(k), oldest first
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for path in self.cache_dir.glob('*.pkl'):  # O(k)
+            path.unlink(missing_ok=True)
+
+    def report(self):
+        report = pd.DataFrame([{'Stage': stage, 'Hits': hits, 'Misses': misses} for stage, (hits, misses) in self.stats.items()],
+                              columns=['Stage', 'Hits', 'Misses'])  # O(k)
+        return report  # O(1)
+
+    # This code has a computational time complexity of O(n)
@@ -1,26 +1,275 @@
+import hashlib
+import json
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+from Source.utils.stageProfiler import PROFILER
+
+"""
+The RunningStats class accumulates the mean and the variance of several columns in a single pass. 
+Each block of rows is reduced to its count, mean and sum of squared deviations, which are merged with 
+the totals (Chan/Welford update). Partial results of different chunks can also be merged, so the z-score 
+statistics of a file larger than memory are obtained without loading it at once.
+"""
+
+class RunningStats:
+    def __init__(self, columns):
+        self.columns = list(columns)  # O(1)
+        self.count = 0  # O(1)
+        self.mean = np.zeros(len(self.columns))  # O(m)
+        self.M2 = np.zeros(len(self.columns))  # Sum of squared deviations from the mean  # O(m)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)  # O(n·m)
+        if len(values) == 0:  # O(1)
+            return self
+        mean = values.mean(axis=0)  # O(n·m)
+        M2 = ((values - mean) ** 2).sum(axis=0)  # O(n·m)
+        return self._combine(len(values), mean, M2)  # O(m)
+
+    def merge(self, other):
+        return self._combine(other.count, other.mean, other.M2)  # O(m)
+
+    def _combine(self, count, mean, M2):
+        if count == 0:  # O(1)
+            return self
+        total = self.count + count  # O(1)
+        delta = mean - self.mean  # O(m)
+        self.mean = self.mean + delta * count / total  # O(m)
+        self.M2 = self.M2 + M2 + delta ** 2 * self.count * count / total  # O(m)
+        self.count = total  # O(1)
+        return self  # O(1)
+
+    @property
+    def std(self):
+        # Sample standard deviation (ddof=1), the same used by pandas
+        return np.sqrt(self.M2 / (self.count - 1)) if self.count > 1 else np.full(len(self.columns), np.nan)  # O(m)
+
+    def to_frame(self):
+        return pd.DataFrame({'mean': self.mean, 'std': self.std}, index=self.columns)  # O(m)
+
+"""
+The ZScoreNormalizer class separates the z-score in a fit and a transform step. fit computes the mean and the
+standard deviation of every column in one vectorized pass (partial_fit accumulates them chunk by chunk with
+RunningStats, for files larger than memory); transform applies them to any DataFrame with the same columns,
+e.g. new measurements normalised against the calibration set. The input is never modified: the normalised
+columns are written into one new array (float32 halves its memory) and the other columns are shared with the
+input. The statistics are kept in float64 and can be saved to and loaded from a .json file.
+"""
+
+class ZScoreNormalizer:
+    def __init__(self, columns=None, dtype=np.float64):
+        self.columns = None if columns is None else list(columns)  # O(1)
+        self.dtype = np.dtype(dtype)  # O(1)
+        self.stats = None if columns is None else RunningStats(self.columns)  # O(m)
+
+    @property
+    def mean(self):
+        return self.stats.mean  # O(1)
+
+    @property
+    def std(self):
+        return self.stats.std  # O(m)
+
+    def partial_fit(self, Data, columns=None):
+        # Accumulate the statistics of one more block of rows
+        if self.stats is None:  # O(m)
+            self.columns = list(columns if columns is not None else Data.columns)
+            self.stats = RunningStats(self.columns)
+        self.stats.update(Data[self.columns].to_numpy(dtype=float))  # O(n·m)
+        return self  # O(1)
+
+    def fit(self, Data, columns=None):
+        self.stats = None  # O(1)
+        if columns is not None:  # O(1)
+            self.columns = list(columns)
+        return self.partial_fit(Data, self.columns)  # O(n·m)
+
+    def transform(self, Data, dtype=None):
+        if self.stats is None or self.stats.count == 0:  # O(1)
+            raise ValueError("The normalizer is not fitted, call fit or partial_fit first")
+        dtype = self.dtype if dtype is None else np.dtype(dtype)  # O(1)
+        missing = [col for col in self.columns if col not in Data.columns]  # O(m)
+        if missing:  # O(1)
+            raise ValueError(f"Columns {missing} of the normalisation statistics are not in the data")
+        values = Data[self.columns].to_numpy()  # O(1) for a single float block, O(n·m) otherwise
+        # Column-major output, so every normalised column is a contiguous slice the DataFrame can share
+        out = np.empty(values.shape, dtype=dtype, order='F')  # O(n·m)
+        np.subtract(values, self.mean.astype(dtype), out=out, casting='unsafe')  # O(n·m)
+        np.divide(out, self.std.astype(dtype), out=out)  # O(n·m)
+        position = {col: j for j, col in enumerate(self.columns)}  # O(m)
+        return pd.DataFrame({col: out[:, position[col]] if col in position else Data[col] for col in Data.columns},
+                            index=Data.index, copy=False)  # O(m)
+
+    def fit_transform(self, Data, columns=None, dtype=None):
+        return self.fit(Data, columns).transform(Data, dtype)  # O(n·m)
+
+    def to_frame(self):
+        return self.stats.to_frame()  # O(m)
+
+    def to_dict(self):
+        # Same layout as the 'normalization' entry of the binary cache metadata
+        return {col: {'mean': float(mean), 'std': float(std)} for col, mean, std in zip(self.columns, self.mean, self.std)}  # O(m)
+
+    @classmethod
+    def from_dict(cls, normalization, count=2, M2=None, dtype=np.float64):
+        # Without M2 it is rebuilt from the std, which gives back the same std up to rounding
+        normalizer = cls(normalization, dtype)  # O(m)
+        normalizer.stats.count = count  # O(1)
+        normalizer.stats.mean = np.array([normalization[col]['mean'] for col in normalizer.columns])  # O(m)
+        if M2 is None:  # O(m)
+            M2 = {col: normalization[col]['std'] ** 2 * (count - 1) for col in normalizer.columns}
+        normalizer.stats.M2 = np.array([M2[col] for col in normalizer.columns])  # O(m)
+        return normalizer  # O(1)
+
+    def save(self, path):
+        path = Path(path)  # O(1)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # The sums of squared deviations are saved too, so the loaded std is exact and partial_fit can go on
+        content = {'count': int(self.stats.count), 'dtype': self.dtype.name, 'normalization': self.to_dict(),
+                   'M2': {col: float(M2) for col, M2 in zip(self.columns, self.stats.M2)}}  # O(m)
+        path.write_text(json.dumps(content, indent=2, ensure_ascii=False), encoding='utf-8')  # O(m)
+        return path  # O(1)
+
+    @classmethod
+    def load(cls, path, dtype=None):
+        content = json.loads(Path(path).read_text(encoding='utf-8'))  # O(m)
+        return cls.from_dict(content['normalization'], content['count'], content.get('M2'),
+                             content['dtype'] if dtype is None else dtype)  # O(m)
+
+    # This code has a computational time complexity of O(n·m), n rows and m columns
+
 """
 The Preprocessing class is defined, which includes methods to read data from a CSV file, 
 filter by a specific range of wavelengths (1.04 to 1.43 µm), normalise specific 
-columns using z-score and save the resulting DataFrame already processed.
+columns using z-score and save the resulting DataFrame already processed. 
+For measured (noisy) spectra, denoise applies an optional stage to all the columns at once: smoothing 
+(Savitzky-Golay, moving average or FFT low-pass), baseline removal and an estimate of the noise level, 
+from which the peak detection parameters (distance and prominence) are chosen automatically. 
+The processed spectra can also be stored in a binary cache (a memory-mappable .npy array plus a .json 
+file with the wavelength range, the normalisation statistics and the column to RI mapping), which is 
+reused while the raw file and the parameters do not change. The z-score statistics are saved next to the 
+processed file (Data_processed_normalization.json), so new measurements can be normalised with the statistics 
+of the calibration set by passing them as `normalizer`.
 """
 
 class Preprocessing:                                        
     def __init__(self, min_range=1.04, max_range=1.43):   
             self.min_range = min_range  # O(1)    
             self.max_range = max_range  # O(1)        
+            self.unetching = ['RI_Water', 'RI_B', 'RI_C', 'RI_D', 'RI_E', 'RI_F']  # O(1)
+            self.etching = ['RI_Water_etching', 'RI_B_etching', 'RI_C_etching', 'RI_D_etching', 'RI_E_etching', 'RI_F_etching']  # O(1)
+            self.RI_values = ['1.33', '1.35', '1.37', '1.39', '1.40', '1.41']  # O(1)
+            self.normalization_stats = None  # Mean and std of the last normalisation  # O(1)
+            self.normalizer = None  # ZScoreNormalizer of the last normalisation  # O(1)
+            self.noise_level = None  # Noise of every column estimated by denoise  # O(1)
+            self.peak_parameters = None  # find_peaks parameters chosen by denoise  # O(1)
 
+    @PROFILER.stage()
     def read_data(self, path):
         return pd.read_csv(path)  # O(n)    
 
+    @PROFILER.stage()
     def wavelength_range_Data(self, Data, col = 'Wavelength'):
         return Data[(Data[col] >= self.min_range) & (Data[col] <= self.max_range)]  # O(n)    
 
-    def normalize_RI(self, Data, columns):
-        Data[columns] = Data[columns].transform(lambda x: ((x-x.mean())/x.std()))  # O(n)  
-        return Data
+    @PROFILER.stage()
+    def normalize_RI(self, Data, columns, dtype=np.float64):
+        # z-score with the statistics of Data itself; a new DataFrame is returned
+        self.normalizer = ZScoreNormalizer(columns, dtype).fit(Data)  # O(n)
+        self.normalization_stats = self.normalizer.to_frame()  # O(m)
+        return self.normalizer.transform(Data)  # O(n)
+
+    @PROFILER.stage()
+    def apply_normalization(self, Data, normalizer, dtype=None):
+        # z-score with statistics fitted before (a ZScoreNormalizer or the path of its .json file)
+        if not isinstance(normalizer, ZScoreNormalizer):  # O(m)
+            normalizer = ZScoreNormalizer.load(normalizer)
+        self.normalizer = normalizer  # O(1)
+        self.normalization_stats = normalizer.to_frame()  # O(m)
+        return normalizer.transform(Data, dtype)  # O(n)
+
+    def normalization_path(self, save_path):
+        # File of the z-score statistics, next to the processed data
+        save_path = Path(save_path)  # O(1)
+        return save_path.with_name(f'{save_path.stem}_normalization.json')  # O(1)
+
+    @PROFILER.stage()
+    def estimate_noise(self, Data, columns):
+        # Standard deviation of the noise of every column from the MAD of the second differences,
+        # which cancel the smooth part of the spectrum (a difference of white noise has 6 times its variance)
+        second = np.diff(Data[columns].to_numpy(dtype=float), n=2, axis=0)  # O(n)
+        mad = np.median(np.abs(second - np.median(second, axis=0)), axis=0)  # O(n)
+        return pd.Series(mad / 0.6745 / np.sqrt(6), index=columns)  # O(m)
+
+    @PROFILER.stage()
+    def smooth(self, Data, columns, method='savgol', window=11, polyorder=3, cutoff=0.05):
+        # Smooth all the columns at once along the wavelength axis; a new DataFrame is returned
+        # method: 'savgol' (window, polyorder), 'moving' (window) or 'fft' (cutoff, fraction of the Nyquist frequency kept)
+        values = Data[columns].to_numpy(dtype=float)  # O(n)
+        if method == 'savgol':  # O(n·w)
+            from scipy.signal import savgol_filter
+            values = savgol_filter(values, window, polyorder, axis=0, mode='interp')
+        elif method == 'moving':  # O(n)
+            # Centred mean of `window` samples, the edges repeat the first and last values
+            padded = np.pad(values, ((window // 2, window - 1 - window // 2), (0, 0)), mode='edge')
+            cumulative = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(padded, axis=0)])
+            values = (cumulative[window:] - cumulative[:-window]) / window
+        elif method == 'fft':  # O(n log n)
+            # The line joining both ends is removed first, so the ends do not wrap around as a step
+            line = np.linspace(values[0], values[-1], len(values))
+            spectrum = np.fft.rfft(values - line, axis=0)
+            spectrum[int(cutoff * (len(spectrum) - 1)) + 1:] = 0
+            values = np.fft.irfft(spectrum, n=len(values), axis=0) + line
+        else:
+            raise ValueError(f"Unknown smoothing method: {method}")
+        Data = Data.copy()  # O(n)
+        Data[columns] = values  # O(n)
+        return Data  # O(1)
+
+    @PROFILER.stage()
+    def remove_baseline(self, Data, columns, degree=2, iterations=20, col='Wavelength'):
+        # Polynomial baseline of every column fitted to the upper envelope: after every fit the dips are
+        # raised to the fitted curve, so they stop pulling the baseline down. One least-squares solve per
+        # iteration fits all the columns.
+        x = Data[col].to_numpy(dtype=float)  # O(n)
+        x = (2 * x - x.min() - x.max()) / (x.max() - x.min())  # O(n), scaled to [-1, 1] for a well conditioned fit
+        V = np.vander(x, degree + 1)  # O(n·d)
+        values = Data[columns].to_numpy(dtype=float)  # O(n)
+        envelope = values  # O(1)
+        for _ in range(iterations):  # O(i·n·d)
+            baseline = V @ np.linalg.lstsq(V, envelope, rcond=None)[0]
+            envelope = np.maximum(values, baseline)
+        Data = Data.copy()  # O(n)
+        Data[columns] = values - baseline  # O(n)
+        return Data  # O(1)
+
+    @PROFILER.stage()
+    def denoise(self, Data, columns, smoothing='savgol', window=11, polyorder=3, cutoff=0.05, baseline=False,
+                degree=2, k=3.0):
+        # Optional stage before the peak detection; smoothing=None skips the smoothing
+        self.noise_level = self.estimate_noise(Data, columns)  # O(n), measured on the data as given
+        level = self.noise_level.to_numpy()  # O(m)
+        if smoothing is not None:  # O(n)
+            Smoothed = self.smooth(Data, columns, smoothing, window, polyorder, cutoff)
+            # What the smoothing removed (noise, but also ripples of the low-pass) also sets the level a dip must exceed
+            residual = Data[columns].to_numpy(dtype=float) - Smoothed[columns].to_numpy(dtype=float)
+            level = np.maximum(level, np.median(np.abs(residual - np.median(residual, axis=0)), axis=0) / 0.6745)
+            Data = Smoothed
+        if baseline:  # O(n)
+            Data = self.remove_baseline(Data, columns, degree)
+        # A dip must stand k noise deviations above its surroundings; minima closer than the resolution of the
+        # smoothing (the window, or half the shortest period kept by the low-pass) cannot be told apart.
+        # The neighbour threshold is left out, the prominence replaces it.
+        prominence = k * float(np.median(level))  # O(m)
+        if smoothing is None:  # O(1)
+            # Nothing sets a resolution without smoothing: the default distance and threshold of detectPeaks are kept
+            self.peak_parameters = {'threshold': 0.0001, 'distance': 50, 'prominence': prominence}
+            return Data
+        resolution = {'savgol': window, 'moving': window, 'fft': int(1 / cutoff)}[smoothing]  # O(1)
+        self.peak_parameters = {'threshold': None, 'distance': max(1, resolution), 'prominence': prominence}  # O(m)
+        return Data  # O(1)
 
     #def pre_Data_SP(path):
     #    unetching = ['RI_Water', 'RI_B', 'RI_C', 'RI_D', 'RI_E', 'RI_F']
@@ -29,21 +278,166 @@ class Preprocessing:
     #    Data = normalize_RI(Data, unetching)
     #    return Data
 
-    def pre_Data_1104(self, path, save_path=None):
-        unetching = ['RI_Water', 'RI_B', 'RI_C', 'RI_D', 'RI_E', 'RI_F']  # O(1)
-        etching = ['RI_Water_etching', 'RI_B_etching', 'RI_C_etching', 'RI_D_etching', 'RI_E_etching', 'RI_F_etching']  # O(1)
+    @PROFILER.stage()
+    def process_Data_1104(self, path, normalizer=None):
+        # Read, cut to the wavelength range and normalise, without writing any file
+        # normalizer: statistics of a previous dataset (ZScoreNormalizer or .json path); None fits them on this one
+        unetching = self.unetching  # O(1)
+        etching = self.etching  # O(1)
         Data = self.read_data(path)  # O(n)
         Data = self.wavelength_range_Data(Data, col = 'Wavelength')  # O(n)
-        Data = self.normalize_RI(Data, unetching + etching)  # O(n)
+        if normalizer is None:  # O(n)
+            Data = self.normalize_RI(Data, unetching + etching)
+        else:
+            Data = self.apply_normalization(Data, normalizer)
+        return Data  # O(1)
+
+    @PROFILER.stage()
+    def save_csv(self, Data, save_path):
+        # Text export of the processed data, with the normalisation statistics next to it
+        save_path = Path(save_path)  # O(1)
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        Data.to_csv(save_path, index=False)  # O(n)   
+        print(f'DataFrame saved: {save_path}')  # O(1)
+        self.normalizer.save(self.normalization_path(save_path))  # O(m)
+
+    @PROFILER.stage()
+    def pre_Data_1104(self, path, save_path=None, normalizer=None):
+        Data = self.process_Data_1104(path, normalizer)  # O(n)
 
         # Save the dataset in the range min_range = 1.04 and max_range = 1.43.
         if save_path is None:  # O(1)
             save_path = Path("Data")/"processed"/"Data_processed.csv"   # O(1)
+        self.save_csv(Data, save_path)  # O(n)
+
+        return Data  # O(1)
+
+    @PROFILER.stage()
+    def file_hash(self, path, block_size=1 << 20):
+        digest = hashlib.sha256()  # O(1)
+        with open(path, 'rb') as file:  # O(n)
+            for block in iter(lambda: file.read(block_size), b''):
+                digest.update(block)
+        return digest.hexdigest()  # O(1)
+
+    def raw_stat(self, path):
+        # Size, modification time and change time of a raw file. The change time is set by the system on every
+        # write (and on every change of the modification time), so unlike the modification time it can not be
+        # restored: a file rewritten in place with the same size and its old modification time is still detected.
+        stat = Path(path).stat()  # O(1)
+        return {'raw_size': stat.st_size, 'raw_mtime_ns': stat.st_mtime_ns, 'raw_ctime_ns': stat.st_ctime_ns}  # O(1)
 
+    def columns_metadata(self):
+        # Column to RI and MMF diameter mapping
+        mapping = {col: {'RI': ri, 'MMF Diameter': '125 µm'} for col, ri in zip(self.unetching, self.RI_values)}  # O(m)
+        mapping.update({col: {'RI': ri, 'MMF Diameter': '25 µm'} for col, ri in zip(self.etching, self.RI_values)})  # O(m)
+        return mapping  # O(1)
+
+    @PROFILER.stage()
+    def save_binary(self, Data, cache_path, metadata):
+        cache_path = Path(cache_path)  # O(1)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Column-major order: every column is contiguous and the DataFrame can wrap it without copying
+        np.save(cache_path.with_suffix('.npy'), np.asfortranarray(Data.to_numpy(dtype=float)))  # O(n)
+        # Row labels of the wavelength range: the first one when consecutive (the usual case), otherwise all of them
+        index = Data.index.to_numpy()  # O(n)
+        consecutive = len(index) > 0 and np.array_equal(index, np.arange(index[0], index[0] + len(index)))  # O(n)
+        metadata = dict(metadata, columns=list(Data.columns),
+                        index={'start': int(index[0])} if consecutive else [int(label) for label in index])  # O(m), O(n) if not consecutive
+        # The metadata is written last, so an interrupted write is never taken as a valid cache
+        cache_path.with_suffix('.json').write_text(json.dumps(metadata, indent=2, ensure_ascii=False), encoding='utf-8')  # O(m)
+
+    @PROFILER.stage()
+    def load_binary(self, cache_path):
+        cache_path = Path(cache_path)  # O(1)
+        metadata = json.loads(cache_path.with_suffix('.json').read_text(encoding='utf-8'))  # O(m)
+        values = np.load(cache_path.with_suffix('.npy'), mmap_mode='r')  # O(1), zero-copy memory map
+        index = metadata['index']  # O(1)
+        index = pd.Index(np.arange(index['start'], index['start'] + len(values)) if isinstance(index, dict) else index)  # O(n)
+        # Same row labels as the DataFrame returned by pre_Data_1104
+        Data = pd.DataFrame(np.asarray(values), index=index, columns=metadata['columns'], copy=False)  # O(1)
+        return Data, metadata  # O(1)
+
+    @PROFILER.stage()
+    def load_Data_1104(self, path, cache_path=None, save_path=None, normalizer=None):
+        # Binary cache of pre_Data_1104, reused while the raw file and the parameters are unchanged. Only the
+        # binary copy is written; save_path optionally also exports the CSV when the cache is rebuilt.
+        # normalizer: statistics of a previous dataset (ZScoreNormalizer or .json path), part of the parameters
+        if cache_path is None:  # O(1)
+            cache_path = Path("Data")/"processed"/"Data_processed"  # O(1)
+        cache_path = Path(cache_path)  # O(1)
+        raw = self.raw_stat(path)  # O(1)
+        parameters = {'min_range': self.min_range, 'max_range': self.max_range, 'columns': self.unetching + self.etching}  # O(1)
+        if normalizer is not None:  # O(m), data normalised with other statistics is a different cache entry
+            if not isinstance(normalizer, ZScoreNormalizer):
+                normalizer = ZScoreNormalizer.load(normalizer)
+            parameters['normalization'] = normalizer.to_dict()
+
+        metadata_path = cache_path.with_suffix('.json')  # O(1)
+        if metadata_path.exists() and cache_path.with_suffix('.npy').exists():  # O(1)
+            metadata = json.loads(metadata_path.read_text(encoding='utf-8'))  # O(m)
+            if metadata.get('parameters') == parameters and 'index' in metadata:  # O(1), older caches without the row labels are rebuilt
+                # The hash is only recomputed when the size, the modification or the change time of the raw file changed
+                same_file = all(metadata.get(name) == value for name, value in raw.items())  # O(1)
+                if same_file or metadata.get('raw_hash') == self.file_hash(path):  # O(n)
+                    if not same_file:  # O(m), same content (e.g. a copied file): its new times avoid hashing it again
+                        metadata_path.write_text(json.dumps(dict(metadata, **raw), indent=2, ensure_ascii=False), encoding='utf-8')
+                    Data, metadata = self.load_binary(cache_path)  # O(1)
+                    self.normalizer = ZScoreNormalizer.from_dict(metadata['normalization'], metadata.get('count', 2), metadata.get('M2'))  # O(m)
+                    self.normalization_stats = self.normalizer.to_frame()  # O(m)
+                    print(f'DataFrame loaded from cache: {cache_path.with_suffix(".npy")}')  # O(1)
+                    return Data  # O(1)
+
+        Data = self.process_Data_1104(path, normalizer)  # O(n)
+        if save_path is not None:  # O(n), optional text export
+            self.save_csv(Data, save_path)
+        metadata = {
+            'raw_file': str(path),
+            'raw_hash': self.file_hash(path),
+            **raw,
+            'parameters': parameters,
+            'wavelength_range': [float(Data['Wavelength'].min()), float(Data['Wavelength'].max())],
+            'normalization': self.normalizer.to_dict(),
+            'count': int(self.normalizer.stats.count),
+            'M2': {col: float(M2) for col, M2 in zip(self.normalizer.columns, self.normalizer.stats.M2)},
+            'RI_mapping': self.columns_metadata()}  # O(m)
+        self.save_binary(Data, cache_path, metadata)  # O(n)
+        self.normalizer.save(self.normalization_path(cache_path))  # O(m)
+        print(f'DataFrame cached: {cache_path.with_suffix(".npy")}')  # O(1)
+
+        # Return the cached copy, so the first run and the following ones work on the same DataFrame
+        Data, metadata = self.load_binary(cache_path)  # O(1)
+        return Data  # O(1)
+
+    @PROFILER.stage()
+    def stream_Data_1104(self, path, save_path=None, chunksize=100_000, normalizer=None):
+        # Same output as pre_Data_1104, but the CSV is read in chunks so the memory is bounded by chunksize
+        columns = self.unetching + self.etching  # O(1)
+        if save_path is None:  # O(1)
+            save_path = Path("Data")/"processed"/"Data_processed.csv"   # O(1)
+        save_path = Path(save_path)  # O(1)
+
+        # First pass: running mean and variance of the rows in the wavelength range
+        # (skipped when the statistics of a previous dataset are given as normalizer)
+        if normalizer is None:  # O(n)
+            normalizer = ZScoreNormalizer(columns)
+            for chunk in pd.read_csv(path, chunksize=chunksize):
+                normalizer.partial_fit(self.wavelength_range_Data(chunk, col = 'Wavelength'))
+        elif not isinstance(normalizer, ZScoreNormalizer):  # O(m)
+            normalizer = ZScoreNormalizer.load(normalizer)
+        self.normalizer = normalizer  # O(1)
+        self.normalization_stats = normalizer.to_frame()  # O(m)
+
+        # Second pass: apply the z-score and append every chunk to the output file
         save_path.parent.mkdir(parents=True, exist_ok=True)
-        Data.to_csv(save_path, index=False)  # O(n)   
+        first = True  # O(1)
+        for chunk in pd.read_csv(path, chunksize=chunksize):  # O(n)
+            chunk = normalizer.transform(self.wavelength_range_Data(chunk, col = 'Wavelength'))  # O(k)
+            chunk.to_csv(save_path, mode='w' if first else 'a', header=first, index=False)  # O(k)
+            first = False  # O(1)
         print(f'DataFrame saved: {save_path}')  # O(1)
+        normalizer.save(self.normalization_path(save_path))  # O(m)
 
-        return Data  # O(1)
+        return self.normalization_stats  # O(1)
 
     # This code has a computational time complexity of O(n)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+
+"""
+The SyntheticSpectra class generates SMS-like transmission spectra to test and benchmark the pipeline
+without FIMMWAVE simulations. Every spectrum is a flat baseline in dB with Lorentzian resonance dips,
+whose wavelength shifts linearly with the refractive index (RI) of the surrounding medium; the etched
+(25 µm) fibre shifts faster than the unetched (125 µm) one. The number of points, the number of RI, the
+resonances and the noise are configurable. The columns follow the names of the FIMMWAVE exports
+(RI_X for 125 µm and RI_X_etching for 25 µm), so the result can be used directly by Preprocessing.
+"""
+
+class SyntheticSpectra:
+    def __init__(self, n_points=1000, n_RI=6, min_wavelength=1.0, max_wavelength=1.6,
+                 resonances=(1.07, 1.17, 1.34), width=0.01, depth=4.0, baseline=-8.0,
+                 shift_125=0.1, shift_25=0.6, noise=0.02, seed=0):
+        self.n_points = n_points  # O(1)
+        self.n_RI = n_RI  # O(1)
+        self.min_wavelength = min_wavelength  # O(1)
+        self.max_wavelength = max_wavelength  # O(1)
+        self.resonances = np.asarray(resonances, dtype=float)  # Resonance wavelengths at RI 1.33  # O(r)
+        self.width = width  # Full width at half depth (µm)  # O(1)
+        self.depth = depth  # dB  # O(1)
+        self.baseline = baseline  # dB  # O(1)
+        self.shift_125 = shift_125  # Resonance shift per RI unit (µm/RIU) for 125 µm  # O(1)
+        self.shift_25 = shift_25  # Resonance shift per RI unit (µm/RIU) for 25 µm  # O(1)
+        self.noise = noise  # Standard deviation of the noise (dB)  # O(1)
+        self.seed = seed  # O(1)
+
+    def wavelength(self):
+        return np.linspace(self.min_wavelength, self.max_wavelength, self.n_points)  # O(n)
+
+    def RI_values(self):
+        return np.round(np.linspace(1.33, 1.41, self.n_RI), 6)  # O(m)
+
+    def columns(self):
+        unetching = [f'RI_{i}' for i in range(self.n_RI)]  # O(m)
+        etching = [f'RI_{i}_etching' for i in range(self.n_RI)]  # O(m)
+        return unetching, etching  # O(1)
+
+    def transmission(self, Wavelength, shift, rng):
+        # (n_RI x n_points) matrix with the dips of every RI
+        centres = self.resonances[None, :] + shift * (self.RI_values()[:, None] - 1.33)  # O(m·r)
+        Transmission = np.full((self.n_RI, len(Wavelength)), self.baseline)  # O(n·m)
+        for k in range(centres.shape[1]):  # O(r·n·m)
+            Transmission -= self.depth / (1 + ((Wavelength[None, :] - centres[:, k, None]) / (self.width / 2)) ** 2)
+        if self.noise > 0:  # O(1)
+            Transmission += rng.normal(0, self.noise, Transmission.shape)  # O(n·m)
+        return Transmission  # O(1)
+
+    def spectra(self):
+        # Wavelength, 125 µm and 25 µm transmission matrices (n_RI x n_points)
+        rng = np.random.default_rng(self.seed)  # O(1)
+        Wavelength = self.wavelength()  # O(n)
+        return Wavelength, self.transmission(Wavelength, self.shift_125, rng), self.transmission(Wavelength, self.shift_25, rng)  # O(r·n·m)
+
+    def toDataFrame(self):
+        Wavelength, Transmission, TransmissionEtching = self.spectra()  # O(r·n·m)
+        unetching, etching = self.columns()  # O(m)
+        # Same column order as the FIMMWAVE exports: Wavelength, RI_X, RI_X_etching, ...
+        Data = {'Wavelength': Wavelength}  # O(1)
+        for i in range(self.n_RI):  # O(n·m)
+            Data[unetching[i]] = Transmission[i]
+            Data[etching[i]] = TransmissionEtching[i]
+        return pd.DataFrame(Data)  # O(n·m)
+
+    def toCSV(self, path):
+        path = Path(path)  # O(1)
+        path.parent.mkdir(parents=True, exist_ok=True)  # O(1)
+        Data = self.toDataFrame()  # O(r·n·m)
+        Data.to_csv(path, index=False)  # O(n·m)
+        return path  # O(1)
+
+    # This code has a computational time complexity of O(r·n·m)
@@ -0,0 +1,138 @@
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+
+"""
+The StageProfiler class instruments the stages of the pipeline. Methods decorated with
+@PROFILER.stage() (or blocks inside `with PROFILER.span(name):`) record their wall time, CPU time,
+peak memory (tracemalloc, only when memory=True) and input size (number of elements of the DataFrames,
+arrays and lists they receive, including those held by the object of a method). While the profiler is
+disabled, a decorated method only pays one attribute check. The records can be saved as JSON, as a
+Chrome trace (chrome://tracing or https://ui.perfetto.dev) and summarised as a table per stage. One stage
+can also be captured with cProfile. Stages that run inside worker processes are not recorded. The module
+belongs to Source/utils, so the preprocessing and analysis layers use it without importing the pipeline.
+"""
+
+def _size(obj, depth=2):
+    # Number of elements of the data given to a stage
+    if hasattr(obj, 'shape') and hasattr(obj, 'size'):  # O(1), DataFrame, Series, ndarray
+        return int(obj.size)
+    if isinstance(obj, (list, tuple)):  # O(1)
+        return len(obj)
+    if depth > 0 and hasattr(obj, '__dict__') and not isinstance(obj, type):  # O(a), data held by an object (e.g. the spectra of an analyzer)
+        return sum(_size(value, depth - 1) for value in vars(obj).values())
+    return 0  # O(1)
+
+
+class StageProfiler:
+    def __init__(self):
+        self.enabled = False  # O(1)
+        self.memory = False  # O(1)
+        self.profile_stage = None  # O(1)
+        self.reset()  # O(1)
+
+    def reset(self):
+        self.records = []  # O(1)
+        self.profile = None  # cProfile of profile_stage  # O(1)
+        self._peaks = []  # Running peak memory of the open stages  # O(1)
+        self._origin = time.perf_counter()  # O(1)
+
+    def enable(self, memory=False, profile_stage=None):
+        self.enabled = True  # O(1)
+        self.memory = memory  # O(1)
+        self.profile_stage = profile_stage  # Name of the stage captured with cProfile  # O(1)
+        if memory and not tracemalloc.is_tracing():  # O(1)
+            tracemalloc.start()
+        return self  # O(1)
+
+    def disable(self):
+        self.enabled = False  # O(1)
+        if self.memory and tracemalloc.is_tracing():  # O(1)
+            tracemalloc.stop()
+        return self  # O(1)
+
+    def stage(self, name=None):
+        # Decorator; the stage is named after the qualified name of the function by default
+        def decorator(func):
+            stage_name = name or func.__qualname__  # O(1)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(stage_name, *args, *kwargs.values()):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def span(self, name, *inputs):
+        if not self.enabled:  # O(1)
+            yield
+            return
+        input_size = sum(_size(obj) for obj in inputs)  # O(k)
+        if self.memory:  # O(1)
+            # The peak reached so far belongs to the enclosing stage, then it is measured again for this one
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+        profiling = name == self.profile_stage  # O(1)
+        if profiling:  # O(1)
+            self.profile = self.profile or cProfile.Profile()
+            self.profile.enable()
+        start, cpu = time.perf_counter(), time.process_time()  # O(1)
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - start, time.process_time() - cpu  # O(1)
+            if profiling:  # O(1)
+                self.profile.disable()
+            peak = None  # O(1)
+            if self.memory:  # O(1)
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+            self.records.append({'stage': name, 'start': start - self._origin, 'wall': wall, 'cpu': cpu,
+                                 'peak_memory': peak, 'input_size': input_size,
+                                 'pid': os.getpid(), 'tid': threading.get_ident()})  # O(1)
+
+    def summary(self):
+        import pandas as pd
+        columns = ['stage', 'wall', 'cpu', 'peak_memory', 'input_size']  # O(1)
+        records = pd.DataFrame(self.records, columns=columns + ['start', 'pid', 'tid'])  # O(k)
+        table = records.groupby('stage', sort=False).agg(calls=('wall', 'size'), wall_total=('wall', 'sum'), wall_mean=('wall', 'mean'),
+                                                         cpu_total=('cpu', 'sum'), peak_memory=('peak_memory', 'max'),
+                                                         input_size=('input_size', 'max'))  # O(k)
+        return table.sort_values('wall_total', ascending=False)  # O(k log k)
+
+    def to_chrome_trace(self):
+        # Complete events ("X") with microsecond timestamps
+        events = [{'name': record['stage'], 'cat': 'stage', 'ph': 'X', 'ts': record['start'] * 1e6, 'dur': record['wall'] * 1e6,
+                   'pid': record['pid'], 'tid': record['tid'],
+                   'args': {'cpu_s': record['cpu'], 'peak_memory': record['peak_memory'], 'input_size': record['input_size']}}
+                  for record in self.records]  # O(k)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}  # O(1)
+
+    def save(self, folder):
+        folder = Path(folder)  # O(1)
+        folder.mkdir(parents=True, exist_ok=True)  # O(1)
+        (folder / 'stages.json').write_text(json.dumps(self.records, indent=2), encoding='utf-8')  # O(k)
+        (folder / 'trace.json').write_text(json.dumps(self.to_chrome_trace()), encoding='utf-8')  # O(k)
+        self.summary().to_csv(folder / 'stages_summary.csv')  # O(k)
+        if self.profile is not None:  # O(1)
+            self.profile.dump_stats(folder / f'{self.profile_stage}.prof')
+        print(f'Profile saved: {folder}')  # O(1)
+
+    # This code has a computational time complexity of O(k), k being the number of records
+
+
+# Profiler shared by all the modules of Source
+PROFILER = StageProfiler()
@@ -1,175 +1,332 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
 import pandas as pd
 import numpy as np
+import multiprocessing
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-from Source.analysis.spectrumAnalyze import Spectrum, AnalyzeSpectrum, Sensitivity, AnalyzeCovariance
-from Source.analysis.featuresANDstaticalanalyze import FindPeaks, StaticalAnalysis
-
+from Source.analysis.peakFeatureStore import PeakFeatureStore
+from Source.visualization.decimation import decimate
+from Source.utils.stageProfiler import PROFILER
+
+
+"""
+Drawing functions. Each one receives the path of the figure and the small arrays already computed
+by the Visualizer (no analysis is repeated here), draws the figure and saves it. The spectra arrive as
+traces, one (wavelength, transmission) pair per spectrum, already decimated when they are long. They are defined at
+module level so they can be sent to the worker processes of the parallel rendering mode.
+matplotlib and seaborn are imported when the first figure is drawn, not when this module is imported.
+"""
+
+@PROFILER.stage('Visualizer.savefig')
+def _savefig(file_figure):
+    import matplotlib.pyplot as plt
+    plt.savefig(file_figure, dpi=300)  # O(1)
+
+def _draw_transmission_spectra(file_figure, Transmission, TransmissionEtching, RI_values, colors):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(2, 3, figsize=(12, 6))  # O(1)
+    ax = ax.flatten()  # O(1)
+    for i in range(len(RI_values)):  # O(n
+        ax[i].plot(*Transmission[i], '--', color=colors[i+2], label=f'RI {RI_values[i]} - 125 µm')
+        ax[i].plot(*TransmissionEtching[i], '-', color=colors[i], label=f'RI {RI_values[i]} - 25 µm')
+        ax[i].set_title(f"RI = {RI_values[i]}")
+        ax[i].set_xlabel('Wavelength (µm)')
+        ax[i].set_ylabel('Transmission (dB)')
+        ax[i].legend()
+    #ax[-1].set_axis_off()
+    plt.tight_layout()  # O(1)
+    _savefig(file_figure)  # O(1)
+    plt.close()  # O(1)
+
+def _draw_landslide(file_figure, result_landslide):
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(8, 5))  # O(1)
+    plt.plot(result_landslide['RI'], result_landslide['min_125'], 'o--', label='125 µm')  # O(1)
+    plt.plot(result_landslide['RI'], result_landslide['min_25'], '*-', label='25 µm')  # O(1)
+    plt.title('First peak movement')  # O(1)
+    plt.xlabel('Refractive Index (RI)')  # O(1)
+    plt.ylabel('Wavelength ($\lambda$ = ($\mu m$))')  # O(1)
+    plt.legend()  # O(1)
+    plt.grid(True)  # O(1)
+    plt.tight_layout()  # O(1)
+    _savefig(file_figure)  # O(1)
+    plt.close()  # O(1)
+
+def _draw_sensitivity(file_figure, result_Sensitivity):
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(8, 5))  # O(1)
+    plt.plot(result_Sensitivity['RI'], result_Sensitivity['sensitivity 125'], '--o', label='125 µm')  # O(1)
+    plt.plot(result_Sensitivity['RI'], result_Sensitivity['sensitivity 25'], '-s', label='25 µm')  # O(1)
+    plt.title('Sensitivity in relation to the first movement of the peak')  # O(1)
+    plt.xlabel('Refractive Index (RI)')  # O(1)
+    plt.ylabel('Sensivity ($\Delta \mu m$/$\Delta RI$)')  # O(1)
+    plt.legend()  # O(1)
+    plt.grid(True)  # O(1)
+    plt.tight_layout()  # O(1)
+    _savefig(file_figure)  # O(1)
+    plt.close()  # O(1)
+
+def _draw_heatmap_diameter(file_figure, unetchingCov, etchingCov):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    fig, ax = plt.subplots(1, 2, figsize=(12, 5))
+    sns.heatmap(unetchingCov, annot=True, cmap='viridis', square=True, ax=ax[0])  # O(1)
+    ax[0].set_title('Heatmap MMF unetching')  # O(1)
+
+    sns.heatmap(etchingCov, annot=True, cmap='viridis', square=True, ax=ax[1])  # O(1)
+    ax[1].set_title('Heatmap MMF etching')  # O(1)
+
+    plt.tight_layout()  # O(1)
+    _savefig(file_figure)  # O(1)
+    plt.close()  # O(1)
+
+def _draw_heatmap_RI(file_figure, RICov, RI_values):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    fig, ax = plt.subplots(1, len(RI_values), figsize=(15, 6))  # O(1)
+    fig.suptitle('Heatmap for every RI unetching and etching')  # O(1)
+
+    color_map = sns.color_palette("viridis", as_cmap=True)  # O(1)
+
+    for i in range(len(RI_values)):  # O(n)
+        sns.heatmap(RICov[i], annot=True, cmap='viridis', square=True, ax=ax[i])
+        ax[i].set_title(f'RI = {RI_values[i]}')
+
+    plt.tight_layout(rect=[0, 0, 1, 0.95])   # O(1)
+    _savefig(file_figure)  # O(1)
+    plt.close()  # O(1)
+
+def _draw_relevant_peaks(file_figure, Transmission, TransmissionEtching, peaks, peaksEtching, RI, colors):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(nrows=2, ncols=1, figsize=(12, 10))  # O(1)
+
+    for i, ri in enumerate(RI):  # O(n)
+        ax[0].plot(*Transmission[i], label=f'RI {ri} - 125 µm', color=colors[i])
+        # Plot relevant peaks (wavelength, transmission)
+        if len(peaks[i][0]):
+            ax[0].plot(peaks[i][0], peaks[i][1], 'o', color=colors[i])
+
+        ax[1].plot(*TransmissionEtching[i], label=f'RI {ri} - 25 µm', color=colors[i])
+        if len(peaksEtching[i][0]):
+            ax[1].plot(peaksEtching[i][0], peaksEtching[i][1], 'o', color=colors[i])
+
+    ax[0].set_xlabel('Wavelength ($\lambda$)')  # O(1)
+    ax[0].set_ylabel("Transmission (dB)")  # O(1)
+    ax[0].set_title('Transmission spectrum for 125$\mu m$')  # O(1)
+    ax[0].legend()  # O(1)
+
+    ax[1].set_xlabel('Wavelength ($\lambda$)')  # O(1)
+    ax[1].set_ylabel("Transmission (dB)")  # O(1)
+    ax[1].set_title('Transmission spectrum for 25$\mu m$')  # O(1)
+    ax[1].legend()  # O(1)
+
+    fig.tight_layout()  # O(1)
+    _savefig(file_figure)  # O(1)
+    plt.close()  # O(1)
+
+def _draw_histograms(file_figure, Features_Data):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    features = ['Wavelength', 'Transmission', 'Spectral width','Prominence']  # O(1)
+    plt.figure(figsize=(12, 10))  # O(1)
+    for i, feature in enumerate(features):  # O(1)
+        plt.subplot(2, 2, i + 1)  # O(1)
+        sns.histplot(Features_Data[feature], kde=True)  # O(n)
+        plt.title(f'Distribution of {feature}')  # O(1)
+    plt.tight_layout()  # O(1)
+    _savefig(file_figure)  # O(1)
+    plt.close()  # O(1)
+
+def _draw_KDE(file_figure, features_df):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    features = ['Wavelength', 'Transmission', 'Spectral width','Prominence']  # O(1)
+    plt.figure(figsize=(12, 10))  # O(1)
+    for i, feature in enumerate(features):  # O(1)
+        plt.subplot(2, 2, i + 1)  # O(1)
+        sns.kdeplot(data=features_df, x=feature, hue='MMF Diameter', fill=True, alpha=0.4)  # O(n)
+        plt.title(f'Density of {feature} by MMF Diameter')  # O(1)
+    plt.tight_layout()  # O(1)
+    _savefig(file_figure)  # O(1)
+    plt.close()  # O(1)
+
+def _render_job(draw, file_figure, payload):
+    # Draw one figure and measure how long it took, the payload arrives pickled
+    start = time.perf_counter()  # O(1)
+    with PROFILER.span(f'Visualizer.draw {Path(file_figure).name}'):
+        draw(file_figure, *pickle.loads(payload))  # O(n)
+    return Path(file_figure).name, time.perf_counter() - start  # O(1)
+
+def _init_worker():
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')  # Workers render off-screen  # O(1)
+
+
+"""
+The Visualizer class generates and saves the figures of the report. Every method first computes
+the data of its figure (peaks, covariances, landslide...) in the main process and then hands the
+drawing to a module-level function. With workers=None the figures are drawn one after another;
+with workers=k the drawing of independent figures is sent to a pool of k processes (Agg backend),
+which only receive the small precomputed arrays. wait() returns when every file is written and
+reports the time spent on each figure. Results already computed (e.g. by an AnalysisSession) can be
+passed to the plotting methods, so nothing is computed twice. The pool is started with fork; on
+platforms without fork the figures are drawn in the main process. With figures=False (compute-only mode)
+nothing is drawn or computed for the figures (plot_relevant_peaks still returns the peaks), and
+matplotlib and seaborn are never loaded.
+Spectra longer than max_points samples are decimated before they are drawn (see decimation.py, 'minmax'
+or 'lttb'), so the time spent on a figure does not grow with the length of the spectra. The global
+minimum, the first minimum (1.16 to 1.23 µm) and the relevant peaks of every spectrum are always drawn.
+max_points=None draws every sample.
+"""
 
 class Visualizer:
-    def __init__(self, save_figure, result_save):
+    def __init__(self, save_figure, result_save, workers=None, figures=True, max_points=4000, decimation='minmax'):
+        self.figures = figures  # O(1)
+        self.max_points = max_points  # Samples drawn per spectrum, about two per pixel of a 300 dpi report figure  # O(1)
+        self.decimation = decimation  # O(1)
         self.save_figure = Path(save_figure)  # O(1)
         self.result_save = Path(result_save)  # O(1)
 
         self.save_figure.mkdir(parents=True, exist_ok=True)  # O(1)
         self.result_save.mkdir(parents=True, exist_ok=True)  # O(1)
 
+        if workers is not None and 'fork' not in multiprocessing.get_all_start_methods():  # O(1)
+            print('Parallel rendering needs fork, figures will be drawn in the main process')  # O(1)
+            workers = None  # O(1)
+        self.workers = workers  # O(1)
+        self.pool = None  # O(1)
+        self.pending = []  # Figures sent to the pool  # O(1)
+        self.timings = []  # (figure, seconds)  # O(1)
+
+    def _render(self, draw, file_name, *payload):
+        if not self.figures:  # O(1)
+            return
+        file_figure = self.save_figure / file_name  # O(1)
+        # The payload is pickled now, so later changes of the caller's data do not reach the figure
+        payload = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)  # O(n)
+        if self.workers is None:  # O(1)
+            self.timings.append(_render_job(draw, file_figure, payload))  # O(n)
+            return
+        if self.pool is None:  # O(1)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'),
+                                            initializer=_init_worker)  # O(k)
+        self.pending.append(self.pool.submit(_render_job, draw, file_figure, payload))  # O(1)
+
+    def wait(self):
+        # Wait for every figure in the pool and return the time spent on each one
+        for future in self.pending:  # O(k)
+            self.timings.append(future.result())
+        self.pending = []  # O(1)
+        timings = pd.DataFrame(self.timings, columns=['Figure', 'Seconds'])  # O(k)
+        self.timings = []  # O(1)
+        return timings  # O(1)
+
+    def close(self):
+        timings = self.wait()  # O(k)
+        if self.pool is not None:  # O(1)
+            self.pool.shutdown()  # O(k)
+            self.pool = None  # O(1)
+        return timings  # O(1)
+
+    def _traces(self, Wavelength, Transmission, keep=None):
+        # (wavelength, transmission) of every spectrum, decimated when it has more than max_points samples
+        Wavelength = np.asarray(Wavelength, dtype=float)  # O(n)
+        Transmission = np.atleast_2d(np.asarray(Transmission, dtype=float))  # O(n·m)
+        if self.max_points is None or Transmission.shape[1] <= self.max_points:  # O(m)
+            return [(Wavelength, row) for row in Transmission]
+        # The global minimum and the first minimum of every spectrum are kept with the given samples
+        minima = [Transmission.argmin(axis=1)]  # O(n·m)
+        interval = np.flatnonzero((Wavelength >= 1.16) & (Wavelength <= 1.23))  # O(n)
+        if len(interval):  # O(n·m)
+            minima.append(interval[Transmission[:, interval].argmin(axis=1)])
+        minima = np.stack(minima, axis=1)  # O(m)
+        keep = minima if keep is None else [np.concatenate([row, kept]) for row, kept in zip(minima, keep)]  # O(m)
+        index = decimate(Wavelength, Transmission, self.max_points, keep, self.decimation)  # O(n·m)
+        return [(Wavelength[i], row[i]) for row, i in zip(Transmission, index)]  # O(m·p)
+
+    @PROFILER.stage()
     def plot_transmission_spectra(self, Data, unetching, etching, RI_values, colors):
-        fig, ax = plt.subplots(2, 3, figsize=(12, 6))  # O(1)
-        ax = ax.flatten()  # O(1)
-        for i in range(len(RI_values)):  # O(n
-            ax[i].plot(Data['Wavelength'], Data[unetching[i]], '--', color=colors[i+2], label=f'RI {RI_values[i]} - 125 µm')
-            ax[i].plot(Data['Wavelength'], Data[etching[i]], '-', color=colors[i], label=f'RI {RI_values[i]} - 25 µm')
-            ax[i].set_title(f"RI = {RI_values[i]}")
-            ax[i].set_xlabel('Wavelength (µm)')
-            ax[i].set_ylabel('Transmission (dB)')
-            ax[i].legend()
-        #ax[-1].set_axis_off()
-        plt.tight_layout()  # O(1)
-        file_figure = self.save_figure / "1_spectra_by_RI.png"  # O(1)
-        plt.savefig(file_figure, dpi=300)  # O(1)
-        plt.close()  # O(1)
-
-    def plotLandslide(self, Data, unetching, etching, RI_values):
-        spectra = [Spectrum(Data['Wavelength'], Data[unetching[i]], Data[etching[i]], RI_values[i]) for i in range(len(RI_values))]  # O(n)
-        analyzer = AnalyzeSpectrum(spectra)  # O(1)
-        result_landslide = analyzer.landslide()  # O(1)
-
-        plt.figure(figsize=(8, 5))  # O(1)
-        plt.plot(result_landslide['RI'], result_landslide['min_125'], 'o--', label='125 µm')  # O(1)
-        plt.plot(result_landslide['RI'], result_landslide['min_25'], '*-', label='25 µm')  # O(1)
-        plt.title('First peak movement')  # O(1)
-        plt.xlabel('Refractive Index (RI)')  # O(1)
-        plt.ylabel('Wavelength ($\lambda$ = ($\mu m$))')  # O(1)
-        plt.legend()  # O(1)
-        plt.grid(True)  # O(1)
-        plt.tight_layout()  # O(1)
-        file_figure = self.save_figure / "2_first_peak_landslide.png"  # O(1)
-        plt.savefig(file_figure, dpi=300)  # O(1)
-        plt.close()  # O(1)
-
-    def plotSensitivity(self, Data, unetching, etching, RI_values):
-        spectra = [Spectrum(Data['Wavelength'], Data[unetching[i]], Data[etching[i]], RI_values[i]) for i in range(len(RI_values))]  # O(n)
-        analyzerSensitivity = Sensitivity(spectra)  # O(1)
-        result_Sensitivity = analyzerSensitivity.gradient()  # O(n)
-
-        plt.figure(figsize=(8, 5))  # O(1)
-        plt.plot(result_Sensitivity['RI'], result_Sensitivity['sensitivity 125'], '--o', label='125 µm')  # O(1)
-        plt.plot(result_Sensitivity['RI'], result_Sensitivity['sensitivity 25'], '-s', label='25 µm')  # O(1)
-        plt.title('Sensitivity in relation to the first movement of the peak')  # O(1)
-        plt.xlabel('Refractive Index (RI)')  # O(1)
-        plt.ylabel('Sensivity ($\Delta \mu m$/$\Delta RI$)')  # O(1)
-        plt.legend()  # O(1)
-        plt.grid(True)  # O(1)
-        plt.tight_layout()  # O(1)
-        file_figure = self.save_figure / "3_sensitivity.png"  # O(1)
-        plt.savefig(file_figure, dpi=300)  # O(1)
-        plt.close()  # O(1)
-
-    def plotHeatmaps(self, Data, unetching, etching, RI_values):
-        analyzerCovariance = AnalyzeCovariance(Data, unetching, etching)
-
-        fig, ax = plt.subplots(1, 2, figsize=(12, 5))
-        sns.heatmap(analyzerCovariance.unetchingCov(), annot=True, cmap='viridis', square=True, ax=ax[0])  # O(1)
-        ax[0].set_title('Heatmap MMF unetching')  # O(1)
-
-        sns.heatmap(analyzerCovariance.etchingCov(), annot=True, cmap='viridis', square=True, ax=ax[1])  # O(1)
-        ax[1].set_title('Heatmap MMF etching')  # O(1)
-
-        plt.tight_layout()  # O(1)
-        file_figure = self.save_figure / "4_Heatmap_MMFDiameter.png"  # O(1)
-        plt.savefig(file_figure, dpi=300)  # O(1)
-        plt.close()  # O(1)
-
-        fig, ax = plt.subplots(1, len(RI_values), figsize=(15, 6))  # O(1)
-        fig.suptitle('Heatmap for every RI unetching and etching')  # O(1)
-
-        color_map = sns.color_palette("viridis", as_cmap=True)  # O(1)
-
-        for i in range(len(RI_values)):  # O(n)
-            MMFdiameter_cov = Data[[unetching[i], etching[i]]].cov()
-            sns.heatmap(MMFdiameter_cov, annot=True, cmap='viridis', square=True, ax=ax[i])
-            ax[i].set_title(f'RI = {RI_values[i]}')
-
-        plt.tight_layout(rect=[0, 0, 1, 0.95])   # O(1)
-        file_figure = self.save_figure / "4b_Heatmap_all_RI.png"  # O(1)
-        plt.savefig(file_figure, dpi=300)  # O(1)
-        plt.close()  # O(1)
-
-    def plot_relevant_peaks(self, Data, RI, unetching, etching, colors):
-        relevant_peak_data = []  # O(1)
-        fig, ax = plt.subplots(nrows=2, ncols=1, figsize=(12, 10))  # O(1)
-
-        for i, (ri, col_unetch, col_etch) in enumerate(zip(RI, unetching, etching)):  # O(n)
-            
-            analyzer_125 = FindPeaks(Data['Wavelength'], Data[col_unetch], ri, "125 µm", results=self.save_figure)
-            analyzer_125.detectPeaks()
-            features_125 = analyzer_125.analyzePeaks()
-            relevant_peak_data.extend(features_125)
-
-            
-            ax[0].plot(Data['Wavelength'], Data[col_unetch], label=f'RI {ri} - 125 µm', color=colors[i])
-
-            # Plot relevant peaks
-            peaks_125 = pd.DataFrame(features_125)
-            if not peaks_125.empty:
-                ax[0].plot(peaks_125['Wavelength'], peaks_125['Transmission'], 'o', color=colors[i])
-
-            
-            analyzer_25 = FindPeaks(Data['Wavelength'], Data[col_etch], ri, "25 µm", results=self.save_figure)
-            analyzer_25.detectPeaks()
-            features_25 = analyzer_25.analyzePeaks()
-            relevant_peak_data.extend(features_25)
-
-            ax[1].plot(Data['Wavelength'], Data[col_etch], label=f'RI {ri} - 25 µm', color=colors[i])
-            peaks_25 = pd.DataFrame(features_25)
-            if not peaks_25.empty:
-                ax[1].plot(peaks_25['Wavelength'], peaks_25['Transmission'], 'o', color=colors[i])
-
-        
-        ax[0].set_xlabel('Wavelength ($\lambda$)')  # O(1)
-        ax[0].set_ylabel("Transmission (dB)")  # O(1)
-        ax[0].set_title('Transmission spectrum for 125$\mu m$')  # O(1)
-        ax[0].legend()  # O(1)
-
-        ax[1].set_xlabel('Wavelength ($\lambda$)')  # O(1)
-        ax[1].set_ylabel("Transmission (dB)")  # O(1)
-        ax[1].set_title('Transmission spectrum for 25$\mu m$')  # O(1)
-        ax[1].legend()  # O(1)
-
-        fig.tight_layout()  # O(1)
-        file_figure = self.save_figure / "5_relevant_peaks_combined.png"  # O(1)
-        plt.savefig(file_figure, dpi=300)  # O(1)
-        plt.close()  # O(1)
-
-        return pd.DataFrame(relevant_peak_data)  # O(n)
-
+        if not self.figures:  # O(1)
+            return
+        Wavelength = Data['Wavelength'].to_numpy()  # O(n)
+        Transmission = self._traces(Wavelength, Data[list(unetching[:len(RI_values)])].to_numpy().T)  # O(n)
+        TransmissionEtching = self._traces(Wavelength, Data[list(etching[:len(RI_values)])].to_numpy().T)  # O(n)
+        self._render(_draw_transmission_spectra, "1_spectra_by_RI.png",
+                     Transmission, TransmissionEtching, list(RI_values), list(colors))  # O(p)
+
+    @PROFILER.stage()
+    def plotLandslide(self, Data, unetching, etching, RI_values, result_landslide=None):
+        # The landslide is only computed when it is not given
+        if result_landslide is None and self.figures:  # O(1)
+            from Source.analysis.spectrumAnalyze import SpectrumBatch, AnalyzeSpectrum
+            analyzer = AnalyzeSpectrum(SpectrumBatch.fromDataFrame(Data, unetching[:len(RI_values)], etching[:len(RI_values)], RI_values))  # O(n)
+            result_landslide = analyzer.landslide()  # O(n)
+
+        self._render(_draw_landslide, "2_first_peak_landslide.png", result_landslide)  # O(1)
+
+    @PROFILER.stage()
+    def plotSensitivity(self, Data, unetching, etching, RI_values, result_Sensitivity=None):
+        if result_Sensitivity is None and self.figures:  # O(1)
+            from Source.analysis.spectrumAnalyze import SpectrumBatch, Sensitivity
+            analyzerSensitivity = Sensitivity(SpectrumBatch.fromDataFrame(Data, unetching[:len(RI_values)], etching[:len(RI_values)], RI_values))  # O(n)
+            result_Sensitivity = analyzerSensitivity.gradient()  # O(n)
+
+        self._render(_draw_sensitivity, "3_sensitivity.png", result_Sensitivity)  # O(1)
+
+    @PROFILER.stage()
+    def plotHeatmaps(self, Data, unetching, etching, RI_values, covariances=None):
+        # covariances: {'unetching': DataFrame, 'etching': DataFrame, 'RI': [DataFrame per RI]}
+        if covariances is None and self.figures:  # O(1)
+            from Source.analysis.spectrumAnalyze import AnalyzeCovariance
+            analyzerCovariance = AnalyzeCovariance(Data, unetching, etching)  # O(1)
+            covariances = {'unetching': analyzerCovariance.unetchingCov(), 'etching': analyzerCovariance.etchingCov(),
+                           'RI': analyzerCovariance.RICov()}  # O(n)
+
+        self._render(_draw_heatmap_diameter, "4_Heatmap_MMFDiameter.png", covariances['unetching'], covariances['etching'])  # O(1)
+        self._render(_draw_heatmap_RI, "4b_Heatmap_all_RI.png", covariances['RI'][:len(RI_values)], list(RI_values))  # O(1)
+
+    @PROFILER.stage()
+    def plot_relevant_peaks(self, Data, RI, unetching, etching, colors, relevant_peak_data=None):
+        if relevant_peak_data is None:  # O(1)
+            from Source.analysis.featuresANDstaticalanalyze import BatchFindPeaks
+            # Detect the relevant peaks of every column at once, 125 µm and 25 µm alternated for each RI
+            columns = [col for pair in zip(unetching, etching) for col in pair]  # O(n)
+            analyzer = BatchFindPeaks.fromDataFrame(Data, columns, np.repeat(RI, 2), ["125 µm", "25 µm"] * len(RI))  # O(n)
+            relevant_peak_data = analyzer.detectPeaks().analyzePeaks()  # O(n)
+
+        if not self.figures:  # O(1)
+            return relevant_peak_data
+
+        # Wavelength and transmission of the relevant peaks of every spectrum, selected by the category codes
+        store = PeakFeatureStore.fromFrame(relevant_peak_data)  # O(p log p)
+        Wavelength = store.column('Wavelength')  # O(1)
+        Transmission = store.column('Transmission')  # O(1)
+        peaks, peaksEtching = [], []  # O(1)
+        for ri in RI:  # O(n)
+            for label, selected in (("125 µm", peaks), ("25 µm", peaksEtching)):
+                mask = store.mask(MMFDiameter=label, RI=ri)
+                selected.append((Wavelength[mask], Transmission[mask]))
+
+        # The samples around the relevant peaks are kept when the spectra are decimated
+        axis = Data['Wavelength'].to_numpy()  # O(n)
+        def samples(found):
+            return [np.concatenate([index - 1, index]) for index in (np.searchsorted(axis, wavelength) for wavelength, _ in found)]  # O(p log n)
+        self._render(_draw_relevant_peaks, "5_relevant_peaks_combined.png",
+                     self._traces(axis, Data[list(unetching[:len(RI)])].to_numpy().T, samples(peaks)),
+                     self._traces(axis, Data[list(etching[:len(RI)])].to_numpy().T, samples(peaksEtching)),
+                     peaks, peaksEtching, list(RI), list(colors))  # O(n)
+
+        return relevant_peak_data  # O(1)
+
+    @PROFILER.stage()
     def plot_histograms(self, Features_Data):
-        features = ['Wavelength', 'Transmission', 'Spectral width','Prominence']  # O(1)
-        plt.figure(figsize=(12, 10))  # O(1)
-        for i, feature in enumerate(features):  # O(1)
-            plt.subplot(2, 2, i + 1)  # O(1)
-            sns.histplot(Features_Data[feature], kde=True)  # O(n)
-            plt.title(f'Distribution of {feature}')  # O(1)
-        plt.tight_layout()  # O(1)
-        file_figure = self.save_figure / "6_histogram.png"  # O(1)
-        plt.savefig(file_figure, dpi=300)  # O(1)
-        plt.close()  # O(1)
+        self._render(_draw_histograms, "6_histogram.png", Features_Data)  # O(n)
 
+    @PROFILER.stage()
     def plot_KDE(self, features_df):
-        features = ['Wavelength', 'Transmission', 'Spectral width','Prominence']  # O(1)
-        plt.figure(figsize=(12, 10))  # O(1)
-        for i, feature in enumerate(features):  # O(1)
-            plt.subplot(2, 2, i + 1)  # O(1)
-            sns.kdeplot(data=features_df, x=feature, hue='MMF Diameter', fill=True, alpha=0.4)  # O(n)
-            plt.title(f'Density of {feature} by MMF Diameter')  # O(1)
-        plt.tight_layout()  # O(1)
-        file_figure = self.save_figure / "7_density_by_group.png"  # O(1)
-        plt.savefig(file_figure, dpi=300)  # O(1)
-        plt.close()  # O(1)
+        self._render(_draw_KDE, "7_density_by_group.png", features_df)  # O(n)
 
 
    # This code has a computational time complexity of O(n)
-
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+"""
+Decimation of long spectra before drawing them. A figure can only show as many distinct points as it
+has pixels across, so a trace with millions of samples is reduced to the samples that change the
+drawing. Both functions return, for every row of Transmission, the sorted indices of the samples to
+draw; the samples given in `keep` (e.g. the first minimum or the detected peaks) are always included.
+- minmaxDecimate: the axis is split in n_buckets buckets of consecutive samples and the lowest and the
+  highest sample of every bucket are kept (plus the first and last sample). The envelope of the trace, and
+  therefore every minimum that is the lowest point of its bucket, is drawn exactly. Vectorized over all the rows.
+- lttbDecimate: Largest-Triangle-Three-Buckets; one sample per bucket, the one forming the largest
+  triangle with the sample kept in the previous bucket and the mean of the next bucket. It keeps the
+  visual shape with fewer points, but only the samples in keep are guaranteed.
+"""
+
+def _withKept(index, keep, n_points):
+    # Union of the indices of every row with the indices to keep of that row
+    if keep is None:  # O(1)
+        return list(index)
+    return [np.union1d(row, np.clip(np.asarray(kept, dtype=np.intp), 0, n_points - 1)) for row, kept in zip(index, keep)]  # O(m·b log b)
+
+
+def minmaxDecimate(Transmission, n_buckets, keep=None):
+    # Transmission: (n_spectra x n_points); keep: indices to keep of every spectrum (one array per row)
+    Transmission = np.atleast_2d(Transmission)  # O(1)
+    n_spectra, n_points = Transmission.shape  # O(1)
+    size = -(-n_points // max(1, n_buckets))  # Samples per bucket  # O(1)
+    if size <= 2:  # O(n·m), every sample is drawn anyway
+        return _withKept(np.broadcast_to(np.arange(n_points), (n_spectra, n_points)), keep, n_points)
+    n_buckets = -(-n_points // size)  # O(1)
+    # Pad the last bucket with its last sample, so every bucket has the same size
+    padded = np.empty((n_spectra, n_buckets * size), dtype=Transmission.dtype)  # O(n·m)
+    padded[:, :n_points] = Transmission  # O(n·m)
+    padded[:, n_points:] = Transmission[:, -1:]  # O(m)
+    buckets = padded.reshape(n_spectra, n_buckets, size)  # O(1)
+    start = np.arange(n_buckets) * size  # O(b)
+    lowest = np.minimum(start + buckets.argmin(axis=2), n_points - 1)  # O(n·m)
+    highest = np.minimum(start + buckets.argmax(axis=2), n_points - 1)  # O(n·m)
+    edges = np.broadcast_to([0, n_points - 1], (n_spectra, 2))  # O(m)
+    index = np.sort(np.concatenate([lowest, highest, edges], axis=1), axis=1)  # O(m·b log b)
+    # Drop repeated indices (the lowest and highest sample of a flat bucket can be the same)
+    index = [row[np.concatenate(([True], row[1:] != row[:-1]))] for row in index]  # O(m·b)
+    return _withKept(index, keep, n_points)  # O(m·b log b)
+
+
+def lttbDecimate(Wavelength, Transmission, n_buckets, keep=None):
+    Wavelength = np.asarray(Wavelength, dtype=float)  # O(n)
+    Transmission = np.atleast_2d(Transmission)  # O(1)
+    n_spectra, n_points = Transmission.shape  # O(1)
+    if n_buckets + 2 >= n_points:  # O(n·m)
+        return _withKept(np.broadcast_to(np.arange(n_points), (n_spectra, n_points)), keep, n_points)
+    # Bucket bounds of the inner samples; the first and last samples are their own buckets
+    bounds = np.linspace(1, n_points - 1, n_buckets + 1).astype(np.intp)  # O(b)
+    # Mean of every bucket, for all the rows at once (the third point of the triangles)
+    counts = np.diff(bounds)  # O(b)
+    x_mean = np.add.reduceat(Wavelength[1:n_points - 1], bounds[:-1] - 1) / counts  # O(n)
+    y_mean = np.add.reduceat(Transmission[:, 1:n_points - 1], bounds[:-1] - 1, axis=1) / counts  # O(n·m)
+    x_mean = np.append(x_mean, Wavelength[-1])  # O(b)
+    y_mean = np.concatenate([y_mean, Transmission[:, -1:]], axis=1)  # O(m·b)
+
+    index = np.empty((n_spectra, n_buckets + 2), dtype=np.intp)  # O(m·b)
+    index[:, 0], index[:, -1] = 0, n_points - 1  # O(m)
+    rows = np.arange(n_spectra)  # O(m)
+    for k in range(n_buckets):  # O(n·m), one bucket of every row at a time
+        previous = index[:, k]
+        candidates = np.arange(bounds[k], bounds[k + 1])
+        x_prev, y_prev = Wavelength[previous][:, None], Transmission[rows, previous][:, None]
+        # Twice the area of the triangle (previous sample, candidate, mean of the next bucket)
+        area = np.abs((x_prev - x_mean[k + 1]) * (Transmission[:, candidates] - y_prev)
+                      - (x_prev - Wavelength[candidates][None, :]) * (y_mean[:, k + 1, None] - y_prev))
+        index[:, k + 1] = candidates[area.argmax(axis=1)]
+    return _withKept(index, keep, n_points)  # O(m·b log b)
+
+
+def decimate(Wavelength, Transmission, max_points, keep=None, method='minmax'):
+    # Indices of the samples of every row to draw, at most about max_points (plus the kept samples)
+    if method == 'minmax':  # O(n·m)
+        return minmaxDecimate(Transmission, max_points // 2, keep)
+    if method == 'lttb':  # O(n·m)
+        return lttbDecimate(Wavelength, Transmission, max(1, max_points - 2), keep)
+    raise ValueError(f"Unknown method '{method}', use 'minmax' or 'lttb'")
+
+# This code has a computational time complexity of O(n·m), n points and m spectra
@@ -9,11 +9,11 @@ It includes the following steps:
 
 1. loading and pre-processing of transmission spectrum data. 
 2. Visualisation of spectra and landslide of the first minimum peak.
-3. Calculation of the sensitivity to refractive index variations.
+3. Calculation of the sensitivity to refractive index variations, and its inverse calibration (RI from the spectra).
 4. Covariance analysis to explore relationships between fibre diameters and different media. 
 5. Detection of relevant peaks in the spectrum based on their prominence and spectral width.
 6. Statistical analysis of extracted features, including normality tests (Shapiro), 
- comparison (ANOVA) and non-parametric tests (Wilcoxon). 
+ comparison (ANOVA), non-parametric tests (Wilcoxon) and resampling (bootstrap, permutation). 
 7. generate graphs (spectra, displacements, heat maps, histograms, KDE). 
 
 All results, graphs and tables are saved in the specified folders within the project.
@@ -24,14 +24,24 @@ project_root = Path(__file__).resolve().parents[1]  # O(1)
 sys.path.append(str(project_root))  # O(1)
 
 from Source.preprocessing.preprocessing_Data import Preprocessing
-from Source.analysis.spectrumAnalyze import Spectrum, AnalyzeSpectrum, Sensitivity, AnalyzeCovariance
-from Source.analysis.featuresANDstaticalanalyze import FindPeaks, StaticalAnalysis
+from Source.analysis.featuresANDstaticalanalyze import StaticalAnalysis, GroupedStatistics
+from Source.analysis.analysisSession import AnalysisSession
+from Source.analysis.resampling import Resampling
+from Source.analysis.peakFeatureStore import PeakFeatureStore
+from Source.analysis.riCalibration import RICalibration
 from Source.visualization.Visualization2 import Visualizer
+from Source.pipeline.resultCache import ResultCache
+from Source.utils.stageProfiler import PROFILER
+
+# Optional profiling of the stages: SMS_PROFILE=1 (and SMS_PROFILE_STAGE=<stage> to capture it with cProfile)
+if os.environ.get('SMS_PROFILE'):  # O(1)
+    PROFILER.enable(memory=True, profile_stage=os.environ.get('SMS_PROFILE_STAGE'))  # O(1)
 
 # Load Data
 data_path = Path("Data") / "raw" / "Data_1104.csv"
 preprocessor = Preprocessing()
-Original_Data = preprocessor.pre_Data_1104(data_path)  # O(N)
+# O(N), reuses the binary cache when the raw file is unchanged; the CSV export is only rewritten with the cache
+Original_Data = preprocessor.load_Data_1104(data_path, save_path=Path("Data")/"processed"/"Data_processed.csv")
 
 # list of values RI for every column
 RI = ['1.33', '1.35', '1.37', '1.39', '1.40', '1.41']  # O(1)
@@ -43,50 +53,68 @@ save_figure = "Results/figures"  # O(1)
 result_save = "Results/tables" #O(1)
 data_processed = "Data/processed" #O(1)
 
-visualizer = Visualizer(save_figure, result_save)  # O(1)
+# Figures are drawn in parallel by a pool of processes (in the main process while profiling, so drawing is recorded)
+# SMS_COMPUTE_ONLY=1 runs the analysis without figures, matplotlib and seaborn are not loaded
+visualizer = Visualizer(save_figure, result_save, workers=None if PROFILER.enabled else os.cpu_count(),
+                        figures=not os.environ.get('SMS_COMPUTE_ONLY'))  # O(1)
+
+# Results of the analysis stages are reused while their inputs do not change
+cache = ResultCache(Path(data_processed) / "cache")  # O(1)
 
 
 # Spectrum plot
 visualizer.plot_transmission_spectra(Original_Data, unetching, etching, RI, colors)  # O(n)
 
+# Every derived quantity is computed once by the session and shared with the figures
+session = AnalysisSession(Original_Data, unetching, etching, RI, cache=cache)  # O(1)
+
 # Landslide
-spectra = [Spectrum(Original_Data['Wavelength'], Original_Data[unetching[i]], Original_Data[etching[i]], RI[i]) for i in range(len(RI))]  # O(n)
-analyzer = AnalyzeSpectrum(spectra)  # O(1)
-result_landslide = analyzer.landslide()  # O(1)
+result_landslide = session.landslide  # O(n)
 print('First peak movement')  # O(1)
 print(result_landslide)  # O(1)
-visualizer.plotLandslide(Original_Data, unetching, etching, RI)  # O(n)
+visualizer.plotLandslide(Original_Data, unetching, etching, RI, result_landslide=result_landslide)  # O(1)
 
 # Sensitivity
-sensitivity = Sensitivity(spectra)  # O(1)
-result_Sensitivity = sensitivity.gradient()  # O(n)
+result_Sensitivity = session.sensitivity  # O(n)
 print('Sensitivity')  # O(1)
 print(result_Sensitivity)  # O(1)
-visualizer.plotSensitivity(Original_Data, unetching, etching, RI)  # O(n)
+visualizer.plotSensitivity(Original_Data, unetching, etching, RI, result_Sensitivity=result_Sensitivity)  # O(1)
+
+# Inverse calibration: the RI is estimated back from the first minimum of every spectrum
+calibration = RICalibration.fromSession(session)  # O(n·m)
+calibration.save(Path(data_processed) / "RI_calibration")  # O(n·m)
+RI_estimates = pd.DataFrame({'RI': session.spectra.RI,
+                             'RI 125 µm': calibration.estimate_RI(session.spectra, '125'),
+                             'RI 25 µm': calibration.estimate_RI(session.spectra, '25')})  # O(n·m)
+print('RI estimated from the spectra')  # O(1)
+print(RI_estimates)  # O(1)
+RI_estimates.to_csv(Path(result_save) / 'RI_estimates.csv', index=False)  # O(m)
 
 # AnalyzeCovariance
-analyzerCovariance = AnalyzeCovariance(Original_Data, unetching, etching)  # O(1)
 print('Covariance')
+covariances = session.covariance  # O(n²)
+print("125 µm:\n", covariances['unetching'])  # O(1)
+print("25 µm:\n", covariances['etching'])  # O(1)
 
-unetch_cov = analyzerCovariance.unetchingCov() # O(n²)
-print("125 µm:\n", unetch_cov)  # O(1)
-
-etch_cov = analyzerCovariance.etchingCov()# O(n²)
-print("25 µm:\n", etch_cov)  # O(1)
-
-visualizer.plotHeatmaps(Original_Data, unetching, etching, RI)  # O(n)
+visualizer.plotHeatmaps(Original_Data, unetching, etching, RI, covariances=covariances)  # O(1)
 
 # Relevant peaks 
 print("Relevant peaks detection")
-features_Data = visualizer.plot_relevant_peaks(Original_Data, RI, unetching, etching, colors)  # O(n)
+features_Data = session.relevant_peaks.copy()  # O(n)
+visualizer.plot_relevant_peaks(Original_Data, RI, unetching, etching, colors, relevant_peak_data=features_Data)  # O(n)
 print(features_Data.head())  # O(1)
 
-features_Data.to_csv('Results/tables/features_detected.csv', index=False)  # O(n)
-features_Data.to_csv('Data/processed/features_detected.csv', index=False)
+# The features are stored once in binary form; the CSV is only exported for the report
+peak_store = PeakFeatureStore.fromFrame(features_Data)  # O(n)
+peak_store.save(Path(data_processed) / "features_detected.npz")  # O(n)
+peak_store.to_csv(Path(result_save) / "features_detected.csv")  # O(n)
 # Statical analysis
 print("Statical analysis relevant peaks")  # O(1)
 stats = StaticalAnalysis(features_Data, result_save="Results/tables")  # O(1)
-print(stats.summary_statistics())  # O(n)
+Summary_Data = cache.call(stats.summary_statistics)  # O(n)
+print(Summary_Data)  # O(1)
+# Written here too, the method does not run (nor write the file) on a cache hit
+Summary_Data.to_csv(Path(result_save) / 'summary_statistics.csv')  # O(n)
 
 # Statical analysis plot
 visualizer.plot_histograms(features_Data)  # O(n)
@@ -94,21 +122,55 @@ features_Data['MMF Diameter'] = features_Data['MMF Diameter'].astype(str)  # O(n
 visualizer.plot_KDE(features_Data)  # O(n)
 
 # Shapiro-Wilk
-shapiro_results = stats.shapiro_test()  # O(n)
+shapiro_results = cache.call(stats.shapiro_test)  # O(n)
 print("Shapiro-Wilk Test")  # O(1)
 print(shapiro_results)  # O(1)
 shapiro_results.to_csv('Results/tables/Shapiro_results.csv')  # O(n)
 
 # ANOVA
-ANOVA_Data = stats.ANOVA_Test()  # O(n)
+ANOVA_Data = cache.call(stats.ANOVA_Test)  # O(n)
 print("ANOVA Test")  # O(1)
 print(ANOVA_Data)  # O(1)
 ANOVA_Data.to_csv("Results/tables/anova_results.csv", index=False)  # O(n)
 
 # Wilcoxon
-Wilcoxon_Data = stats.Wilcoxon_test()  # O(n)
+Wilcoxon_Data = cache.call(stats.Wilcoxon_test)  # O(n)
 print("Wilcoxon Test")  # O(1)
 print(Wilcoxon_Data)  # O(1)
 Wilcoxon_Data.to_csv('Results/tables/Wilcoxon_results.csv')  # O(n)
 
+# All the tests for all the features in one grouped pass, with Holm correction, saved as one table
+Grouped_Data = cache.call(GroupedStatistics(features_Data, result_save="Results/tables").run)  # O(n log n)
+print("Grouped statistics")  # O(1)
+print(Grouped_Data)  # O(1)
+Grouped_Data.to_csv(Path(result_save) / 'grouped_statistics.csv', index=False)  # O(r)
+
+# Bootstrap confidence intervals and permutation test, which do not rely on the few peaks being normal
+Bootstrap_Data = cache.call(stats.bootstrap_CI, seed=0)  # O(B·n)
+print("Bootstrap confidence intervals")  # O(1)
+print(Bootstrap_Data)  # O(1)
+Bootstrap_Data.to_csv(Path(result_save) / 'bootstrap_CI.csv', index=False)  # O(k)
+Permutation_Data = cache.call(stats.permutation_test, seed=0)  # O(B·n)
+print("Permutation test")  # O(1)
+print(Permutation_Data)  # O(1)
+Permutation_Data.to_csv(Path(result_save) / 'permutation_results.csv', index=False)  # O(k)
+Sensitivity_CI = Resampling(seed=0).bootstrap(pd.DataFrame(result_Sensitivity), ['sensitivity 125', 'sensitivity 25'])  # O(B·m)
+print("Bootstrap confidence interval of the mean sensitivity")  # O(1)
+print(Sensitivity_CI)  # O(1)
+Sensitivity_CI.to_csv('Results/tables/sensitivity_CI.csv', index=False)  # O(1)
+
+# Wait for the figures
+print("Figure rendering time (s)")  # O(1)
+print(visualizer.close())  # O(k)
+
+# Cache usage
+print("Cache hits and misses")  # O(1)
+print(cache.report())  # O(1)
+print("Computations per stage:", session.computations)  # O(1)
+
+# Time, CPU and memory of every stage
+if PROFILER.enabled:  # O(1)
+    print(PROFILER.summary())  # O(k)
+    PROFILER.save(Path("Results") / "profile")  # O(k)
+
     # This code has a computational time complexity of O(n²)
@@ -0,0 +1,102 @@
+import importlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import sys
+
+"""
+Regression tests of the pipeline modules (run from Lab3_Natalia with `python -m pytest Test`). They use
+the raw sweep of Data/raw and temporary folders, so the files of Data/processed and Results are not touched.
+"""
+
+# Project root directory
+project_root = Path(__file__).resolve().parents[1]  # O(1)
+sys.path.append(str(project_root))  # O(1)
+
+from Source.preprocessing.preprocessing_Data import Preprocessing, ZScoreNormalizer
+from Source.pipeline.batchRunner import process_file
+from Source.pipeline.resultCache import ResultCache
+from Source.pipeline.parameterSweep import ParameterSweep
+
+RAW = project_root / "Data" / "raw" / "Data_1104.csv"
+
+
+def test_process_file_accepts_fitted_normalizer(tmp_path):
+    preprocessor = Preprocessing()
+    columns = preprocessor.unetching + preprocessor.etching
+    Data = preprocessor.wavelength_range_Data(preprocessor.read_data(RAW))
+    normalizer = ZScoreNormalizer(columns).fit(Data)
+    normalizer.stats.mean = normalizer.stats.mean + 1  # Statistics different from the ones of the file
+
+    result = process_file(RAW, tmp_path / 'instance', normalizer=normalizer)
+    assert result['Status'] == 'processed'
+    manifest = json.loads((tmp_path / 'instance' / 'manifest.json').read_text(encoding='utf-8'))
+    assert manifest['parameters']['normalization'] == normalizer.to_dict()
+
+    # The same statistics given as a .json file give the same processed data
+    process_file(RAW, tmp_path / 'file', normalizer=normalizer.save(tmp_path / 'normalization.json'))
+    from_instance = pd.read_csv(tmp_path / 'instance' / 'Data_processed.csv')
+    from_file = pd.read_csv(tmp_path / 'file' / 'Data_processed.csv')
+    pd.testing.assert_frame_equal(from_instance, from_file)
+    assert np.allclose(from_instance[columns].mean().to_numpy(), -1 / normalizer.std)
+
+
+def test_load_Data_1104_detects_raw_file_rewritten_in_place(tmp_path):
+    raw = tmp_path / 'Data_1104.csv'
+    raw.write_bytes(RAW.read_bytes())
+    preprocessor = Preprocessing()
+    before = preprocessor.load_Data_1104(raw, tmp_path / 'cache').copy()
+    assert [path.name for path in tmp_path.glob('*.csv')] == ['Data_1104.csv']  # Only the binary cache is written
+
+    # Same size and modification time, different content
+    stat = raw.stat()
+    raw.write_text(raw.read_text(encoding='utf-8').replace('-7.83443632,', '-7.83443633,'), encoding='utf-8')
+    os.utime(raw, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert raw.stat().st_size == stat.st_size
+    after = preprocessor.load_Data_1104(raw, tmp_path / 'cache').copy()
+    assert not after.equals(before)
+    pd.testing.assert_frame_equal(after, Preprocessing().process_Data_1104(raw))
+
+
+def test_result_cache_misses_when_a_callee_changes(tmp_path, monkeypatch):
+    # A stage that only calls a function of another module of its package
+    package = tmp_path / 'cachepackage'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / 'helper.py').write_text('def compute(x):\n    return x + 1\n')
+    (package / 'stage.py').write_text('from cachepackage.helper import compute\n\n'
+                                      'class Stage:\n    def run(self, x):\n        return compute(x)\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    from cachepackage import stage
+
+    cache = ResultCache(tmp_path / 'cache')
+    assert cache.call(stage.Stage().run, 1) == 2
+    assert cache.call(stage.Stage().run, 1) == 2
+    assert cache.stats['Stage.run'] == [1, 1]
+
+    # The callee changes; a new run (new ResultCache) must not return the stored result
+    (package / 'helper.py').write_text('def compute(x):\n    return x + 2\n')
+    importlib.reload(importlib.import_module('cachepackage.helper'))
+    stage = importlib.reload(stage)
+    cache = ResultCache(tmp_path / 'cache')
+    assert cache.call(stage.Stage().run, 1) == 3
+    assert cache.stats['Stage.run'] == [0, 1]
+    for name in ['cachepackage', 'cachepackage.helper', 'cachepackage.stage']:
+        sys.modules.pop(name, None)
+
+
+def test_parameter_sweep_detects_peaks_once_per_detection_point():
+    grid = {'distance': [30, 50], 'interval': [(1.16, 1.23), (1.15, 1.25)]}
+    serial = ParameterSweep(RAW, grid)
+    parallel = ParameterSweep(RAW, grid, workers=2)
+    serial_rows, parallel_rows = serial.run(), parallel.run()
+    for sweep in (serial, parallel):
+        # One detection per distance, whatever the interval and the worker that gets the points
+        assert sweep.computations['preprocessing'] == 1
+        assert sweep.computations['detection'] == 2
+        assert sweep.computations['features'] == 2
+    assert serial.computations['landslide'] == 2
+    columns = [col for col in serial_rows.columns if col not in ('Seconds', 'Computed')]
+    pd.testing.assert_frame_equal(serial_rows[columns], parallel_rows[columns])